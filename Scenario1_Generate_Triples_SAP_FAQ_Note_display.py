@@ -2,33 +2,40 @@
 #convert to triples and display all the generated RDF triples
 #please make sure you install the following packages
 # !pip install langchain_openai pypdf hdbcli langchain_experimental pdfplumber rdflib
-# Importing the Python regex module for pattern matching in text
-import re
 # Importing Document class from langchain_core for structured document representation
 from langchain_core.documents import Document
 # Importing Graph Transformer from langchain_experimental to convert text to knowledge graphs
 from langchain_experimental.graph_transformers import LLMGraphTransformer
-# Importing Text Splitter for breaking down text into manageable chunks
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 # ThreadPoolExecutor for parallel processing of text chunks
 from concurrent.futures import ThreadPoolExecutor
 # 'concurrent.futures' provides high-level interface for asynchronous execution to improve performance
 import concurrent.futures
-# Importing PyPDFLoader to extract text from PDF documents
-from langchain_community.document_loaders import PyPDFLoader
-# Importing AzureChatOpenAI to use Azure's OpenAI services for LLM processing
-from langchain_openai import AzureChatOpenAI
+# Importing the lazy PDF loader that yields one page at a time
+from pdf_corpus import load_pdf_lazily
+# Importing the near-duplicate chunk filter applied before LLM extraction
+from chunk_dedup import ChunkDeduplicator, print_dedup_report
+# Importing token-budget packing that combines several chunks into one LLM request
+from chunk_packing import ChunkPacker, PackedGraphTransformer, print_packing_report
+# Importing the process-wide LLM client factory that reuses clients and their connections
+from llm_clients import client_factory, print_client_stats
 # Importing TokenTextSplitter to divide text based on token count rather than characters
 from langchain_text_splitters import TokenTextSplitter
-# rdflib provides tools for RDF graph creation, manipulation and serialization
-from rdflib import Graph, URIRef, Namespace, Literal
-from rdflib.namespace import RDF
-# OS module for file system operations and environment variable access
-import os
+# rdflib's Namespace builds the IRIs of the extracted entities
+from rdflib import Namespace
 # Importing database API from SAP HANA client for database connections
 from hdbcli import dbapi
+# Importing the persistent extraction cache so unchanged chunks are not sent to the LLM again
+from extraction_cache import CachedGraphTransformer, ExtractionCache, print_cache_stats
+# Importing the asyncio extraction engine with rate limits and adaptive concurrency
+from async_extraction import AsyncExtractionEngine, print_extraction_report
+# Importing the dictionary-encoded triple buffer that stores each URI and literal only once
+from triple_store import CompactTripleBuffer
+# Importing the memoized URI factory that escapes every IRI-illegal character
+from uri_factory import UriFactory
+# Importing the knowledge graph namespace shared with the ingestion and retrieval scenarios
+from kg_namespace import KG_NAMESPACE
 # Define a namespace URI for our RDF graph entities to ensure uniqueness
-EX = Namespace("http://new_test_mission_faqhanahotspots.org/")
+EX = Namespace(KG_NAMESPACE)
 
 # Establish connection to SAP HANA Cloud database for storing triples
 # The triplestore must be enabled on the target database beforehand
@@ -47,7 +54,10 @@ AZURE_OPENAI_CHAT_DEPLOYMENT_NAME = "<Provide your deployment Name for gpt4o>"
 
 # Initialize the Azure OpenAI client with gpt-4o model
 # Configuration includes timeout handling and retry policies for robustness
-client = AzureChatOpenAI(
+# The client comes from the process-wide factory, so it is built once and keeps up to 10 connections
+# alive for the 10 parallel extraction requests instead of opening a new connection per call
+client = client_factory.azure_chat_openai(
+    max_connections=10,  # Matches the parallel LLM extraction requests
     azure_deployment="gpt-4o",
     azure_endpoint= AZURE_OPENAI_ENDPOINT,
     api_key= AZURE_OPENAI_API_KEY,
@@ -58,8 +68,15 @@ client = AzureChatOpenAI(
     max_retries=2    # Retry failed requests up to 2 times
 )
 
-# Create an empty RDF graph to store our knowledge triples
-g = Graph()
+# Set to True to extract with the asyncio engine instead of the fixed thread pool
+# The engine respects the deployment's request and token quotas and adapts concurrency to throttling (429s)
+USE_ASYNC_EXTRACTION = False
+AZURE_OPENAI_REQUESTS_PER_MINUTE = 600      # Requests per minute quota of the deployment
+AZURE_OPENAI_TOKENS_PER_MINUTE = 100000     # Tokens per minute quota of the deployment
+
+# Create an empty triple buffer to store our knowledge triples
+# Terms are interned and triples kept as integer ids, which needs far less memory than an rdflib Graph
+g = CompactTripleBuffer()
 
 # Initialize the LLM Graph Transformer that will convert text to structured graph data
 # This uses the Azure OpenAI model for text understanding and extraction
@@ -67,29 +84,34 @@ llm_transformer = LLMGraphTransformer(
     llm=client,
 )
 
-# Function to load PDF documents from specified path
+# Wrap the transformer with a persistent extraction cache so re-running an unchanged note makes no LLM calls
+# Entries are keyed by the chunk text hash, the deployment name and the transformer settings
+extraction_cache = ExtractionCache(".kge_cache/extractions.sqlite")
+llm_transformer = CachedGraphTransformer(llm_transformer, extraction_cache, model_id="gpt-4o")
+
+# Results of packed requests are mapped back to their source chunks, so chunk metadata is preserved
+llm_transformer = PackedGraphTransformer(llm_transformer)
+
+# Text extraction mode for PDF pages: "pypdf" (fast), "pdfplumber" (layout-heavy pages) or "auto"
+PDF_LAYOUT = "pypdf"
+
+# Filter for repeated headers, footers, disclaimers and near-identical tables across pages
+# Chunks with an estimated Jaccard similarity of at least 0.9 to an earlier chunk are not sent to the LLM
+chunk_deduplicator = ChunkDeduplicator(threshold=0.9)
+
+# Pack consecutive chunks of the same PDF into one LLM request of up to 1500 tokens,
+# so the transformer's system prompt is sent once per request instead of once per chunk
+chunk_packer = ChunkPacker(token_budget=1500)
+
+# Function to load PDF documents lazily from specified path
 def load_documents():
-    # Initialize empty list to store all loaded document objects
-    documents = []
     # Path to the PDF file containing SAP HANA Hotspots information
     #Example path : file_path = "//content//pdf//2927209_E_20250327.pdf"
     file_path = "<Provide your path to SAP HANA HOtspots Note>"
 
-    try:
-        # Create a PDF loader for the specified file
-        loader = PyPDFLoader(file_path)
-        # Extract text and metadata from the PDF
-        loaded_docs = loader.load()
-        # If documents were successfully loaded, add them to our collection
-        if loaded_docs:
-            documents.extend(loaded_docs)
-            print(loaded_docs)
-    except Exception as e:
-        # Log any errors that occur during document loading for debugging
-        print(f"Error loading documents: {e}")
-
-    # Return all loaded documents for further processing
-    return documents
+    # Pages are parsed one at a time as the chunker asks for them, instead of building
+    # every page Document up front; loading errors are logged by the loader
+    return load_pdf_lazily(file_path, layout=PDF_LAYOUT)
 
 # Function to clean and normalize text by removing problematic characters
 def clean_text(text):
@@ -101,16 +123,14 @@ def clean_text(text):
     # Return the sanitized text
     return text
 
-# Function to split documents into smaller, manageable chunks for processing
-def create_chunks(documents, chunk_size=500, chunk_overlap=50):
+# Function to split documents into chunks one page at a time, so pages can stream in from a loader
+def iter_chunks(documents, chunk_size=500, chunk_overlap=50):
     # Create a splitter that works based on token count (better for LLM processing)
     text_splitter = TokenTextSplitter(
         chunk_size=chunk_size,       # Maximum tokens per chunk
         chunk_overlap=chunk_overlap  # Overlap between chunks to maintain context
     )
 
-    # List to store all generated chunks
-    chunks = []
     # Process each document
     for doc in documents:
         # Clean the text before splitting to avoid issues
@@ -119,107 +139,115 @@ def create_chunks(documents, chunk_size=500, chunk_overlap=50):
         doc_chunks = text_splitter.split_text(cleaned_text)
         # Create Document objects for each chunk, preserving original metadata
         for chunk in doc_chunks:
-            chunks.append(Document(page_content=chunk, metadata=doc.metadata))
+            yield Document(page_content=chunk, metadata=doc.metadata)
+
+# Function to split documents into smaller, manageable chunks for processing
+def create_chunks(documents, chunk_size=500, chunk_overlap=50):
     # Return the list of chunk documents
-    return chunks
+    return list(iter_chunks(documents, chunk_size, chunk_overlap))
 
 # Main function to process documents into graph format using parallel execution
 def process_documents(llm_transformer):
-    # Load all documents from the source
-    documents = load_documents()
-
-    # Check if any documents were loaded
-    if not documents:
-        print("No documents loaded.")
-        return []
-
-    # Split documents into manageable chunks
-    chunks = create_chunks(documents)
-    print(f"Documents split into {len(chunks)} chunks.")
+    # Pages stream into the chunker one at a time, so the first chunk reaches the LLM before the
+    # whole file is parsed. Exact and near-duplicate chunks are skipped; the metadata of skipped
+    # chunks is kept in the deduplicator
+    chunks = chunk_deduplicator.filter(iter_chunks(load_documents()))
+    # Combine short chunks into requests that fill the token budget
+    chunks = chunk_packer.pack(chunks)
+
+    # Asyncio mode: token-bucket rate limits, AIMD concurrency and a timeout per request
+    if USE_ASYNC_EXTRACTION:
+        engine = AsyncExtractionEngine(
+            llm_transformer,
+            requests_per_minute=AZURE_OPENAI_REQUESTS_PER_MINUTE,
+            tokens_per_minute=AZURE_OPENAI_TOKENS_PER_MINUTE,
+            initial_concurrency=4,  # Start small and grow while requests succeed
+            max_concurrency=64,     # Upper bound for concurrent requests
+            request_timeout=120     # Seconds before a single request is abandoned and retried
+        )
+        # The engine schedules a known list of packed requests, which are far fewer than the chunks
+        graph_document_list, report = engine.extract(list(chunks))
+        if not print_chunking_reports():
+            return []
+        print_extraction_report(report)
+        return graph_document_list
 
     # List to store processed graph documents
     graph_document_list = []
+    # Number of extraction results collected so far
+    completed = 0
 
-    # Use thread pool for parallel processing to improve performance
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        futures = []
-
-        # Submit each chunk for processing asynchronously
-        for i, chunk in enumerate(chunks):
-            futures.append(executor.submit(llm_transformer.convert_to_graph_documents, [chunk]))
-
-        # Collect results as they complete (not necessarily in order)
-        for i, future in enumerate(concurrent.futures.as_completed(futures)):
+    # Collect finished extractions (not necessarily in order)
+    def collect(futures):
+        nonlocal completed
+        for future in futures:
             try:
-                # Get the processed graph document
-                graph_document = future.result()
-                # Add to our collection of graph documents
-                graph_document_list.extend(graph_document)
-                print(f"Chunk {i} processed into graph document.")
+                # Get the processed graph document and add it to our collection
+                graph_document_list.extend(future.result())
+                print(f"Chunk {completed} processed into graph document.")
             except Exception as e:
                 # Log errors for specific chunks without failing the entire process
-                print(f"Error processing chunk {i}: {e}")
+                print(f"Error processing chunk {completed}: {e}")
+            completed += 1
 
+    # Use thread pool for parallel processing to improve performance
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        pending = set()
+        # Submit each request as soon as the chunker produces it
+        for chunk in chunks:
+            pending.add(executor.submit(llm_transformer.convert_to_graph_documents, [chunk]))
+            # Keep at most 20 requests in flight, so pages are only parsed as fast as the LLM answers
+            if len(pending) >= 20:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                collect(done)
+        collect(concurrent.futures.as_completed(pending))
+
+    if not print_chunking_reports():
+        return []
     # Return all successfully processed graph documents
     return graph_document_list
 
+# Function to print the chunking summaries once the chunk stream is consumed
+def print_chunking_reports():
+    # Check if any documents were loaded
+    if not chunk_deduplicator.report["chunks"]:
+        print("No documents loaded.")
+        return False
+    print(f"Documents split into {chunk_deduplicator.report['chunks']} chunks.")
+    print_dedup_report(chunk_deduplicator.report)
+    print_packing_report(chunk_packer.report)
+    return True
+
+# URI factory that creates safe URIs by escaping problematic characters
+# This ensures valid RDF identifiers for all entities; repeated ids are answered from a memo cache
+uri_factory = UriFactory(EX)
+
 # Function to create safe URIs by replacing problematic characters
-# This ensures valid RDF identifiers for all entities
 def safe_uri(string):
-    # Replace spaces and slashes with underscores to create valid URI components
-    return URIRef(EX[string.replace(" ", "_").replace("/", "_")])
+    # Spaces and slashes become underscores, every other IRI-illegal character is percent-encoded
+    return uri_factory(string)
 
 # Process documents to extract structured graph information
 graph_documents = process_documents(llm_transformer)
 
-# Convert all extracted knowledge into RDF triples
-for document in graph_documents:
-    # Process each node (entity) in the document
-    for node in document.nodes:
-        # Create URIs for the node entity and its type
-        node_uri = safe_uri(node.id)
-        node_type_uri = safe_uri(node.type)
-
-        # Add a triple indicating the node's type
-        g.add((node_uri, RDF.type, node_type_uri))
-
-        # Add all properties of the node as separate triples
-        for key, value in node.properties.items():
-            g.add((node_uri, safe_uri(key), Literal(value)))
-
-    # Process each relationship between entities
-    for relationship in document.relationships:
-        # Create URIs for the source entity, target entity, and relationship type
-        source_uri = safe_uri(relationship.source.id)
-        target_uri = safe_uri(relationship.target.id)
-        relationship_type_uri = safe_uri(relationship.type)
-
-        # Add a triple representing the relationship
-        g.add((source_uri, relationship_type_uri, target_uri))
-
-# Create a list of all generated RDF triples for storage and querying
-rdf_triples = []
-# Extract all triples from the RDF graph
-for s, p, o in g:
-    # Convert RDF terms to strings and store as a tuple
-    rdf_triples.append((str(s), str(p), str(o)))
-
-# Print all generated RDF triples for verification
-print(rdf_triples)
-"""
-# Create a list to store formatted triples for SPARQL insertion
-triples = []
+# Convert all extracted knowledge into RDF triples in one pass
+# Nodes become type and property triples, relationships become entity-to-entity triples
+for triple in uri_factory.convert(graph_documents):
+    g.add(triple)
 
+# Print all generated RDF triples for verification, straight from the buffer without an extra copy
+print(list(g.iter_strings()))
+
+# Print how many chunks were answered from the extraction cache
+print_cache_stats(extraction_cache)
+print_client_stats()
+"""
 # Prepare to execute database operations with SAP HANA
 cursor = conn.cursor()
 try:
-    # Format each triple for SPARQL insertion
-    for s, p, o in rdf_triples:
-        # Format as N-Triples syntax with angle brackets around URIs
-        triples.append(f"<{str(s)}> <{str(p)}> <{str(o)}>")
-
-    # Join all formatted triples into a single SPARQL insert statement
-    triples_str = " .\n    ".join(triples) + " ."
+    # Serialize the triples straight from the buffer in N-Triples syntax
+    # (URIs in angle brackets, literals quoted and escaped) into a single SPARQL insert statement
+    triples_str = "\n    ".join(g.iter_ntriples())
 
     # Create the complete SPARQL INSERT DATA query
     sparql_insert_query = f"INSERT DATA {{ \n    {triples_str} \n}}"
@@ -232,7 +260,7 @@ try:
     query_response = resp[2]     # OUT: Query execution response
 
     # Print details of the insertion operation
-    print("Inserted Triple:", (s, p, o))
+    print("Inserted Triples:", len(g))
     print("Response Metadata:", metadata_headers)
     print("Query Response:", query_response)
 
@@ -3,46 +3,73 @@
 #%pip install rdflib langchain_core langchain_experimental langchain_community langchain_text_splitters 
 #%pip install  langchain_openai pypdf hdbcli langchain-aws boto3
 
-# Importing the Python regex module for regular expression operations
-import re
-
 # Importing Document class from langchain_core for handling document objects
 from langchain_core.documents import Document
 
 # Importing Graph Transformer for converting text to graph structures
 from langchain_experimental.graph_transformers import LLMGraphTransformer
 
-# Importing Text Splitter for processing and chunking text documents
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-
-# Importing ThreadPoolExecutor for parallel processing of document chunks
-from concurrent.futures import ThreadPoolExecutor
-import concurrent.futures
-
-# Importing PDF loader for processing PDF documents
-from langchain_community.document_loaders import PyPDFLoader
-
 # Importing TokenTextSplitter for splitting text by tokens rather than characters
 from langchain_text_splitters import TokenTextSplitter
 
-# Importing RDFlib components for working with RDF graphs
-from rdflib import Graph, URIRef, Namespace, Literal
-from rdflib.namespace import RDF  # RDF namespace for basic RDF properties
-
-# Importing operating system module for file path operations
-import os
+# Importing RDFlib's Namespace for building the IRIs of the extracted entities
+from rdflib import Namespace
 
 # Importing SAP HANA Database API for connecting to HANA Cloud
 from hdbcli import dbapi
 
+# Importing the shared HANA connection pool with liveness checks and reconnects
+from hana_pool import HanaConnectionPool, print_pool_stats
+
+# Importing the graph version stamps that invalidate cached SPARQL results after ingestion
+from sparql_cache import GraphVersions
+
+# Importing the namespace and named graph shared with the retrieval scenarios
+import kg_namespace
+
+# Importing the entity index used by the retrieval scenarios to resolve questions to IRIs
+from entity_index import EntityIndex
+from functools import partial
+
+# Importing the bulk loader for segmented, parallel N-Triples ingestion
+from hana_sparql_writer import NTriplesBulkLoader, print_report
+
+# Importing the streaming pipeline that overlaps extraction, conversion and insertion
+from kge_pipeline import StreamingIngestionPipeline, print_pipeline_report
+
+# Importing the persistent extraction cache so unchanged chunks are not sent to the LLM again
+from extraction_cache import CachedGraphTransformer, ExtractionCache, print_cache_stats
+
+# Importing corpus loading that parses many PDFs in a process pool
+from pdf_corpus import load_corpus, load_pdf_lazily, start_pdf_workers
+
+# Importing the near-duplicate chunk filter that runs before LLM extraction
+from chunk_dedup import ChunkDeduplicator, print_dedup_report
+
+# Importing token-budget packing that combines several chunks into one LLM request
+from chunk_packing import ChunkPacker, PackedGraphTransformer, print_packing_report
+
+# Importing the memoized URI factory that escapes every IRI-illegal character
+from uri_factory import UriFactory
+
+# Importing delta ingestion that only sends triples not yet loaded into the graph
+from delta_ingest import DeltaIngestor, TripleManifest, print_delta_report
+
+# Importing page-level change detection with chunk-to-triple provenance
+from note_revisions import RevisionTracker, print_revision_report
+
+# Importing the durable job journal that lets an interrupted run resume where it stopped
+from job_journal import JobJournal, print_journal_stats
+
 # Importing AWS Bedrock dependencies for LLM integration
 from langchain_aws import ChatBedrock
-import boto3
+
+# Importing the process-wide LLM client factory that reuses clients and their connections
+from llm_clients import client_factory, print_client_stats
 
 # Importing base classes for creating custom language model configuration
 from langchain_core.language_models.base import BaseLanguageModel
 from pydantic import BaseModel, Field
-import boto3
 
 # Custom configuration class for AWS Bedrock LLM
 class CustomBedrockLLMConfig(BaseModel):
@@ -60,16 +87,14 @@ class CustomBedrockLLM(BaseLanguageModel):
         self.config = CustomBedrockLLMConfig(**kwargs)  # Initialize config
 
     def _call(self, query):
-        # Create a session with the provided AWS credentials
-        session = boto3.Session(
+        # Reuse the Bedrock client built for these credentials instead of a new session per call
+        bedrock_client = client_factory.bedrock(
+            'bedrock',
             aws_access_key_id=self.config.aws_access_key_id,
             aws_secret_access_key=self.config.aws_secret_access_key,
             region_name=self.config.aws_region_name
         )
 
-        # Create a Bedrock client using the established session
-        bedrock_client = session.client('bedrock')
-
         # Invoke the Bedrock model with the provided query
         response = bedrock_client.invoke_model(
             ModelId=self.config.model_id,
@@ -105,16 +130,27 @@ class CustomBedrockLLM(BaseLanguageModel):
 
 # Define a namespace for our RDF graph with a unique URI
 # This will be used as the base URI for all nodes in the knowledge graph
-EX = Namespace("http://finalboto_check_test_mission_faqhanahotspots.org/")
+# The namespace and named graph are shared with the retrieval scenarios, which resolve and query them
+EX = Namespace(kg_namespace.KG_NAMESPACE)
 
-# Establish connection to SAP HANA Cloud database
-conn = dbapi.connect(
+# Directory or glob pattern of SAP notes to ingest as one corpus (None = single PDF below)
+CORPUS_PATH = None  # Example: "//content//pdf//*.pdf"
+
+# Corpus mode parses PDFs in worker processes, forked before any thread, connection or cache file exists
+# (Linux and Colab only; on macOS and Windows corpus mode stops with an error)
+pdf_workers = start_pdf_workers() if CORPUS_PATH else None
+
+# SAP HANA Cloud connection settings, reused for every connection the script opens
+HANA_CONNECTION = dict(
     user = "<You HANA Cloud User Name>", 
     password = "<Your HANA Cloud Password>",
     address = '<Your HANA Cloud host>',
     port = 443,
 )
 
+# Pool of connections to SAP HANA Cloud database, shared by the loader workers
+hana_pool = HanaConnectionPool(lambda: dbapi.connect(**HANA_CONNECTION), min_size=1, max_size=4)
+
 # AWS Bedrock Configuration - credentials for accessing AWS services
 
 AWS_ACCESS_KEY_ID = "XXXXXXXXXXXX" # AWS IAM access key (truncated for security)
@@ -122,11 +158,13 @@ AWS_SECRET_ACCESS_KEY = "XXXXXXXXXXXX"# AWS IAM secret key (truncated for securi
 AWS_DEFAULT_REGION = "us-east-1"# AWS region where Bedrock is available
 
 # Initialize Bedrock runtime client for invoking models
-bedrock_client = boto3.client(
+# Built once by the shared factory, with a connection pool sized for the parallel extraction requests
+bedrock_client = client_factory.bedrock(
     service_name='bedrock-runtime',  # Bedrock runtime service
     aws_access_key_id=AWS_ACCESS_KEY_ID,  # AWS credentials
     aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-    region_name=AWS_DEFAULT_REGION
+    region_name=AWS_DEFAULT_REGION,
+    max_pool_connections=10  # Matches the parallel LLM extraction requests
 )
 
 # Initialize Claude LLM through LangChain's ChatBedrock interface
@@ -139,32 +177,68 @@ claude_llm = ChatBedrock(
     }
 )
 
-# Instantiate an empty RDF Graph to store our knowledge graph
-g = Graph()
-
 # Create LLM Graph Transformer instance that will convert text to graph structures
 llm_transformer = LLMGraphTransformer(
     llm=claude_llm,  # Using Claude LLM for graph generation
 )
 
-# Function to load PDF documents from specified path
+# Cache extraction results on disk, keyed by chunk text hash, model id and transformer settings
+extraction_cache = ExtractionCache(".kge_cache/extractions.sqlite")  # Size-bounded LRU cache file
+llm_transformer = CachedGraphTransformer(
+    llm_transformer,
+    extraction_cache,
+    model_id="anthropic.claude-3-sonnet-20240229-v1:0"  # Part of the cache key
+)
+
+# Unpack results of packed requests so every node keeps the metadata of the chunk it came from
+llm_transformer = PackedGraphTransformer(llm_transformer)
+
+# PDF text extraction mode: "pypdf" (fast), "pdfplumber" (layout-heavy pages) or "auto"
+PDF_LAYOUT = "pypdf"
+
+# Named graph the triples are bulk-loaded into (None = internal default graph)
+KG_GRAPH_NAME = kg_namespace.KG_GRAPH_NAME
+
+# Delta ingestion: a local manifest remembers which triples are already in the graph, so re-running
+# an updated note only sends the new triples. DELTA_DELETE_MISSING also deletes triples that were not
+# produced again (only use it when every note of the graph is re-ingested in the same run).
+# Set DELTA_REBUILD_MANIFEST once to rebuild the manifest from the graph on the server
+DELTA_INGESTION = True
+DELTA_DELETE_MISSING = False
+DELTA_REBUILD_MANIFEST = False
+
+# Page revisions: pages of a new revision of a note that are unchanged since the last run are not
+# extracted again, and triples that came only from removed or changed pages are retracted.
+# DELTA_DELETE_MISSING is ignored while page revisions are on, since unchanged pages produce no triples
+PAGE_REVISIONS = True
+revision_tracker = RevisionTracker(".kge_cache/provenance.sqlite")
+
+# Job journal: records which chunks were extracted and committed and which batches were written.
+# If a run is interrupted or has failures, the next run of the same job skips the committed chunks
+# and only processes the failed and unfinished ones. Deleting missing triples turns the journal off,
+# since the triples of skipped chunks would not be produced again and would be deleted as stale.
+# Page revisions turn it off too: a skipped chunk records no provenance, so the next revision could not retract
+# its triples. Unchanged pages are skipped by the revision tracker and re-extracted chunks hit the extraction cache
+job_journal = None
+if not PAGE_REVISIONS and not (DELTA_INGESTION and DELTA_DELETE_MISSING):
+    job_journal = JobJournal(f"scenario3:{KG_GRAPH_NAME}:{CORPUS_PATH or 'single-note'}", ".kge_cache/journal.sqlite")
+
+# Drops repeated headers, footers, disclaimers and near-identical tables before they reach the LLM
+chunk_deduplicator = ChunkDeduplicator(threshold=0.9)  # Minimum estimated Jaccard similarity
+
+# Fills each LLM request with consecutive chunks up to a token budget, so the system prompt is sent less often
+chunk_packer = ChunkPacker(token_budget=1500)  # Maximum chunk tokens per request
+
+# Words of every ingested subject and object IRI; Scenarios 4 and 5 resolve questions against it
+# instead of scanning the graph with REGEX. Filled from written batches and pruned when triples are retracted.
+# Set ENTITY_INDEX_REBUILD once to rebuild it from the server
+entity_index = EntityIndex(".kge_cache/entity_index.sqlite")
+ENTITY_INDEX_REBUILD = False
+
+# Function to load PDF documents lazily, one page at a time
 def load_documents():
-    documents = []  # List to hold loaded documents
     file_path = "//content//pdf//2927209_E_20250327.pdf"  # Path to PDF file
-
-    try:
-        # Create PDF loader instance for the specified file
-        loader = PyPDFLoader(file_path)
-        # Load and parse the PDF document
-        loaded_docs = loader.load()
-        if loaded_docs:
-            # Add loaded documents to our collection
-            documents.extend(loaded_docs)
-            print(loaded_docs)  # Debug print of loaded documents
-    except Exception as e:
-        print(f"Error loading documents: {e}")  # Error handling
-
-    return documents  # Return list of loaded documents
+    return load_pdf_lazily(file_path, layout=PDF_LAYOUT)  # Generator of page documents
 
 # Function to clean text by removing unwanted characters
 def clean_text(text):
@@ -173,15 +247,14 @@ def clean_text(text):
         text = text.replace(char, '')  # Remove each bad character
     return text  # Return cleaned text
 
-# Function to split documents into manageable chunks
-def create_chunks(documents, chunk_size=500, chunk_overlap=50):
+# Generator that splits documents into chunks page by page, so pages can stream in from a loader
+def iter_chunks(documents, chunk_size=500, chunk_overlap=50):
     # Create token-based text splitter with specified chunk size and overlap
     text_splitter = TokenTextSplitter(
         chunk_size=chunk_size,  # Maximum tokens per chunk
         chunk_overlap=chunk_overlap  # Tokens overlapping between chunks
     )
 
-    chunks = []  # List to hold document chunks
     for doc in documents:
         # Clean the document text before chunking
         cleaned_text = clean_text(doc.page_content)
@@ -189,115 +262,117 @@ def create_chunks(documents, chunk_size=500, chunk_overlap=50):
         doc_chunks = text_splitter.split_text(cleaned_text)
         # Create Document objects for each chunk with original metadata
         for chunk in doc_chunks:
-            chunks.append(Document(page_content=chunk, metadata=doc.metadata))
-    return chunks  # Return list of document chunks
-
-# Main function for processing documents into knowledge graph
-def process_documents(llm_transformer):
-    # Load documents from PDF file
-    documents = load_documents()
+            yield Document(page_content=chunk, metadata=doc.metadata)
 
-    if not documents:
-        print("No documents loaded.")  # Early return if no documents
-        return []
-
-    # Split documents into chunks for processing
-    chunks = create_chunks(documents)
-    print(f"Documents split into {len(chunks)} chunks.")
-
-    graph_document_list = []  # List to hold processed graph documents
-
-    # Use ThreadPoolExecutor for parallel processing of chunks
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        futures = []  # List to hold future objects
-
-        # Submit each chunk for parallel processing
-        for i, chunk in enumerate(chunks):
-            futures.append(executor.submit(llm_transformer.convert_to_graph_documents, [chunk]))
-
-        # Process completed futures as they finish
-        for i, future in enumerate(concurrent.futures.as_completed(futures)):
-            try:
-                # Get the result of the processing
-                graph_document = future.result()
-                # Add to our collection of graph documents
-                graph_document_list.extend(graph_document)
-                print(f"Chunk {i} processed into graph document.")
-            except Exception as e:
-                print(f"Error processing chunk {i}: {e}")
+# Function to split documents into manageable chunks
+def create_chunks(documents, chunk_size=500, chunk_overlap=50):
+    return list(iter_chunks(documents, chunk_size, chunk_overlap))  # Return list of document chunks
 
-    return graph_document_list  # Return list of processed graph documents
+# Memoized URI factory; escapes every IRI-illegal character, not only spaces and slashes
+uri_factory = UriFactory(EX)
 
 # Helper function to create safe URIs from strings
 def safe_uri(string):
-    # Replace spaces and slashes with underscores for URI safety
-    return URIRef(EX[string.replace(" ", "_").replace("/", "_")])
-
-# Process the documents and convert them into graph documents
-graph_documents = process_documents(llm_transformer)
-
-# Process each graph document to extract nodes and relationships
-for document in graph_documents:
-    # Process each node in the document
-    for node in document.nodes:
-        # Create safe URIs for node and its type
-        node_uri = safe_uri(node.id)
-        node_type_uri = safe_uri(node.type)
-
-        # Add node type triple to the RDF graph
-        g.add((node_uri, RDF.type, node_type_uri))
-
-        # Add all properties of the node as triples
-        for key, value in node.properties.items():
-            g.add((node_uri, safe_uri(key), Literal(value)))
-
-    # Process each relationship in the document
-    for relationship in document.relationships:
-        # Create URIs for source, target and relationship type
-        source_uri = safe_uri(relationship.source.id)
-        target_uri = safe_uri(relationship.target.id)
-        relationship_type_uri = safe_uri(relationship.type)
-
-        # Add relationship triple to the RDF graph
-        g.add((source_uri, relationship_type_uri, target_uri))
-
-# Convert RDF graph to a list of triples (subject, predicate, object)
-rdf_triples = []
-for s, p, o in g:
-    rdf_triples.append((str(s), str(p), str(o)))
-
-print(rdf_triples)  # Print all generated triples for debugging
-
-triples = []  # List to hold formatted triples for SPARQL
-
-# Create database cursor for executing SPARQL queries
-cursor = conn.cursor()
-try:
-    # Format each triple for SPARQL INSERT statement
-    for s, p, o in rdf_triples:
-        triples.append(f"<{str(s)}> <{str(p)}> <{str(o)}>")
-
-    # Combine all triples into a single SPARQL INSERT DATA statement
-    triples_str = " .\n    ".join(triples) + " ."
-    sparql_insert_query = f"INSERT DATA {{ \n    {triples_str} \n}}"
-
-    # Execute the SPARQL query using HANA's stored procedure
-    resp = cursor.callproc('SPARQL_EXECUTE', (sparql_insert_query, 
-              "Accept: application/sparql-results+xml Content-Type: application/sparql-query", 
-              '?', None))
-
-    # Extract response metadata and query response
-    metadata_headers = resp[3]  # Response headers from SPARQL execution
-    query_response = resp[2]    # Actual query response
-
-    # Print success message with namespace information
-    print("\nTriples successfully generated in SAP HANA Cloud.")
-    print(f"Query the KGs with this namespace from SAP HANA Cloud DB Explorer: {EX}")
-
-    # Debugging information
-    print("Inserted Triple:", (s, p, o))
-    print("Response Metadata:", metadata_headers)
-    print("Query Response:", query_response)
-
-finally:
-    cursor.close()  # Ensure cursor is closed even if errors occur
\ No newline at end of file
+    return uri_factory(string)
+
+# Function to convert one graph document into RDF triples (node types, properties and relationships)
+def document_to_triples(document):
+    triples = uri_factory.convert([document])
+    if PAGE_REVISIONS:
+        return revision_tracker.record(document.source, triples)  # Chunk-to-triple provenance
+    return triples
+
+# Main function for processing documents into the knowledge graph in SAP HANA Cloud
+# Triples are inserted while LLM extraction of the remaining chunks is still running
+def process_documents(llm_transformer, bulk_writer):
+    if CORPUS_PATH:
+        # Parse the corpus in a process pool and stream its pages into the chunker
+        pages = load_corpus(CORPUS_PATH, layout=PDF_LAYOUT, workers=pdf_workers)
+    else:
+        pages = load_documents()  # Pages of the PDF file, parsed lazily
+
+    if PAGE_REVISIONS:
+        pages = revision_tracker.changed_pages(pages)  # Skip pages unchanged since the last run
+
+    # Chunks are produced page by page, so the first chunk reaches the LLM before the whole file is parsed
+    # Exact and near-duplicate chunks are skipped before extraction
+    chunks = chunk_deduplicator.filter(iter_chunks(pages))
+    # Several chunks are packed into each LLM request up to the token budget
+    chunks = chunk_packer.pack(chunks)
+
+    # Streaming pipeline with bounded queues so a slow database holds back extraction
+    pipeline = StreamingIngestionPipeline(
+        llm_transformer,
+        bulk_writer,
+        document_to_triples,
+        max_workers=10,  # Parallel LLM extraction requests
+        max_pending_chunks=20,  # Chunks in flight before waiting for results
+        queue_size=50,  # Converted documents waiting for the writer
+        journal=job_journal,  # Resume point for interrupted runs
+        on_batch=partial(entity_index.batch_done, KG_GRAPH_NAME or "default")  # Index written, prune deleted IRIs
+    )
+
+    pipeline_report = pipeline.run(chunks)
+
+    if PAGE_REVISIONS:
+        revision_tracker.mark_failed(pipeline.failed_chunks)  # Failed pages are extracted again next run
+        revision_tracker.mark_failed_batches(pipeline_report["write_report"]["failed_batches"])  # So are unwritten ones
+        revision_tracker.record_duplicates(chunk_deduplicator.duplicates)  # Duplicate chunks' pages share triples
+        print_revision_report(revision_tracker.finish(bulk_writer))  # Retract stale triples
+        if revision_tracker.report["pages"] and not pipeline_report["chunks"]:
+            print("No new or changed pages since the last run.")
+            return None
+
+    if not pipeline_report["chunks"]:
+        print("No documents loaded.")  # Nothing was loaded from the PDF
+        return None
+
+    return pipeline_report  # Return the run summary
+
+# Create bulk loader that streams the triples as N-Triples segments through the rqx-load protocol
+bulk_writer = NTriplesBulkLoader(
+    hana_pool.connect,  # Each worker borrows a pooled connection
+    segment_size=50000,  # Maximum triples per segment
+    max_bytes_per_segment=16 * 1024 * 1024,  # Maximum segment size
+    max_connections=4,  # Parallel HANA connections
+    max_retries=3,  # Retries for a failed segment before it is reported
+    graph_name=KG_GRAPH_NAME  # Named graph of every segment
+)
+bulk_writer.graph_versions = GraphVersions()  # Ingestion invalidates cached retrieval results
+
+if ENTITY_INDEX_REBUILD and KG_GRAPH_NAME:
+    # Replace the local entity index with one paged scan of the graph
+    print(f"Entity index rebuilt with {entity_index.rebuild(KG_GRAPH_NAME, hana_pool.connect)} entities.")
+
+# Send only triples missing from the local manifest (and optionally delete stale ones)
+if DELTA_INGESTION:
+    triple_manifest = TripleManifest()
+    if DELTA_REBUILD_MANIFEST:
+        print(f"Manifest rebuilt with {triple_manifest.rebuild(KG_GRAPH_NAME, bulk_writer.connect)} triples.")
+    bulk_writer = DeltaIngestor(bulk_writer, triple_manifest, KG_GRAPH_NAME,
+                                delete_missing=DELTA_DELETE_MISSING and not PAGE_REVISIONS)
+
+# Extract, convert and insert the triples; only failed batches are retried
+pipeline_report = process_documents(llm_transformer, bulk_writer)
+# Every PDF of the corpus has been parsed, so the worker processes can exit
+if pdf_workers is not None:
+    pdf_workers.close()
+    pdf_workers.join()
+
+if pipeline_report:
+    print_dedup_report(chunk_deduplicator.report)  # Chunks and tokens saved by deduplication
+    print_packing_report(chunk_packer.report)  # Requests saved by packing
+    print_pipeline_report(pipeline_report)  # Extraction and ingestion timings
+    print_report(pipeline_report["write_report"])  # Throughput and failed batch summary
+    if job_journal is not None:
+        print_journal_stats(job_journal)  # Committed, in-flight and failed chunks
+    if DELTA_INGESTION:
+        print_delta_report(bulk_writer.report)  # New, unchanged and deleted triples
+    print_cache_stats(extraction_cache)  # Cache hits avoided LLM calls
+    print_client_stats()  # Reused versus new LLM clients and connections
+    print_pool_stats(hana_pool)  # Borrows, waits and reconnects of the HANA connections
+
+    if not pipeline_report["write_report"]["failed_batches"]:
+        # Print success message with namespace information
+        print("\nTriples successfully generated in SAP HANA Cloud.")
+        print(f"Query the KGs with this namespace from SAP HANA Cloud DB Explorer: {EX}")
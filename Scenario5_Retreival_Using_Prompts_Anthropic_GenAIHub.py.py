@@ -5,13 +5,21 @@
 # Import necessary libraries and modules
 import os
 from langchain_core.language_models.base import BaseLanguageModel  # Base class for language models
-from pydantic import BaseModel, Field  # For data validation and settings management
 from langchain_core.prompts import PromptTemplate  # For creating prompt templates
 from typing_extensions import TypedDict, Annotated  # For type hints
 from hdbcli import dbapi  # SAP HANA database connector
-from gen_ai_hub.proxy.langchain.amazon import ChatBedrock
-from pydantic import BaseModel, ConfigDict, model_validator
-from gen_ai_hub.proxy.core.proxy_clients import get_proxy_client
+from hana_pool import HanaConnectionPool  # Shared pool of HANA connections with health checks
+from llm_clients import client_factory  # Process-wide cache of LLM clients and their connections
+from sparql_cache import SparqlResultCache  # Cache of SPARQL results, invalidated by ingestion
+from question_cache import QuestionCache, question_scope, print_question_cache_stats  # Question-to-SPARQL cache
+from answer_streaming import stream_answer  # Streams the answer text while it is generated
+from result_packing import ResultReducer, print_packing_result  # Ranks and packs results into a token budget
+from entity_index import EntityIndex, build_values_query  # Word-to-IRI index filled by ingestion
+from sparql_rewrite import SparqlRewriter, print_rewrite_report  # Cheaper forms of generated queries
+from sparql_validation import validate_sparql, repair_sparql, print_repair_result  # Local query checks
+from sparql_results import ResultFormatNegotiator  # JSON/TSV results with fallback to XML
+from kg_namespace import KG_NAMESPACE, KG_GRAPH_NAME  # Namespace and named graph written by Scenarios 2 and 3
+from functools import partial
 
 # Set up the AI core credentials
 os.environ['AICORE_AUTH_URL'] = "<Your AI Core Auth URL>" #TODO
@@ -53,21 +61,54 @@ class CustomBedrockLLM(BaseLanguageModel):
     def predict_messages(self, messages):
         return self._call(messages[0].content)
         
-proxy_client = get_proxy_client('gen-ai-hub') # Get the proxy client
+proxy_client = client_factory.genai_hub_proxy_client('gen-ai-hub') # Get the shared proxy client
 
-anthropic = ChatBedrock(
+# The model client is cached by configuration, so re-running this cell reuses it
+anthropic = client_factory.chat_bedrock(
     model_name="anthropic--claude-3.5-sonnet",
     proxy_client=proxy_client # Pass the proxy client to ChatBedrock
 )
 
-# Establish connection to SAP HANA database
-conn = dbapi.connect(
+# Connection settings for SAP HANA database
+HANA_CONNECTION = dict(
     user="<You HANA Cloud User Name>",  # Database username
     password="<Your HANA Cloud Password>",  # Database password
     address='<Your HANA Cloud host>',  # DB address
     port=443  # Connection port
 )
 
+# Pool of HANA connections, so concurrent questions do not share one session
+# Dropped sessions (e.g. after a TLS idle timeout) are detected and reopened by the pool
+hana_pool = HanaConnectionPool(lambda: dbapi.connect(**HANA_CONNECTION), min_size=1, max_size=4)
+
+# Results of recent SPARQL queries, keyed on the normalized query text and the graph version
+# Repeated questions are answered from memory; ingestion runs (Scenarios 2, 3 and 6) bump the version
+sparql_cache = SparqlResultCache(max_entries=1024, ttl=300.0)
+
+# Results are requested as JSON or TSV, which are smaller and faster to parse than XML
+# The first calls find out which format the server returns; servers without them keep answering in XML
+result_negotiator = ResultFormatNegotiator(preferred=("json", "tsv", "xml"))
+
+# Print the answer token by token as it is generated instead of waiting for the full response
+STREAM_ANSWERS = True
+
+# Only the most relevant result triples, up to this many tokens, are passed to the summarization prompt
+result_reducer = ResultReducer(token_budget=3000)
+
+# Resolve the entities of a question with the index built during ingestion (Scenarios 2 and 3) and fetch
+# their triples with a VALUES query, instead of letting the LLM write REGEX filters that scan every triple.
+# Questions whose words match no indexed entity fall back to the generated query
+USE_ENTITY_INDEX = True
+entity_index = EntityIndex(".kge_cache/entity_index.sqlite")
+# Share of the question's content words the resolved entities must cover. A question that only names a broad
+# entity such as SAP or HANA next to words no entity matches goes to the question cache and the LLM instead
+ENTITY_INDEX_MIN_COVERAGE = 0.6
+
+# Generated queries are rewritten before execution: literal REGEX filters become STRSTARTS/CONTAINS,
+# repeated FILTERs are dropped, subjects are limited to the namespace, queries without FROM or GRAPH read the
+# graph the ingestion scenarios load into and at most 1000 rows are returned
+sparql_rewriter = SparqlRewriter(namespace=KG_NAMESPACE, default_limit=1000, graph=KG_GRAPH_NAME)
+
 # Define template for SPARQL query generation
 #give example in template and try different LLMs
 template = '''Given an input question, your task is to create a syntactically correct SPARQL query to retrieve information from an RDF graph. The graph may contain variations in spacing, underscores, dashes, capitalization, reversed relationships, and word order. You must account for these variations using the `REGEX()` function in SPARQL. In the RDF graph, subjects are represented as "s", objects are represented as "o", and predicates are represented as "p". Account for underscores.
@@ -82,7 +123,7 @@ WHERE {{
     )
 }}
 
-Retrieve only triples beginning with "http://new_test_mission_faqhanahotspots.org/"
+Retrieve only triples beginning with "''' + KG_NAMESPACE + '''"
 Use the following format:
 Question: f{input}
 S: Subject to look for in the RDF graph
@@ -94,6 +135,23 @@ SPARQL Query: SPARQL Query to run, including s-p-o structure
 # Create prompt template from the template string
 query_prompt_template = PromptTemplate.from_template(template)
 
+# Cache of generated SPARQL queries; the same or a similar question skips the query-generation LLM call
+# Changing the template or the model starts a new scope, registered under the scenario name so it can be
+# listed, pinned or evicted with e.g. `python question_cache.py list scenario5`
+question_cache = QuestionCache(scope=question_scope(template, "anthropic--claude-3.5-sonnet"), threshold=0.8, name="scenario5")
+
+# Prompt for correcting a generated query that failed local validation
+repair_template = '''The SPARQL query below was generated for the question but is not valid. Correct it so that it is a syntactically valid SPARQL query that answers the question. Declare every prefix you use with PREFIX, and only select variables that appear in the WHERE clause.
+
+Question: {question}
+SPARQL Query: {query}
+Errors: {errors}
+'''
+repair_prompt_template = PromptTemplate.from_template(repair_template)
+
+# Invalid generated queries are sent back to the LLM with the errors at most this many times
+MAX_QUERY_REPAIRS = 2
+
 # Define type for state dictionary using TypedDict
 class State(TypedDict):
     question: str  # The input question
@@ -107,9 +165,29 @@ class QueryOutput(TypedDict):
     """Generated SPARQL query."""
     query: Annotated[str, ..., "Syntactically valid SPARQL query."]
 
+# Function to ask the LLM to correct an invalid query, given the validation errors
+def repair_query(question, query, errors):
+    prompt = repair_prompt_template.invoke({"question": question, "query": query, "errors": " ".join(errors)})
+    return anthropic.with_structured_output(QueryOutput).invoke(prompt)["query"]
+
 # Function to generate SPARQL query from natural language question
 def write_query(state: State):
     """Generate SPARQL query to fetch information."""
+    # Look up the exact entities the question names; no LLM call is needed when they cover the question
+    if USE_ENTITY_INDEX:
+        iris = entity_index.resolve(state["question"], graph=KG_GRAPH_NAME, prefix=KG_NAMESPACE,
+                                    min_question_coverage=ENTITY_INDEX_MIN_COVERAGE)
+        if iris:
+            query = build_values_query(iris, graph=KG_GRAPH_NAME)
+            print(query)
+            return {"query": query}
+
+    # Reuse the query of the same or a similar earlier question
+    cached_query = question_cache.lookup(state["question"])
+    if cached_query is not None:
+        print(cached_query)
+        return {"query": cached_query}
+
     # Format the prompt with the input question
     prompt = query_prompt_template.invoke({"input": state["question"]})
     
@@ -118,22 +196,39 @@ def write_query(state: State):
     
     # Get the generated query from LLM
     result = structured_llm.invoke(prompt)
-    
+
+    # Check the query locally; an invalid query goes back to the LLM with the errors a bounded number of times
+    checked = repair_sparql(result["query"], lambda query, errors: repair_query(state["question"], query, errors),
+                            max_attempts=MAX_QUERY_REPAIRS)
+    print_repair_result(checked)
+    if not checked["valid"]:
+        return {"query": None}
+
+    # Remember the query for the next time this question is asked
+    question_cache.store(state["question"], checked["query"])
+
     # Print and return the query
-    print(result["query"])
-    return {"query": result["query"]}
+    print(checked["query"])
+    return {"query": checked["query"]}
 
 # Function to execute SPARQL query against HANA database
 def execute_sparql(query_response):
     print()  # Print empty line for spacing
-    
-    # Create database cursor
-    cursor = conn.cursor()
-    
+
+    # Queries that fail local validation are never sent to the database
+    errors = validate_sparql(query_response["query"])
+    if errors:
+        print("Query not executed:", " ".join(errors))
+        return None
+
+    # Replace expensive REGEX filters and bound the result size; the query is unchanged if it cannot be parsed
+    rewrite = sparql_rewriter.rewrite(query_response["query"])
+    print_rewrite_report(rewrite)
+
     try:
-        # Execute SPARQL stored procedure
-        resp = cursor.callproc('SPARQL_EXECUTE', (
-            query_response["query"],  # The SPARQL query
+        # Execute SPARQL stored procedure on a connection borrowed from the pool, unless the result is cached
+        resp = sparql_cache.callproc(partial(result_negotiator.callproc, hana_pool.callproc), 'SPARQL_EXECUTE', (
+            rewrite["query"],  # The (rewritten) SPARQL query
             'Metadata headers describing Input and/or Output',  # Description
             '?',  # Output placeholder
             None  # Additional options
@@ -154,14 +249,11 @@ def execute_sparql(query_response):
 
     except Exception as e:
         print("Error executing stored procedure:", e)
-    finally:
-        # Ensure cursor is closed
-        cursor.close()
 
 # Function to summarize query results into natural language
 def summarize_info(question, query_response):
     # Define prompt template for summarization
-    prompt = """Answer the user question below given the following relational information in XML format. Use as much as the query response as possible to give a full, detailed explanation. Interpret the URI and predicate information using context. Don't use phrases like 'the entity identified by the URI,' just say what the entity is.
+    prompt = """Answer the user question below given the following relational information, one subject | predicate | object triple per line. Use as much as the query response as possible to give a full, detailed explanation. Interpret the URI and predicate information using context. Don't use phrases like 'the entity identified by the URI,' just say what the entity is.
     Also make sure the output is readable in a format that can be display through an HTML file, add appropriate formatting.
     Please remove unnecessary information. Do not add information about the triples. Do not add the source of the data.
     Do not include details about what they are identified as or what kind of entity they are unless asked. Do not add any suggestions unless explicitly asked. Simply give a crisp and direct answer to what has been asked!
@@ -169,6 +261,15 @@ def summarize_info(question, query_response):
     User Question: {question}
     Information: {information}
     """    
+    # Rank the result triples by relevance to the question and keep the best ones within the token budget
+    try:
+        packed = result_reducer.reduce(question, query_response)
+        print_packing_result(packed)
+        query_response = packed["text"]
+    except Exception as e:
+        # Not a SPARQL XML result document; pass it on unchanged
+        print("Could not reduce the query response:", e)
+
     # Create prompt template
     summarize = PromptTemplate.from_template(prompt)
     
@@ -186,14 +287,26 @@ def summarize_info(question, query_response):
     # Configure LLM for structured output
     translate_llm = anthropic.with_structured_output(QuestionAnswer)
     
+    if STREAM_ANSWERS:
+        # Print the answer as the tokens arrive; the complete final_answer field is returned at the end
+        streamed = stream_answer(translate_llm, prompt_input, "final_answer")
+        print()
+        return streamed["answer"]
+
     # Get final answer from LLM
     final_answer = translate_llm.invoke(prompt_input)
     
     # Print and return the answer
     print(final_answer["final_answer"])
+    return final_answer["final_answer"]
 
 # Main execution flow
 question = "What are Hdbkpic?"  # The question to answer
 sparql = write_query({"question": question})  # Generate SPARQL query
 response = execute_sparql(sparql)  # Execute query
-summarize_info(question, response)  # Generate and print answer
\ No newline at end of file
+if response is None:
+    # No valid query or no result: nothing to summarize
+    print("No information could be retrieved for this question.")
+else:
+    summarize_info(question, response)  # Generate and print answer
+print_question_cache_stats(question_cache)  # Exact and fuzzy hits of the question cache
@@ -164,14 +164,16 @@ generate_ttl()
 
 #Set up HANA Cloud Connection to import the ttl file 
 from hdbcli import dbapi
-# Establish connection to SAP HANA Cloud database
-conn = dbapi.connect(
+from hana_pool import HanaConnectionPool
+from sparql_cache import GraphVersions
+# Establish connection to SAP HANA Cloud database through the shared connection pool
+# The pool closes the cursor after the call and reopens the session if the server dropped it
+hana_pool = HanaConnectionPool(lambda: dbapi.connect(
     user = "<Your HANA Cloud User>",
     password="<Your HANA Cloud Password>",
     address = '<Your HANA Cloud Host>',
     port = 443,
-)
-cursor = conn.cursor()
+), min_size=1, max_size=1)
 #import the ttl file in to SAP HANA Cloud 
 ttl_filename = "/content/sflight_tabular.ttl"
 graphname = 'sflight_graph'                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                 
@@ -181,7 +183,9 @@ try:
         request_hdrs += 'rqx-load-protocol: true' + '\r\n'            # required header for upload protocol
         request_hdrs += 'rqx-load-filename: ' + ttl_filename + '\r\n' # optional header
         request_hdrs += 'rqx-load-graphname: ' + graphname + '\r\n'   # optional header to specify name of the graph, if not provided RDF data will be loaded to internal-default-graph
-        conn.cursor().callproc('SPARQL_EXECUTE', (ttlfp.read(), request_hdrs, '', None))
+        hana_pool.callproc('SPARQL_EXECUTE', (ttlfp.read(), request_hdrs, '', None))
+    # Cached SPARQL results of the old ontology (Scenario 7) are no longer valid
+    GraphVersions().bump(graphname)
     
     print("Success! The RDF graph has been successfully ingested into SAP HANA Cloud as graph:", graphname)
     
@@ -190,9 +194,8 @@ except Exception as e:
     
 finally:
     # Close the database connection
-    if conn is not None:
-        conn.close()
-        print("Database connection closed.")
+    hana_pool.close()
+    print("Database connection closed.")
 
 #Another option to Upload the TTL files is to move ttl file to Cloud Storage and then INgest it from SAP HANA CLoud Db Explorer
 #Here is the python code to ingest the ttl file to Amazon S3
@@ -4,13 +4,23 @@
 from xml.etree import ElementTree as ET
 from langchain_core.prompts import PromptTemplate
 from hdbcli import dbapi
-from langchain_aws import ChatBedrock
+from hana_pool import HanaConnectionPool
+from llm_clients import client_factory
+from sparql_cache import SparqlResultCache
+from sparql_results import ResultFormatNegotiator, iter_result_rows
+from functools import partial
 from typing import Dict, List
 import pandas as pd
 
+# The metadata query is the same for every question, so its result is cached until the graph is re-ingested
+sparql_cache = SparqlResultCache(max_entries=64, ttl=3600.0)
+# Ask for JSON or TSV results when the server supports them; XML otherwise
+result_negotiator = ResultFormatNegotiator()
+
 def setup(): 
     
-    anthropic = ChatBedrock(
+    # Cached by configuration, so calling setup() again reuses the client and its connections
+    anthropic = client_factory.chat_bedrock(
         model_id="anthropic.claude-3-5-sonnet-20240620-v1:0",
         aws_access_key_id="AWS_ACCESS_KEY_ID", #TODO
         aws_secret_access_key="AWS_SECRET_ACCESS_KEY",#TODO
@@ -18,14 +28,15 @@ def setup():
     
     )
 
-    conn = dbapi.connect(
+    # Pool of HANA connections; every SPARQL or SQL call borrows its own connection
+    pool = HanaConnectionPool(lambda: dbapi.connect(
         user="HANA_ADMIN", #TODO Add your credentials
         password="HANA_ADMIN_PW",#TODO Add your credentials
         address='instance',#TODO Add your credentials
         port=443,
-    )
+    ), min_size=1, max_size=4)
 
-    return anthropic, conn
+    return anthropic, pool
 
 """""
 Alternatively, if you wish to use Anthropic from SAP GenAI Hub, you can use the following setup() function:
@@ -37,6 +48,11 @@ import pandas as pd
 from xml.etree import ElementTree as ET
 from langchain_core.prompts import PromptTemplate
 from hdbcli import dbapi
+from hana_pool import HanaConnectionPool
+from llm_clients import client_factory
+from sparql_cache import SparqlResultCache
+from sparql_results import ResultFormatNegotiator, iter_result_rows
+from functools import partial
 from typing import Dict, List
 from gen_ai_hub.proxy.langchain.amazon import ChatBedrock
 from gen_ai_hub.proxy.core.proxy_clients import get_proxy_client
@@ -51,27 +67,27 @@ os.environ['AICORE_BASE_URL'] = "<Your AI Core Base URL>" #TODO
 
 def setup(): 
     
-    proxy_client = get_proxy_client('gen-ai-hub') # Get the proxy client
+    proxy_client = client_factory.genai_hub_proxy_client('gen-ai-hub') # Get the shared proxy client
 
-    anthropic = ChatBedrock(
+    # Cached by configuration, so calling setup() again reuses the client and its connections
+    anthropic = client_factory.chat_bedrock(
         model_name="anthropic--claude-3.5-sonnet",
         proxy_client=proxy_client # Pass the proxy client to ChatBedrock
     )
 
-    conn = dbapi.connect(
+    # Pool of HANA connections; every SPARQL or SQL call borrows its own connection
+    pool = HanaConnectionPool(lambda: dbapi.connect(
         user="HANA_ADMIN", #TODO Add your credentials
         password="HANA_ADMIN_PW",#TODO Add your credentials
         address='instance',#TODO Add your credentials
         port=443,
-    )
+    ), min_size=1, max_size=4)
 
-    return anthropic, conn
+    return anthropic, pool
 
 """""
-def extract_metadata(question: str, conn) -> List[Dict]:
+def extract_metadata(question: str, pool) -> List[Dict]:
     """Extract relevant metadata from RDF triples using SPARQL"""
-    cursor = conn.cursor()
-    
     try:
         # Execute SPARQL query to get all relevant triples
         sparql_query = """
@@ -82,10 +98,10 @@ def extract_metadata(question: str, conn) -> List[Dict]:
         }
         """
         
-        resp = cursor.callproc('SPARQL_EXECUTE', (sparql_query, 'Metadata headers describing Input and/or Output', '?', None))
+        resp = sparql_cache.callproc(partial(result_negotiator.callproc, pool.callproc), 'SPARQL_EXECUTE', (sparql_query, 'Metadata headers describing Input and/or Output', '?', None))
         
         if resp and len(resp) >= 3 and resp[2]:
-            # Parse the XML response
+            # Parse the response (XML, JSON or TSV)
             xml_response = resp[2]
             results = parse_sparql_results(xml_response)
             
@@ -103,8 +119,6 @@ def extract_metadata(question: str, conn) -> List[Dict]:
     except Exception as e:
         print(f"Error executing SPARQL query: {e}")
         return []
-    finally:
-        cursor.close()
 
 def analyze_metadata(metadata: List[Dict], question: str, anthropic) -> Dict:
     """Analyze the metadata to identify tables, columns, and relationships"""
@@ -241,24 +255,12 @@ def parse_analysis(analysis_text: str) -> Dict:
     return components
 
 def parse_sparql_results(xml_response: str) -> List[Dict]:
-    """Parse SPARQL XML results into a list of dictionaries"""
+    """Parse SPARQL results (XML, JSON or TSV) into a list of dictionaries"""
     try:
-        root = ET.fromstring(xml_response)
-        results = []
-        
-        for result in root.findall('.//{http://www.w3.org/2005/sparql-results#}result'):
-            row = {}
-            for binding in result:
-                var_name = binding.attrib['name']
-                value = binding[0]  # uri or literal
-                if value.tag.endswith('uri'):
-                    row[var_name] = value.text
-                elif value.tag.endswith('literal'):
-                    row[var_name] = value.text
-            results.append(row)
-        return results
-    except ET.ParseError as e:
-        print(f"Error parsing XML: {e}")
+        # Rows are read one at a time by the streaming parser instead of building the whole element tree
+        return list(iter_result_rows(xml_response))
+    except (ET.ParseError, ValueError) as e:
+        print(f"Error parsing SPARQL results: {e}")
         return []
     
 def generate_sql(components: Dict) -> str:
@@ -347,19 +349,21 @@ def generate_sql(components: Dict) -> str:
     
     return sql
 
-def execute_sql(sql_query: str, conn) -> pd.DataFrame:
+def execute_sql(sql_query: str, pool) -> pd.DataFrame:
     """Execute the generated SQL query and return results"""
-    cursor = conn.cursor()
     try:
-        cursor.execute(sql_query)
-        columns = [desc[0] for desc in cursor.description]
-        rows = cursor.fetchall()
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(sql_query)
+                columns = [desc[0] for desc in cursor.description]
+                rows = cursor.fetchall()
+            finally:
+                cursor.close()
         return pd.DataFrame(rows, columns=columns)
     except Exception as e:
         print(f"Error executing SQL query: {e}")
         return pd.DataFrame()
-    finally:
-        cursor.close()
 
 def generate_response_structured(question: str, results: pd.DataFrame, anthropic) -> str:
     """Generate a natural language response from the query results"""
@@ -385,11 +389,11 @@ def generate_response_structured(question: str, results: pd.DataFrame, anthropic
     response = anthropic.invoke(prompt)
     return response.content
 
-def process_question(question: str, conn, anthropic) -> str:
+def process_question(question: str, pool, anthropic) -> str:
     """Main function to process a user question with better error handling"""
     try:
         # Step 1: Extract relevant metadata using SPARQL
-        metadata = extract_metadata(question, conn)
+        metadata = extract_metadata(question, pool)
         
         if not metadata:
             return "Could not retrieve database metadata."
@@ -401,7 +405,7 @@ def process_question(question: str, conn, anthropic) -> str:
         sql_query = generate_sql(components)
     
         # Step 4: Execute SQL
-        results = execute_sql(sql_query, conn)
+        results = execute_sql(sql_query, pool)
         
         # Step 5: Generate response
         response = generate_response_structured(question, results, anthropic)
@@ -412,6 +416,6 @@ def process_question(question: str, conn, anthropic) -> str:
 
 
 question = "Show me all flight booking revenue for American Airlines." #TODO Add your question here
-anthropic, conn = setup()
-answer = process_question(question, conn, anthropic)
+anthropic, pool = setup()
+answer = process_question(question, pool, anthropic)
 print(answer)
\ No newline at end of file
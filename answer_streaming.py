@@ -0,0 +1,123 @@
+# Token streaming for the structured answers of the retrieval scenarios
+# summarize_info used to call invoke() on anthropic.with_structured_output(QuestionAnswer) and print nothing
+# until the whole answer had been generated. LangChain's structured output parsers also work on a stream:
+# every chunk is the partially parsed object, so the text of the answer field grows as tokens arrive. The
+# helpers here turn that stream into text deltas for a callback or a generator, and return the final structured
+# field once the stream ends. The first words appear after the model's first-token latency instead of its full
+# generation time. Models or parsers that cannot stream fall back to a single invoke() call.
+#please make sure you install the following packages
+#!pip install langchain_core
+import sys
+import time
+from typing import Callable, Iterator, Optional
+
+from typing_extensions import TypedDict
+
+class StreamedAnswer(TypedDict):
+    """Final answer of a streamed call and its timings."""
+    answer: str
+    chunks: int
+    first_token_seconds: float
+    total_seconds: float
+    streamed: bool
+
+def partial_field(chunk, field: str) -> Optional[str]:
+    """Return the (partial) value of a field from one chunk of a structured output stream"""
+    if isinstance(chunk, list):
+        # Tool parsers without first_tool_only return a list of tool calls
+        chunk = chunk[0] if chunk else None
+    if isinstance(chunk, dict) and "args" in chunk and field not in chunk:
+        chunk = chunk["args"]
+    if isinstance(chunk, dict):
+        value = chunk.get(field)
+    else:
+        # Pydantic models
+        value = getattr(chunk, field, None)
+    return value if isinstance(value, str) else None
+
+def iter_answer_tokens(structured_llm, prompt_input, field: str = "final_answer",
+                       result: Optional[StreamedAnswer] = None) -> Iterator[str]:
+    """Yield the answer text in pieces as they arrive; `result` receives the final answer and timings"""
+    start = time.perf_counter()
+    emitted = ""
+    answer = None
+    chunks = 0
+    first_token = None
+    streamed = True
+    try:
+        for chunk in structured_llm.stream(prompt_input):
+            chunks += 1
+            text = partial_field(chunk, field)
+            if text is None:
+                continue
+            answer = text
+            # Partial JSON parsing only ever extends the field; anything else waits for the final value
+            if len(text) > len(emitted) and text.startswith(emitted):
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+                delta, emitted = text[len(emitted):], text
+                yield delta
+    except NotImplementedError:
+        streamed = False
+    if answer is None:
+        # Nothing usable came from the stream: make the regular structured call instead
+        streamed = False
+        answer = partial_field(structured_llm.invoke(prompt_input), field) or ""
+    if answer != emitted and answer.startswith(emitted):
+        if first_token is None:
+            first_token = time.perf_counter() - start
+        yield answer[len(emitted):]
+    total = time.perf_counter() - start
+    if result is not None:
+        result.update(StreamedAnswer(answer=answer, chunks=chunks,
+                                     first_token_seconds=first_token if first_token is not None else total,
+                                     total_seconds=total, streamed=streamed))
+
+def print_token(text: str):
+    """Default token callback: write the text to the console as it arrives"""
+    sys.stdout.write(text)
+    sys.stdout.flush()
+
+def stream_answer(structured_llm, prompt_input, field: str = "final_answer",
+                  on_token: Callable[[str], None] = print_token) -> StreamedAnswer:
+    """Stream the answer field of a structured output call to a callback and return the final answer"""
+    result = StreamedAnswer(answer="", chunks=0, first_token_seconds=0.0, total_seconds=0.0, streamed=False)
+    for text in iter_answer_tokens(structured_llm, prompt_input, field, result):
+        on_token(text)
+    return result
+
+# Compare a blocking structured call with the streamed answer using a simulated model
+if __name__ == "__main__":
+    class SimulatedStructuredLLM:
+        """Stand-in for anthropic.with_structured_output(QuestionAnswer): partial dicts as tokens arrive"""
+        def __init__(self, first_token_latency: float = 0.8, token_latency: float = 0.02):
+            self.first_token_latency = first_token_latency
+            self.token_latency = token_latency
+            self.tokens = ("<h3>HDBKPIC</h3> <p>HDBKPIC is the <b>key performance indicator collector</b> of SAP "
+                           "HANA. It samples CPU, memory, disk and network usage of the system and stores the "
+                           "measurements in the statistics server tables, so administrators can review the "
+                           "load history of every service.</p> ").split(" ") * 4
+
+        def stream(self, prompt_input):
+            time.sleep(self.first_token_latency)
+            text = ""
+            for token in self.tokens:
+                text += token + " "
+                yield {"final_answer": text}
+                time.sleep(self.token_latency)
+
+        def invoke(self, prompt_input):
+            *_, last = self.stream(prompt_input)
+            return last
+
+    llm = SimulatedStructuredLLM()
+    start = time.perf_counter()
+    blocking = llm.invoke("prompt")["final_answer"]
+    blocking_seconds = time.perf_counter() - start
+    print(f"Blocking call: nothing shown for {blocking_seconds:.2f}s, then {len(blocking)} characters\n")
+
+    received = []
+    streamed = stream_answer(llm, "prompt", on_token=received.append)
+    assert "".join(received) == streamed["answer"] == blocking
+    print(f"Streamed call: first text after {streamed['first_token_seconds']:.2f}s, complete after "
+          f"{streamed['total_seconds']:.2f}s in {len(received)} pieces")
@@ -0,0 +1,298 @@
+# Asyncio extraction engine with adaptive, rate-limit-aware concurrency
+# Instead of a fixed ThreadPoolExecutor(max_workers=10), chunks are extracted through the transformer's
+# async conversion path (aconvert_to_graph_documents). Requests are admitted by two token buckets, one for
+# requests per minute and one for tokens per minute, and the number of concurrent requests is adjusted
+# AIMD-style: it grows slowly while calls succeed and is halved when the service answers with throttling.
+# Every request has its own timeout so a hung call cannot stall the run.
+#please make sure you install the following packages
+#!pip install langchain_experimental
+import asyncio
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from typing_extensions import TypedDict
+
+class ExtractionReport(TypedDict):
+    """Summary of an async extraction run."""
+    chunks: int
+    chunks_failed: int
+    throttled: int
+    timeouts: int
+    retries: int
+    elapsed_seconds: float
+    chunks_per_second: float
+    final_concurrency: float
+    peak_concurrency: int
+
+def is_throttling_error(error: Exception) -> bool:
+    """Check whether an exception raised by an LLM client means the request was throttled"""
+    # OpenAI/Azure OpenAI and httpx style errors carry the HTTP status code
+    for candidate in (error, getattr(error, "response", None)):
+        if getattr(candidate, "status_code", None) == 429:
+            return True
+    # botocore ClientError for Bedrock
+    response = getattr(error, "response", None)
+    if isinstance(response, dict):
+        code = response.get("Error", {}).get("Code", "")
+        if code in ("ThrottlingException", "TooManyRequestsException", "ServiceQuotaExceededException"):
+            return True
+    # Rate limit exception classes (e.g. openai.RateLimitError); the message is never parsed, since a chunk's
+    # text or an unrelated error can mention "429" or "rate limit"
+    name = type(error).__name__.lower()
+    return "ratelimit" in name or "throttl" in name
+
+def estimate_tokens(text: str, prompt_tokens: int = 1500, completion_tokens: int = 1000) -> int:
+    """Rough token estimate for one extraction request (about 4 characters per token)"""
+    return len(text) // 4 + prompt_tokens + completion_tokens
+
+class TokenBucket:
+    """Async token bucket refilled continuously at a per-minute rate"""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        if rate_per_minute <= 0:
+            raise ValueError("rate_per_minute must be positive")
+        self.rate = rate_per_minute / 60.0  # Tokens added per second
+        # Allow a burst of about ten seconds of quota by default
+        self.capacity = capacity if capacity is not None else max(rate_per_minute / 6.0, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = None
+
+    async def acquire(self, amount: float = 1.0):
+        """Wait until the requested amount is available and take it from the bucket"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        amount = min(amount, self.capacity)
+        # Waiters queue on the lock, so the bucket is served in arrival order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD concurrency limit: additive increase on success, multiplicative decrease on throttling"""
+
+    def __init__(self, initial: int = 4, minimum: int = 1, maximum: int = 64,
+                 decrease_factor: float = 0.5, cooldown: float = 1.0):
+        self.limit = float(initial)             # Current concurrency limit
+        self.minimum = minimum                  # Lower bound for the limit
+        self.maximum = maximum                  # Upper bound for the limit
+        self.decrease_factor = decrease_factor  # Factor applied to the limit on throttling
+        self.cooldown = cooldown                # Seconds between two decreases
+        self.in_flight = 0                      # Requests currently running
+        self.peak = 0                           # Highest number of concurrent requests observed
+        self.slow_start = True                  # Grow quickly until the first throttling response
+        self._last_decrease = 0.0
+        self._condition = None
+
+    async def acquire(self):
+        """Wait for a free slot under the current limit"""
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+
+    async def release(self, throttled: bool = False):
+        """Free a slot and adjust the limit from the outcome of the request"""
+        async with self._condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                # One burst of 429s should only halve the limit once
+                if now - self._last_decrease >= self.cooldown:
+                    self.limit = max(float(self.minimum), self.limit * self.decrease_factor)
+                    self._last_decrease = now
+                self.slow_start = False
+            elif self.slow_start:
+                # Until the service pushes back, add one slot per successful request
+                self.limit = min(float(self.maximum), self.limit + 1.0)
+            else:
+                # Afterwards grow by about one slot per limit's worth of successful requests
+                self.limit = min(float(self.maximum), self.limit + 1.0 / self.limit)
+            self._condition.notify_all()
+
+class AsyncExtractionEngine:
+    """Extract graph documents from chunks concurrently within request and token quotas"""
+
+    def __init__(self, llm_transformer, requests_per_minute: float = 600, tokens_per_minute: float = 300000,
+                 initial_concurrency: int = 4, max_concurrency: int = 64, request_timeout: float = 120.0,
+                 max_retries: int = 5, retry_backoff: float = 1.0, prompt_tokens: int = 1500,
+                 completion_tokens: int = 1000):
+        self.llm_transformer = llm_transformer          # Transformer offering aconvert_to_graph_documents
+        self.requests_per_minute = requests_per_minute  # Request quota of the deployment
+        self.tokens_per_minute = tokens_per_minute      # Token quota of the deployment
+        self.initial_concurrency = initial_concurrency  # Starting number of concurrent requests
+        self.max_concurrency = max_concurrency          # Upper bound for concurrent requests
+        self.request_timeout = request_timeout          # Timeout per request in seconds
+        self.max_retries = max_retries                  # Retries per chunk on throttling or timeout
+        self.retry_backoff = retry_backoff              # Base delay before retrying a chunk
+        self.prompt_tokens = prompt_tokens              # Estimated system prompt tokens per request
+        self.completion_tokens = completion_tokens      # Estimated output tokens per request
+
+    def extract(self, chunks: List) -> Tuple[List, ExtractionReport]:
+        """Run the async engine from synchronous code, also inside notebooks with a running event loop"""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.run(chunks))
+
+        # A loop is already running (Jupyter/Colab), so run the engine on a separate thread
+        result = {}
+
+        def runner():
+            try:
+                result["value"] = asyncio.run(self.run(chunks))
+            except BaseException as e:
+                result["error"] = e
+
+        thread = threading.Thread(target=runner, name="kge-async-extraction")
+        thread.start()
+        thread.join()
+        if "error" in result:
+            raise result["error"]
+        return result["value"]
+
+    async def run(self, chunks: List) -> Tuple[List, ExtractionReport]:
+        """Extract all chunks and return the graph documents in chunk order with a run report"""
+        report = ExtractionReport(chunks=len(chunks), chunks_failed=0, throttled=0, timeouts=0, retries=0,
+                                  elapsed_seconds=0.0, chunks_per_second=0.0, final_concurrency=0.0,
+                                  peak_concurrency=0)
+        request_bucket = TokenBucket(self.requests_per_minute)
+        token_bucket = TokenBucket(self.tokens_per_minute)
+        limiter = AdaptiveConcurrencyLimiter(initial=self.initial_concurrency, maximum=self.max_concurrency)
+        results = [None] * len(chunks)
+        start = time.perf_counter()
+
+        async def extract_chunk(i, chunk):
+            tokens = estimate_tokens(chunk.page_content, self.prompt_tokens, self.completion_tokens)
+            for attempt in range(self.max_retries + 1):
+                if attempt:
+                    report["retries"] += 1
+                    await asyncio.sleep(self.retry_backoff * (2 ** (attempt - 1)))
+                await limiter.acquire()
+                throttled = False
+                try:
+                    await request_bucket.acquire(1)
+                    await token_bucket.acquire(tokens)
+                    results[i] = await asyncio.wait_for(
+                        self.llm_transformer.aconvert_to_graph_documents([chunk]), self.request_timeout)
+                    return
+                except asyncio.TimeoutError:
+                    report["timeouts"] += 1
+                    error = f"timed out after {self.request_timeout}s"
+                except Exception as e:
+                    if not is_throttling_error(e):
+                        # Other errors are not retried; log them and keep processing the remaining chunks
+                        report["chunks_failed"] += 1
+                        print(f"Error processing chunk {i}: {e}")
+                        return
+                    throttled = True
+                    report["throttled"] += 1
+                    error = str(e)
+                finally:
+                    await limiter.release(throttled)
+            report["chunks_failed"] += 1
+            print(f"Error processing chunk {i} after {self.max_retries + 1} attempts: {error}")
+
+        await asyncio.gather(*(extract_chunk(i, chunk) for i, chunk in enumerate(chunks)))
+
+        report["elapsed_seconds"] = time.perf_counter() - start
+        if report["elapsed_seconds"] > 0:
+            report["chunks_per_second"] = (report["chunks"] - report["chunks_failed"]) / report["elapsed_seconds"]
+        report["final_concurrency"] = limiter.limit
+        report["peak_concurrency"] = limiter.peak
+        graph_documents = [document for extracted in results if extracted for document in extracted]
+        return graph_documents, report
+
+def print_extraction_report(report: ExtractionReport):
+    """Print a short summary of an async extraction run"""
+    print(f"Extracted {report['chunks'] - report['chunks_failed']} of {report['chunks']} chunks in "
+          f"{report['elapsed_seconds']:.2f}s ({report['chunks_per_second']:.1f} chunks/s).")
+    print(f"Throttled {report['throttled']} times, {report['timeouts']} timeouts, {report['retries']} retries; "
+          f"concurrency ended at {report['final_concurrency']:.1f} (peak {report['peak_concurrency']}).")
+
+# Compare the fixed thread pool with the adaptive async engine against a simulated, throttling LLM service
+if __name__ == "__main__":
+    import random
+    from concurrent.futures import ThreadPoolExecutor
+    from types import SimpleNamespace
+
+    class SimulatedThrottlingError(Exception):
+        """Error raised by the simulated service, carrying HTTP status 429 like the OpenAI client"""
+        status_code = 429
+
+    class SimulatedTransformer:
+        """Fake LLMGraphTransformer: fixed latency, a concurrency quota and randomly injected 429s"""
+
+        def __init__(self, latency=0.2, max_concurrent=24, throttle_rate=0.01, seed=1):
+            self.latency = latency
+            self.max_concurrent = max_concurrent
+            self.throttle_rate = throttle_rate
+            self.in_flight = 0
+            self._random = random.Random(seed)
+            self._lock = threading.Lock()
+
+        def _enter(self):
+            with self._lock:
+                throttled = self.in_flight >= self.max_concurrent or self._random.random() < self.throttle_rate
+                if not throttled:
+                    self.in_flight += 1
+                return throttled
+
+        def _leave(self):
+            with self._lock:
+                self.in_flight -= 1
+
+        def convert_to_graph_documents(self, chunks):
+            if self._enter():
+                time.sleep(0.02)
+                raise SimulatedThrottlingError("429 Too Many Requests")
+            try:
+                time.sleep(self.latency)
+                return [SimpleNamespace(nodes=[], relationships=[], source=chunks[0])]
+            finally:
+                self._leave()
+
+        async def aconvert_to_graph_documents(self, chunks):
+            if self._enter():
+                await asyncio.sleep(0.02)
+                raise SimulatedThrottlingError("429 Too Many Requests")
+            try:
+                await asyncio.sleep(self.latency)
+                return [SimpleNamespace(nodes=[], relationships=[], source=chunks[0])]
+            finally:
+                self._leave()
+
+    sample_chunks = [SimpleNamespace(page_content="x" * 2000, metadata={}) for _ in range(400)]
+
+    # Baseline: fixed pool of 10 threads, each call retried like AzureChatOpenAI(max_retries=2)
+    def fixed_pool_call(transformer, chunk):
+        for attempt in range(3):
+            try:
+                return transformer.convert_to_graph_documents([chunk])
+            except SimulatedThrottlingError:
+                time.sleep(0.5 * (2 ** attempt))
+        return None
+
+    transformer = SimulatedTransformer()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        fixed_results = list(executor.map(lambda c: fixed_pool_call(transformer, c), sample_chunks))
+    fixed_elapsed = time.perf_counter() - start
+    fixed_done = sum(1 for r in fixed_results if r)
+    print(f"Fixed pool: {fixed_done} chunks in {fixed_elapsed:.2f}s ({fixed_done / fixed_elapsed:.1f} chunks/s)")
+
+    # Adaptive async engine with request and token quotas well above what the service sustains
+    engine = AsyncExtractionEngine(SimulatedTransformer(), requests_per_minute=12000, tokens_per_minute=50_000_000,
+                                   initial_concurrency=4, max_concurrency=64, request_timeout=5.0,
+                                   retry_backoff=0.05)
+    _, engine_report = engine.extract(sample_chunks)
+    print_extraction_report(engine_report)
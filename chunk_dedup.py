@@ -0,0 +1,156 @@
+# Near-duplicate chunk elimination between chunking and LLM extraction
+# SAP notes repeat headers, footers, disclaimer blocks and near-identical tables across pages. This stage drops
+# exact duplicates (hash of the normalized text) and near duplicates (MinHash signatures over word shingles,
+# candidate pairs found with LSH banding) before they are sent to the LLM. A mapping from every skipped chunk
+# to the chunk that was kept is recorded, so the metadata of the skipped chunks is not lost and provenance
+# of the kept chunk can be copied to the pages of its duplicates.
+#please make sure you install the following packages
+#!pip install numpy langchain_core
+import hashlib
+import re
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from typing_extensions import TypedDict
+
+# Characters removed during normalization, so formatting noise does not hide duplicates
+_NON_WORD = re.compile(r"[^\w]+", re.UNICODE)
+
+class DuplicateRecord(TypedDict):
+    """A chunk that was skipped because an equivalent chunk was already kept."""
+    chunk_index: int
+    kept_index: int
+    kind: str
+    similarity: float
+    metadata: Dict
+    kept_metadata: Dict
+    kept_chunk: str
+
+class DedupReport(TypedDict):
+    """Summary of the deduplication stage."""
+    chunks: int
+    kept: int
+    exact_duplicates: int
+    near_duplicates: int
+    tokens_total: int
+    tokens_saved: int
+
+def normalize_text(text: str) -> List[str]:
+    """Lower-case the text and split it into words, ignoring punctuation and spacing"""
+    return [word for word in _NON_WORD.split(text.lower()) if word]
+
+def default_token_counter(text: str) -> int:
+    """Rough token count (about 4 characters per token)"""
+    return max(1, len(text) // 4)
+
+class MinHasher:
+    """MinHash signatures over word shingles using multiply-shift hashing"""
+
+    def __init__(self, num_perm: int = 64, shingle_size: int = 5, seed: int = 1):
+        self.num_perm = num_perm          # Signature length
+        self.shingle_size = shingle_size  # Words per shingle
+        rng = np.random.default_rng(seed)
+        # Odd 64-bit multipliers and random offsets, one pair per permutation
+        self._a = rng.integers(1, np.iinfo(np.uint64).max, size=num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, np.iinfo(np.uint64).max, size=num_perm, dtype=np.uint64)
+
+    def shingles(self, words: List[str]) -> List[str]:
+        size = min(self.shingle_size, len(words)) or 1
+        return [" ".join(words[i:i + size]) for i in range(max(len(words) - size + 1, 1))]
+
+    def signature(self, words: List[str]) -> np.ndarray:
+        """Return the MinHash signature of a list of normalized words"""
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little")
+             for s in set(self.shingles(words))),
+            dtype=np.uint64,
+        )
+        # (a * x + b) mod 2^64, keeping the high 32 bits, for every permutation and shingle
+        with np.errstate(over="ignore"):
+            permuted = (np.outer(hashes, self._a) + self._b) >> np.uint64(32)
+        return permuted.min(axis=0)
+
+class ChunkDeduplicator:
+    """Streaming filter that drops exact and near-duplicate chunks"""
+
+    def __init__(self, threshold: float = 0.9, num_perm: int = 64, bands: int = 16, shingle_size: int = 5,
+                 token_counter: Optional[Callable[[str], int]] = None):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold        # Minimum estimated Jaccard similarity for a near duplicate
+        self.bands = bands                # LSH bands; more bands find less similar candidates
+        self.rows = num_perm // bands     # Signature rows per band
+        self.hasher = MinHasher(num_perm, shingle_size)
+        self.token_counter = token_counter or default_token_counter
+        self.duplicates: List[DuplicateRecord] = []  # Every skipped chunk and the chunk it maps to
+        self.mapping: Dict[int, int] = {}            # Skipped chunk index -> kept chunk index
+        self.report = DedupReport(chunks=0, kept=0, exact_duplicates=0, near_duplicates=0,
+                                  tokens_total=0, tokens_saved=0)
+        self._exact: Dict[str, int] = {}
+        self._signatures: Dict[int, np.ndarray] = {}
+        self._kept: Dict[int, Tuple[Dict, str]] = {}  # Kept chunk index -> metadata and text fingerprint
+        self._buckets = [defaultdict(list) for _ in range(bands)]
+
+    def filter(self, chunks: Iterable) -> Iterator:
+        """Yield only chunks that are not duplicates of an earlier chunk"""
+        for chunk in chunks:
+            index = self.report["chunks"]
+            self.report["chunks"] += 1
+            tokens = self.token_counter(chunk.page_content)
+            self.report["tokens_total"] += tokens
+
+            words = normalize_text(chunk.page_content)
+            digest = hashlib.sha1(" ".join(words).encode("utf-8")).hexdigest()
+            kept_index = self._exact.get(digest)
+            if kept_index is not None:
+                self._skip(index, kept_index, "exact", 1.0, chunk, tokens)
+                continue
+
+            signature = self.hasher.signature(words)
+            kept_index, similarity = self._near_match(signature)
+            if kept_index is not None:
+                self._skip(index, kept_index, "near", similarity, chunk, tokens)
+                continue
+
+            # New content: remember it and pass it on to extraction
+            self._exact[digest] = index
+            self._signatures[index] = signature
+            self._kept[index] = (chunk.metadata, hashlib.sha1(chunk.page_content.encode("utf-8")).hexdigest())
+            for band, bucket in enumerate(self._buckets):
+                bucket[signature[band * self.rows:(band + 1) * self.rows].tobytes()].append(index)
+            self.report["kept"] += 1
+            yield chunk
+
+    def duplicates_of(self, kept_index: int) -> List[Dict]:
+        """Return the metadata of every chunk that was skipped in favour of the given chunk"""
+        return [record["metadata"] for record in self.duplicates if record["kept_index"] == kept_index]
+
+    def _near_match(self, signature: np.ndarray):
+        """Find the most similar kept chunk among the LSH candidates"""
+        candidates = set()
+        for band, bucket in enumerate(self._buckets):
+            candidates.update(bucket.get(signature[band * self.rows:(band + 1) * self.rows].tobytes(), ()))
+        best_index, best_similarity = None, 0.0
+        for candidate in candidates:
+            similarity = float(np.mean(self._signatures[candidate] == signature))
+            if similarity >= self.threshold and similarity > best_similarity:
+                best_index, best_similarity = candidate, similarity
+        return best_index, best_similarity
+
+    def _skip(self, index: int, kept_index: int, kind: str, similarity: float, chunk, tokens: int):
+        self.mapping[index] = kept_index
+        kept_metadata, kept_chunk = self._kept[kept_index]
+        self.duplicates.append(DuplicateRecord(chunk_index=index, kept_index=kept_index, kind=kind,
+                                               similarity=similarity, metadata=dict(chunk.metadata),
+                                               kept_metadata=kept_metadata, kept_chunk=kept_chunk))
+        self.report["exact_duplicates" if kind == "exact" else "near_duplicates"] += 1
+        self.report["tokens_saved"] += tokens
+
+def print_dedup_report(report: DedupReport):
+    """Print a short summary of the deduplication stage"""
+    skipped = report["exact_duplicates"] + report["near_duplicates"]
+    share = report["tokens_saved"] / report["tokens_total"] if report["tokens_total"] else 0.0
+    print(f"Deduplication kept {report['kept']} of {report['chunks']} chunks, skipped {skipped} "
+          f"({report['exact_duplicates']} exact, {report['near_duplicates']} near duplicates) "
+          f"and saved about {report['tokens_saved']} tokens ({share:.0%}).")
@@ -0,0 +1,140 @@
+# Token-budget chunk packing to reduce the number of LLM extraction requests
+# Every convert_to_graph_documents request repeats the transformer's system prompt, so many short chunks
+# (trailing chunks, small pages) waste request overhead and prompt tokens. The packer fills each request up
+# to a configurable token budget with consecutive chunks of the same document. After extraction the nodes
+# and relationships are mapped back to the chunk(s) that mention them, so source metadata is preserved.
+#please make sure you install the following packages
+#!pip install langchain_core langchain_community tiktoken
+import re
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from langchain_community.graphs.graph_document import GraphDocument
+from langchain_core.documents import Document
+from typing_extensions import TypedDict
+
+# Separator placed between packed chunks in the request text
+PACK_SEPARATOR = "\n\n"
+
+class PackedDocument(Document):
+    """A request document made of several consecutive chunks."""
+    parts: List[Document] = []
+
+class PackingReport(TypedDict):
+    """Summary of the packing stage."""
+    chunks: int
+    requests: int
+    prompt_tokens_saved: int
+
+def make_token_counter(encoding_name: str = "gpt2") -> Callable[[str], int]:
+    """Return a token counter using the same tiktoken encoding as TokenTextSplitter, if available"""
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding(encoding_name)
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    except Exception:
+        # Fall back to about 4 characters per token
+        return lambda text: max(1, len(text) // 4)
+
+def _normalize(text: str) -> str:
+    """Fold case, underscores and dashes so node ids can be found in the chunk text"""
+    return " ".join(re.sub(r"[_\-]+", " ", text.lower()).split())
+
+class ChunkPacker:
+    """Greedily pack consecutive chunks into requests of at most token_budget tokens"""
+
+    def __init__(self, token_budget: int = 1500, prompt_tokens: int = 1500, same_source_only: bool = True,
+                 token_counter: Optional[Callable[[str], int]] = None):
+        self.token_budget = token_budget          # Maximum chunk tokens per request
+        self.prompt_tokens = prompt_tokens        # Estimated system prompt tokens repeated per request
+        self.same_source_only = same_source_only  # Never mix chunks of different PDF files in one request
+        self.token_counter = token_counter or make_token_counter()
+        self.report = PackingReport(chunks=0, requests=0, prompt_tokens_saved=0)
+
+    def pack(self, chunks: Iterable[Document]) -> Iterator[Document]:
+        """Yield request documents, each holding one or more consecutive chunks"""
+        parts: List[Document] = []
+        used = 0
+        for chunk in chunks:
+            self.report["chunks"] += 1
+            tokens = self.token_counter(chunk.page_content)
+            source_changed = (self.same_source_only and parts
+                              and parts[-1].metadata.get("source") != chunk.metadata.get("source"))
+            if parts and (used + tokens > self.token_budget or source_changed):
+                yield self._emit(parts)
+                parts, used = [], 0
+            parts.append(chunk)
+            used += tokens
+        if parts:
+            yield self._emit(parts)
+
+    def _emit(self, parts: List[Document]) -> Document:
+        self.report["requests"] += 1
+        self.report["prompt_tokens_saved"] += (len(parts) - 1) * self.prompt_tokens
+        return pack_parts(parts)
+
+def pack_parts(parts: List[Document]) -> Document:
+    """Combine consecutive chunks into one request document; a single chunk is returned as it is"""
+    if len(parts) == 1:
+        return parts[0]
+    metadata = dict(parts[0].metadata)
+    metadata["packed_chunks"] = len(parts)
+    return PackedDocument(page_content=PACK_SEPARATOR.join(part.page_content for part in parts),
+                          metadata=metadata, parts=parts)
+
+def unpack_graph_documents(graph_documents: List[GraphDocument]) -> List[GraphDocument]:
+    """Split graph documents extracted from packed requests back into one graph document per chunk"""
+    unpacked = []
+    for graph_document in graph_documents:
+        source = graph_document.source
+        parts = getattr(source, "parts", None)
+        if not parts:
+            unpacked.append(graph_document)
+            continue
+
+        texts = [_normalize(part.page_content) for part in parts]
+
+        def owners(node) -> List[int]:
+            # Chunks whose text mentions the node id; nodes the LLM inferred belong to every chunk
+            needle = _normalize(str(node.id))
+            found = [i for i, text in enumerate(texts) if needle and needle in text]
+            return found or list(range(len(parts)))
+
+        nodes_by_part: Dict[int, list] = {i: [] for i in range(len(parts))}
+        relationships_by_part: Dict[int, list] = {i: [] for i in range(len(parts))}
+        node_owners = {}
+        for node in graph_document.nodes:
+            node_owners[(node.id, node.type)] = owners(node)
+            for i in node_owners[(node.id, node.type)]:
+                nodes_by_part[i].append(node)
+        for relationship in graph_document.relationships:
+            source_owners = node_owners.get((relationship.source.id, relationship.source.type)) \
+                or owners(relationship.source)
+            target_owners = node_owners.get((relationship.target.id, relationship.target.type)) \
+                or owners(relationship.target)
+            # Prefer chunks that mention both ends; otherwise attribute it to the source's chunks
+            shared = [i for i in source_owners if i in target_owners]
+            for i in shared or source_owners:
+                relationships_by_part[i].append(relationship)
+
+        for i, part in enumerate(parts):
+            if nodes_by_part[i] or relationships_by_part[i]:
+                unpacked.append(GraphDocument(nodes=nodes_by_part[i], relationships=relationships_by_part[i],
+                                              source=part))
+    return unpacked
+
+class PackedGraphTransformer:
+    """Wrapper around a graph transformer that unpacks results of packed requests per source chunk"""
+
+    def __init__(self, llm_transformer):
+        self.llm_transformer = llm_transformer
+
+    def convert_to_graph_documents(self, documents: List[Document], config=None) -> List[GraphDocument]:
+        return unpack_graph_documents(self.llm_transformer.convert_to_graph_documents(documents, config))
+
+    async def aconvert_to_graph_documents(self, documents: List[Document], config=None) -> List[GraphDocument]:
+        return unpack_graph_documents(await self.llm_transformer.aconvert_to_graph_documents(documents, config))
+
+def print_packing_report(report: PackingReport):
+    """Print a short summary of the packing stage"""
+    print(f"Packed {report['chunks']} chunks into {report['requests']} LLM requests, "
+          f"saving about {report['prompt_tokens_saved']} prompt tokens.")
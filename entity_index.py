@@ -0,0 +1,279 @@
+# Inverted entity index for targeted SPARQL lookups
+# The retrieval prompt used to make the LLM write FILTER(REGEX(str(?s), "...", "i") || REGEX(str(?o), ...))
+# over ?s ?p ?o, which makes the triplestore evaluate a case-insensitive regex against every triple. The index
+# maps the normalized words of every subject and object IRI (case, underscores, dashes, camelCase, plurals and
+# word order folded) to the exact IRIs. It is filled at ingestion time, or rebuilt with one paged scan of a
+# graph, and kept in a local SQLite file. During ingestion the index is updated from the writer's batch hook,
+# so only triples HANA accepted are indexed, and an IRI is dropped once every triple mentioning it is deleted.
+# At question time the question's words are resolved to IRIs and a VALUES query fetches only the triples of
+# those entities, so query time no longer grows with the graph.
+#please make sure you install the following packages
+#!pip install rdflib
+import os
+import re
+import sqlite3
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import unquote
+
+from delta_ingest import scan_graph, triple_hash
+from hana_sparql_writer import BatchResult, format_triple
+from question_cache import question_tokens
+
+# Words of an IRI local name: camelCase humps, runs of capitals, lowercase words and numbers
+_NAME_WORD = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+# First IRI of an N-Triples statement (the subject) and an IRI at its end (the object, not a literal's datatype)
+_SUBJECT_IRI = re.compile(r"^<([^>]*)>")
+_OBJECT_IRI = re.compile(r"(?<!\^\^)<([^>]*)>\s*\.?\s*$")
+
+def iri_local_name(iri: str) -> str:
+    """Decoded part of an IRI after the last '/' or '#'"""
+    return unquote(re.split(r"[/#]", iri.rstrip("/#"))[-1])
+
+def entity_tokens(iri: str) -> frozenset:
+    """Normalized words of an IRI, comparable with question_tokens of a question"""
+    words = " ".join(_NAME_WORD.findall(iri_local_name(iri)))
+    return question_tokens(words)
+
+def build_values_query(iris: List[str], limit: Optional[int] = None, graph: Optional[str] = None) -> str:
+    """SPARQL query for every triple whose subject or object is one of the given IRIs (in one named graph)"""
+    values = " ".join(f"<{iri}>" for iri in iris)
+    dataset = f" FROM <{graph}>" if graph else ""
+    query = (f"SELECT ?s ?p ?o{dataset} WHERE {{\n"
+             f"  {{ VALUES ?s {{ {values} }} ?s ?p ?o . }}\n"
+             f"  UNION\n"
+             f"  {{ VALUES ?o {{ {values} }} ?s ?p ?o . }}\n"
+             f"}}")
+    if limit:
+        query += f" LIMIT {limit}"
+    return query
+
+class EntityIndex:
+    """Word-to-IRI index of the subjects and objects of each graph, stored in a local SQLite file"""
+
+    def __init__(self, path: str = ".kge_cache/entity_index.sqlite"):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path  # Location of the index file
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS entities ("
+            " graph TEXT NOT NULL, iri TEXT NOT NULL, words INTEGER NOT NULL, PRIMARY KEY (graph, iri)) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS entity_words ("
+            " word TEXT NOT NULL, graph TEXT NOT NULL, iri TEXT NOT NULL, PRIMARY KEY (word, graph, iri))"
+            " WITHOUT ROWID;"
+            # The triples mentioning each IRI, so an IRI can be dropped when the last of them is deleted
+            "CREATE TABLE IF NOT EXISTS entity_triples ("
+            " graph TEXT NOT NULL, hash BLOB NOT NULL, iri TEXT NOT NULL, PRIMARY KEY (graph, hash, iri))"
+            " WITHOUT ROWID;"
+            "CREATE INDEX IF NOT EXISTS entity_triples_iri ON entity_triples (graph, iri);"
+        )
+        self._db.commit()
+        self._known: Set[Tuple[str, str]] = set()  # (graph, iri) pairs added through this object
+
+    def add_iris(self, graph: str, iris: Iterable[str]):
+        """Index IRIs of a graph"""
+        entities = []
+        words = []
+        with self._lock:
+            # Conversion may run on several pipeline threads
+            for iri in iris:
+                if (graph, iri) in self._known:
+                    continue
+                self._known.add((graph, iri))
+                tokens = entity_tokens(iri)
+                if not tokens:
+                    continue
+                entities.append((graph, iri, len(tokens)))
+                words.extend((word, graph, iri) for word in tokens)
+            if not entities:
+                return
+            self._db.executemany("INSERT OR IGNORE INTO entities (graph, iri, words) VALUES (?, ?, ?)", entities)
+            self._db.executemany("INSERT OR IGNORE INTO entity_words (word, graph, iri) VALUES (?, ?, ?)", words)
+            self._db.commit()
+
+    def add_triples(self, graph: str, triples: Iterable[Tuple]) -> List[Tuple]:
+        """Index the subjects and IRI objects of (subject, predicate, object) triples and return the triples"""
+        triples = list(triples)
+        self.add_statements(graph, (format_triple(s, p, o) for s, p, o in triples))
+        return triples
+
+    def add_statements(self, graph: str, statements: Iterable[str]):
+        """Index the subjects and IRI objects of N-Triples statements"""
+        references = self._references(graph, statements)
+        self.add_iris(graph, [iri for _, _, iri in references])
+        with self._lock:
+            self._db.executemany("INSERT OR IGNORE INTO entity_triples (graph, hash, iri) VALUES (?, ?, ?)",
+                                 references)
+            self._db.commit()
+
+    def remove_statements(self, graph: str, statements: Iterable[str]) -> int:
+        """Forget deleted statements and drop the IRIs no remaining statement mentions; returns the IRIs dropped"""
+        references = self._references(graph, statements)
+        with self._lock:
+            self._db.executemany("DELETE FROM entity_triples WHERE graph = ? AND hash = ? AND iri = ?", references)
+            orphans = [iri for iri in {iri for _, _, iri in references}
+                       if self._db.execute("SELECT 1 FROM entity_triples WHERE graph = ? AND iri = ? LIMIT 1",
+                                           (graph, iri)).fetchone() is None]
+            self._db.executemany("DELETE FROM entities WHERE graph = ? AND iri = ?", [(graph, iri) for iri in orphans])
+            self._db.executemany("DELETE FROM entity_words WHERE graph = ? AND iri = ?",
+                                 [(graph, iri) for iri in orphans])
+            self._db.commit()
+            self._known.difference_update((graph, iri) for iri in orphans)
+        return len(orphans)
+
+    def batch_done(self, graph: str, result: BatchResult, statements: List[str]):
+        """Writer hook (bind the graph with functools.partial): index written batches, prune deleted ones"""
+        if result["error"] is not None:
+            return
+        if result["operation"] in ("INSERT", "UNCHANGED"):
+            self.add_statements(graph, statements)
+        elif result["operation"] == "DELETE":
+            self.remove_statements(graph, statements)
+
+    @staticmethod
+    def _references(graph: str, statements: Iterable[str]) -> List[Tuple[str, bytes, str]]:
+        """(graph, statement hash, IRI) for the subject and IRI object of every statement"""
+        references = []
+        for statement in statements:
+            digest = triple_hash(statement)
+            for pattern in (_SUBJECT_IRI, _OBJECT_IRI):
+                match = pattern.search(statement)
+                if match:
+                    references.append((graph, digest, match.group(1)))
+        return references
+
+    def rebuild(self, graph: str, connect: Callable[[], object], page_size: int = 10000) -> int:
+        """Replace the index of a graph with the entities currently stored on the server"""
+        self.clear(graph)
+        conn = connect()
+        try:
+            for statements in scan_graph(conn, graph, page_size):
+                self.add_statements(graph, statements)
+        finally:
+            conn.close()
+        return self.count(graph)
+
+    def resolve(self, question: str, graph: Optional[str] = None, prefix: Optional[str] = None,
+                limit: int = 25, min_coverage: float = 1.0, min_question_coverage: float = 0.0) -> List[str]:
+        """Return the IRIs whose words appear in the question, best matches first
+
+        An IRI matches when at least min_coverage of its words are in the question; IRIs matching more of the
+        question's words rank first, so "SAP HANA hotspots" prefers SAP_HANA_Hotspots over SAP. IRIs whose
+        question words are all covered by a better match are left out. If the matches together cover less than
+        min_question_coverage of the question's words, nothing is returned, so a question that only mentions
+        a hub entity such as SAP next to unindexed words is answered by a generated query instead.
+        """
+        tokens = sorted(question_tokens(question))
+        if not tokens:
+            return []
+        sql = (f"SELECT w.iri, e.words, COUNT(*) FROM entity_words w JOIN entities e "
+               f"ON e.graph = w.graph AND e.iri = w.iri WHERE w.word IN ({','.join('?' * len(tokens))})")
+        params: List = list(tokens)
+        if graph is not None:
+            sql += " AND w.graph = ?"
+            params.append(graph)
+        if prefix:
+            sql += " AND w.iri >= ? AND w.iri < ?"
+            params += [prefix, prefix + "\uffff"]
+        sql += " GROUP BY w.graph, w.iri, e.words"
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        matches: Dict[str, Tuple[float, int]] = defaultdict(lambda: (0.0, 0))
+        for iri, words, matched in rows:
+            coverage = matched / words
+            if coverage >= min_coverage:
+                matches[iri] = max(matches[iri], (coverage, matched))
+        ranked = sorted(matches, key=lambda iri: (-matches[iri][1], -matches[iri][0], len(iri), iri))
+
+        selected: List[str] = []
+        covered: Set[str] = set()
+        selected_words: Set[frozenset] = set()
+        for iri in ranked:
+            words = entity_tokens(iri) & frozenset(tokens)
+            # Sap next to Sap_Hana_Hotspots would only add the triples of a hub entity; same-named IRIs stay
+            if words <= covered and words not in selected_words:
+                continue
+            selected.append(iri)
+            covered |= words
+            selected_words.add(words)
+        if len(covered) < min_question_coverage * len(tokens):
+            return []
+        return selected[:limit]
+
+    def clear(self, graph: str):
+        with self._lock:
+            self._db.execute("DELETE FROM entities WHERE graph = ?", (graph,))
+            self._db.execute("DELETE FROM entity_words WHERE graph = ?", (graph,))
+            self._db.execute("DELETE FROM entity_triples WHERE graph = ?", (graph,))
+            self._db.commit()
+            self._known = {key for key in self._known if key[0] != graph}
+
+    def count(self, graph: str) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM entities WHERE graph = ?", (graph,)).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+# Compare REGEX full-scan lookups with index-resolved VALUES queries on growing graphs
+if __name__ == "__main__":
+    import tempfile
+    import time
+    from functools import partial
+
+    from rdflib import URIRef
+    from rdflib.namespace import RDF
+
+    from hana_sparql_writer import SparqlBulkWriter
+    from local_sparql_standin import LocalSparqlEndpoint
+
+    base = "http://new_test_mission_faqhanahotspots.org/"
+    graph_name = f"{base}graph"
+    regex_query = (f'SELECT ?s ?p ?o WHERE {{ ?s ?p ?o . FILTER(REGEX(str(?s), "SAP_HANA_Hotspots", "i") || '
+                   f'REGEX(str(?o), "SAP_HANA_Hotspots", "i")) }}')
+    question = "What are SAP HANA Hotspots?"
+
+    with tempfile.TemporaryDirectory() as directory:
+        for size in (5000, 20000, 80000):
+            endpoint = LocalSparqlEndpoint()
+            index = EntityIndex(os.path.join(directory, f"entity_index_{size}.sqlite"))
+            triples = [(URIRef(f"{base}Sap_Hana_Hotspots"), RDF.type, URIRef(f"{base}Topic")),
+                       (URIRef(f"{base}Sap_Hana_Hotspots"), URIRef(f"{base}HAS_PART"), URIRef(f"{base}Savepoint"))]
+            triples += [(URIRef(f"{base}Concept_{i}"), URIRef(f"{base}RELATED_TO"), URIRef(f"{base}Topic_{i % 97}"))
+                        for i in range(size)]
+            graph = endpoint.dataset.graph(URIRef(graph_name))
+            for triple in index.add_triples(graph_name, triples):
+                graph.add(triple)
+
+            start = time.perf_counter()
+            regex_rows = endpoint.execute(regex_query, "")[0].count("<result>")
+            regex_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            iris = index.resolve(question, graph_name)
+            values_rows = endpoint.execute(build_values_query(iris, graph=graph_name), "")[0].count("<result>")
+            values_seconds = time.perf_counter() - start
+            print(f"{size} triples: REGEX scan {regex_rows} rows in {regex_seconds:.2f}s, "
+                  f"indexed VALUES {values_rows} rows in {values_seconds:.3f}s ({iris})")
+            index.close()
+
+        # Through the writer hook only accepted batches are indexed, and an IRI goes with its last triple
+        endpoint = LocalSparqlEndpoint()
+        index = EntityIndex(os.path.join(directory, "entity_index_hook.sqlite"))
+        writer = SparqlBulkWriter(endpoint.connect, graph_name=graph_name)
+        writer.on_batch = partial(index.batch_done, graph_name)
+        statements = [format_triple(URIRef(f"{base}Sap_Hana_Hotspots"), RDF.type, URIRef(f"{base}Topic")),
+                      format_triple(URIRef(f"{base}Sap_Hana_Hotspots"), URIRef(f"{base}HAS_PART"),
+                                    URIRef(f"{base}Savepoint"))]
+        writer.write_statements(statements)
+        print("Written:", index.resolve(question, graph_name))
+        for deleted in range(1, len(statements) + 1):
+            writer.delete_statements(statements[deleted - 1:deleted])
+            print(f"{deleted} of {len(statements)} triples deleted:", index.resolve(question, graph_name))
+        index.close()
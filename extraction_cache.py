@@ -0,0 +1,241 @@
+# Persistent, content-addressed cache for LLMGraphTransformer extraction results
+# Every chunk is keyed by the hash of its text, the model/deployment id and the transformer settings.
+# The extracted nodes and relationships are stored on disk in a SQLite file, so re-running an unchanged
+# SAP note makes no LLM calls and a note where a few pages changed only pays for the changed chunks.
+# Packed requests are looked up chunk by chunk: only the chunks that miss are packed into the LLM request and
+# the result is split back and cached per chunk, so a shifted packing boundary does not invalidate the cache.
+# The cache is bounded in size and evicts the least recently used entries first.
+#please make sure you install the following packages
+#!pip install langchain_experimental langchain_community tiktoken
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from langchain_community.graphs.graph_document import GraphDocument, Node, Relationship
+from langchain_core.documents import Document
+
+from chunk_packing import pack_parts, unpack_graph_documents
+
+# Bump when the serialized format changes so old entries are no longer used
+CACHE_FORMAT_VERSION = 1
+
+def transformer_settings(llm_transformer) -> Dict:
+    """Collect the LLMGraphTransformer settings that influence the extraction result"""
+    chain = getattr(llm_transformer, "chain", None)
+    return {
+        "allowed_nodes": list(getattr(llm_transformer, "allowed_nodes", []) or []),
+        "allowed_relationships": [list(r) if isinstance(r, tuple) else r
+                                  for r in getattr(llm_transformer, "allowed_relationships", []) or []],
+        "strict_mode": getattr(llm_transformer, "strict_mode", None),
+        "function_call": getattr(llm_transformer, "_function_call", None),
+        # The prompt carries node/relationship property settings and additional instructions
+        "prompt": repr(getattr(chain, "first", "")),
+    }
+
+def cache_key(text: str, model_id: str, settings: Dict) -> str:
+    """Build the content-addressed key for one chunk"""
+    text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    settings_json = json.dumps(settings, sort_keys=True, default=str)
+    raw = f"{CACHE_FORMAT_VERSION}\n{model_id}\n{settings_json}\n{text_hash}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def serialize_graph_documents(graph_documents: List[GraphDocument]) -> str:
+    """Serialize the nodes and relationships of extracted graph documents to JSON"""
+    def node_dict(node):
+        return {"id": node.id, "type": node.type, "properties": node.properties}
+
+    return json.dumps([
+        {
+            "nodes": [node_dict(node) for node in document.nodes],
+            "relationships": [
+                {
+                    "source": node_dict(rel.source),
+                    "target": node_dict(rel.target),
+                    "type": rel.type,
+                    "properties": rel.properties,
+                }
+                for rel in document.relationships
+            ],
+        }
+        for document in graph_documents
+    ], default=str)
+
+def deserialize_graph_documents(payload: str, source: Document) -> List[GraphDocument]:
+    """Rebuild graph documents from JSON, attaching the chunk they were extracted from"""
+    documents = []
+    for item in json.loads(payload):
+        nodes = [Node(**node) for node in item["nodes"]]
+        relationships = [
+            Relationship(source=Node(**rel["source"]), target=Node(**rel["target"]),
+                         type=rel["type"], properties=rel["properties"])
+            for rel in item["relationships"]
+        ]
+        documents.append(GraphDocument(nodes=nodes, relationships=relationships, source=source))
+    return documents
+
+class ExtractionCache:
+    """Size-bounded LRU cache of extraction results stored in a local SQLite file"""
+
+    def __init__(self, path: str = ".kge_cache/extractions.sqlite", max_bytes: int = 512 * 1024 * 1024):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path            # Location of the cache file
+        self.max_bytes = max_bytes  # Upper bound on the total size of stored payloads
+        self.hits = 0               # Lookups answered from the cache
+        self.misses = 0             # Lookups that needed an LLM call
+        self.evictions = 0          # Entries removed to stay under max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS extractions ("
+            "key TEXT PRIMARY KEY, payload TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS extractions_last_used ON extractions (last_used)")
+        self._db.commit()
+        self._total_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM extractions").fetchone()[0]
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the stored payload for a key, or None on a miss"""
+        with self._lock:
+            row = self._db.execute("SELECT payload FROM extractions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            # Refresh the entry so it is evicted last
+            self._db.execute("UPDATE extractions SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            return row[0]
+
+    def put(self, key: str, payload: str):
+        """Store a payload and evict the least recently used entries beyond max_bytes"""
+        size = len(payload.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._db.execute("SELECT size FROM extractions WHERE key = ?", (key,)).fetchone()
+            if old:
+                self._total_bytes -= old[0]
+            self._db.execute("INSERT OR REPLACE INTO extractions (key, payload, size, last_used) VALUES (?, ?, ?, ?)",
+                             (key, payload, size, time.time()))
+            self._total_bytes += size
+            self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        """Remove least recently used entries until the cache fits into max_bytes"""
+        while self._total_bytes > self.max_bytes:
+            rows = self._db.execute("SELECT key, size FROM extractions ORDER BY last_used LIMIT 100").fetchall()
+            if not rows:
+                self._total_bytes = 0
+                return
+            for key, size in rows:
+                self._db.execute("DELETE FROM extractions WHERE key = ?", (key,))
+                self._total_bytes -= size
+                self.evictions += 1
+                if self._total_bytes <= self.max_bytes:
+                    return
+
+    def clear(self):
+        """Remove every entry from the cache"""
+        with self._lock:
+            self._db.execute("DELETE FROM extractions")
+            self._db.commit()
+            self._total_bytes = 0
+
+    def stats(self) -> Dict:
+        """Return hit/miss counters and the current size of the cache"""
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM extractions").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": self._total_bytes,
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+class CachedGraphTransformer:
+    """Drop-in wrapper around LLMGraphTransformer that answers unchanged chunks from the cache"""
+
+    def __init__(self, llm_transformer, cache: ExtractionCache, model_id: str, settings: Optional[Dict] = None):
+        self.llm_transformer = llm_transformer  # Transformer used for cache misses
+        self.cache = cache                      # Persistent extraction cache
+        self.model_id = model_id                # Model or deployment id, part of the cache key
+        self.settings = settings if settings is not None else transformer_settings(llm_transformer)
+        self.llm_calls = 0                      # Number of chunks sent to the LLM
+        self._lock = threading.Lock()
+
+    def key_for(self, document: Document) -> str:
+        return cache_key(document.page_content, self.model_id, self.settings)
+
+    def _lookup(self, document: Document) -> Tuple[List[Document], List[Optional[List[GraphDocument]]]]:
+        """Return the chunks of a (possibly packed) request and the cached result of each, None for misses"""
+        # Packed requests are cached per chunk, so a shifted packing boundary does not invalidate the results
+        parts = getattr(document, "parts", None) or [document]
+        results = []
+        for part in parts:
+            payload = self.cache.get(self.key_for(part))
+            results.append(None if payload is None else deserialize_graph_documents(payload, part))
+        return parts, results
+
+    def _store(self, parts: List[Document], results: List, extracted: List[GraphDocument]):
+        """Split the extraction of the missing chunks by chunk and cache each under its own key"""
+        missing = [i for i, result in enumerate(results) if result is None]
+        by_source = defaultdict(list)
+        for graph_document in unpack_graph_documents(extracted):
+            by_source[id(graph_document.source)].append(graph_document)
+        for i in missing:
+            # A single missing chunk was sent on its own, so the whole result is its own
+            results[i] = by_source.get(id(parts[i]), []) if len(missing) > 1 else list(extracted)
+            self.cache.put(self.key_for(parts[i]), serialize_graph_documents(results[i]))
+
+    def _request(self, parts: List[Document], results: List) -> Document:
+        """Request document of only the chunks that missed the cache"""
+        missing = [part for part, result in zip(parts, results) if result is None]
+        with self._lock:
+            self.llm_calls += len(missing)
+        return pack_parts(missing)
+
+    def convert_to_graph_documents(self, documents: List[Document], config=None) -> List[GraphDocument]:
+        """Return graph documents for the chunks, calling the LLM only for chunks not in the cache"""
+        graph_documents = []
+        for document in documents:
+            parts, results = self._lookup(document)
+            if any(result is None for result in results):
+                # Extract each request separately, re-packed with only its missing chunks
+                extracted = self.llm_transformer.convert_to_graph_documents([self._request(parts, results)], config)
+                self._store(parts, results, extracted)
+            graph_documents.extend(graph_document for result in results for graph_document in result)
+        return graph_documents
+
+    async def aconvert_to_graph_documents(self, documents: List[Document], config=None) -> List[GraphDocument]:
+        """Async variant of convert_to_graph_documents using the transformer's async conversion path"""
+        graph_documents = []
+        for document in documents:
+            parts, results = self._lookup(document)
+            if any(result is None for result in results):
+                extracted = await self.llm_transformer.aconvert_to_graph_documents(
+                    [self._request(parts, results)], config)
+                self._store(parts, results, extracted)
+            graph_documents.extend(graph_document for result in results for graph_document in result)
+        return graph_documents
+
+def print_cache_stats(cache: ExtractionCache):
+    """Print a short summary of cache usage"""
+    stats = cache.stats()
+    print(f"Extraction cache: {stats['hits']} hits, {stats['misses']} misses "
+          f"({stats['hit_rate']:.0%} hit rate), {stats['entries']} entries, "
+          f"{stats['bytes'] / 1024:.0f} KB, {stats['evictions']} evictions.")
@@ -0,0 +1,328 @@
+# Shared pool of SAP HANA Cloud connections
+# The scenarios used to open one dbapi connection at import time and run every SPARQL_EXECUTE call on it, so
+# concurrent retrieval calls and ingestion workers either shared one session or each opened their own. The pool
+# keeps between min_size and max_size connections, hands out one connection per borrower, checks that an idle
+# connection is still alive before lending it (isconnected() and, after a quiet period, SELECT 1 FROM DUMMY),
+# replaces sessions the server dropped (e.g. TLS idle timeouts) and keeps statistics for every borrow.
+#please make sure you install the following packages
+#!pip install hdbcli
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Iterator, Optional
+
+from typing_extensions import TypedDict
+
+class PoolStats(TypedDict):
+    """Counters of a connection pool."""
+    size: int
+    idle: int
+    in_use: int
+    peak_in_use: int
+    created: int
+    reconnects: int
+    failed_checks: int
+    borrows: int
+    waits: int
+    timeouts: int
+    total_wait_seconds: float
+    max_wait_seconds: float
+    total_hold_seconds: float
+    max_hold_seconds: float
+
+def _is_connected(conn) -> bool:
+    """Ask the driver whether the session is still open; drivers without isconnected() are assumed open"""
+    check = getattr(conn, "isconnected", None)
+    if check is None:
+        return True
+    try:
+        return bool(check())
+    except Exception:
+        return False
+
+class PooledConnection:
+    """Connection borrowed from a HanaConnectionPool; close() returns it to the pool instead of closing it"""
+
+    def __init__(self, pool: "HanaConnectionPool", raw):
+        self.raw = raw              # Underlying dbapi connection
+        self.broken = False         # Set when the session must not be lent out again
+        self.suspect = False        # Set after a failed call; the next borrower pings the session first
+        self.last_used = time.monotonic()
+        self._pool = pool
+        self._borrowed_at: Optional[float] = None
+
+    def cursor(self):
+        return self.raw.cursor()
+
+    def invalidate(self):
+        """Discard this session when it is returned, e.g. after a failed call"""
+        self.broken = True
+
+    def close(self):
+        """Return the connection to the pool"""
+        self._pool._release(self)
+
+    def __getattr__(self, name):
+        # commit(), rollback(), isconnected() and the rest go to the dbapi connection
+        return getattr(self.raw, name)
+
+    def __enter__(self) -> "PooledConnection":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.suspect = True
+        self.close()
+
+class HanaConnectionPool:
+    """Thread-safe pool of dbapi connections with liveness checks, reconnects and borrow statistics"""
+
+    def __init__(self, connect: Callable[[], object], min_size: int = 1, max_size: int = 4,
+                 timeout: float = 30.0, ping_interval: float = 60.0, max_idle: float = 300.0,
+                 ping_query: str = "SELECT 1 FROM DUMMY"):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Pool sizes must satisfy 0 <= min_size <= max_size and max_size >= 1")
+        self._connect = connect            # Factory returning a new dbapi connection
+        self.min_size = min_size           # Connections kept open even when idle
+        self.max_size = max_size           # Upper bound on open connections
+        self.timeout = timeout             # Seconds a borrower waits for a free connection
+        self.ping_interval = ping_interval  # Ping connections idle longer than this before lending them
+        self.max_idle = max_idle           # Close connections above min_size that were idle this long
+        self.ping_query = ping_query       # Cheap statement used as the liveness probe
+        self._idle: Deque[PooledConnection] = deque()
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._stats = PoolStats(size=0, idle=0, in_use=0, peak_in_use=0, created=0, reconnects=0,
+                                failed_checks=0, borrows=0, waits=0, timeouts=0, total_wait_seconds=0.0,
+                                max_wait_seconds=0.0, total_hold_seconds=0.0, max_hold_seconds=0.0)
+        # Open the minimum number of connections up front, as the scenarios did at import time
+        for _ in range(min_size):
+            self._size += 1
+            self._idle.append(self._open())
+
+    def _open(self) -> PooledConnection:
+        try:
+            raw = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._stats["created"] += 1
+        return PooledConnection(self, raw)
+
+    def _is_alive(self, pooled: PooledConnection) -> bool:
+        """Check a connection before lending it out"""
+        if not _is_connected(pooled.raw):
+            return False
+        if not pooled.suspect and time.monotonic() - pooled.last_used < self.ping_interval:
+            return True
+        cursor = None
+        try:
+            cursor = pooled.raw.cursor()
+            cursor.execute(self.ping_query)
+            cursor.fetchall()
+            pooled.suspect = False
+            return True
+        except Exception:
+            return False
+        finally:
+            if cursor is not None:
+                try:
+                    cursor.close()
+                except Exception:
+                    pass
+
+    def connect(self) -> PooledConnection:
+        """Borrow a live connection, waiting up to `timeout` seconds when all of them are in use"""
+        start = time.monotonic()
+        waited = False
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Connection pool is closed")
+                if self._idle:
+                    # Most recently used first, so hot sessions rarely need a ping
+                    pooled = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    pooled = None
+                    break
+                remaining = self.timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise TimeoutError(f"No HANA connection available within {self.timeout}s "
+                                       f"({self.max_size} in use)")
+                waited = True
+                self._cond.wait(remaining)
+
+        if pooled is not None and not self._is_alive(pooled):
+            # The server dropped the session; reuse its slot for a fresh connection
+            self._discard(pooled.raw)
+            with self._cond:
+                self._stats["failed_checks"] += 1
+                self._stats["reconnects"] += 1
+            pooled = None
+        if pooled is None:
+            pooled = self._open()
+
+        wait_seconds = time.monotonic() - start
+        with self._cond:
+            stats = self._stats
+            stats["borrows"] += 1
+            stats["waits"] += waited
+            stats["total_wait_seconds"] += wait_seconds
+            stats["max_wait_seconds"] = max(stats["max_wait_seconds"], wait_seconds)
+            in_use = self._size - len(self._idle)
+            stats["peak_in_use"] = max(stats["peak_in_use"], in_use)
+        pooled.broken = False
+        pooled._borrowed_at = time.monotonic()
+        return pooled
+
+    def _release(self, pooled: PooledConnection):
+        if pooled._borrowed_at is None:
+            return  # Already returned
+        now = time.monotonic()
+        hold_seconds = now - pooled._borrowed_at
+        pooled._borrowed_at = None
+        pooled.last_used = now
+        discard = pooled.broken or not _is_connected(pooled.raw)
+        stale = []
+        with self._cond:
+            self._stats["total_hold_seconds"] += hold_seconds
+            self._stats["max_hold_seconds"] = max(self._stats["max_hold_seconds"], hold_seconds)
+            if discard or self._closed:
+                self._size -= 1
+            else:
+                self._idle.append(pooled)
+            # Trim connections above the minimum that have not been used for a while (oldest are on the left)
+            while self._size > self.min_size and self._idle and now - self._idle[0].last_used > self.max_idle:
+                stale.append(self._idle.popleft())
+                self._size -= 1
+            self._cond.notify()
+        if discard or self._closed:
+            self._discard(pooled.raw)
+        for old in stale:
+            self._discard(old.raw)
+
+    @staticmethod
+    def _discard(raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def connection(self) -> Iterator[PooledConnection]:
+        """Borrow a connection for the duration of a with block"""
+        with self.connect() as pooled:
+            yield pooled
+
+    def callproc(self, name: str, params: tuple) -> tuple:
+        """Run one stored procedure call on a borrowed connection, retrying once if the session was dropped"""
+        for attempt in (1, 2):
+            pooled = self.connect()
+            cursor = None
+            try:
+                cursor = pooled.cursor()
+                return cursor.callproc(name, params)
+            except Exception:
+                if _is_connected(pooled.raw):
+                    # Probably a bad request rather than a bad session; ping before the next borrow
+                    pooled.suspect = True
+                    raise
+                pooled.invalidate()
+                with self._cond:
+                    self._stats["reconnects"] += 1
+                if attempt == 2:
+                    raise
+            finally:
+                if cursor is not None:
+                    try:
+                        cursor.close()
+                    except Exception:
+                        pass
+                pooled.close()
+
+    def stats(self) -> PoolStats:
+        """Return a snapshot of the pool counters"""
+        with self._cond:
+            stats = PoolStats(**self._stats)
+            stats["size"] = self._size
+            stats["idle"] = len(self._idle)
+            stats["in_use"] = self._size - len(self._idle)
+        return stats
+
+    def close(self):
+        """Close idle connections; borrowed ones are closed when they are returned"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for pooled in idle:
+            self._discard(pooled.raw)
+
+def print_pool_stats(pool: HanaConnectionPool):
+    """Print a short summary of the pool counters"""
+    stats = pool.stats()
+    average_wait = stats["total_wait_seconds"] / stats["borrows"] if stats["borrows"] else 0.0
+    average_hold = stats["total_hold_seconds"] / stats["borrows"] if stats["borrows"] else 0.0
+    print(f"Connection pool: {stats['size']} open ({stats['in_use']} in use, peak {stats['peak_in_use']}), "
+          f"{stats['created']} created, {stats['reconnects']} reconnects; {stats['borrows']} borrows, "
+          f"{stats['waits']} waited (avg {average_wait * 1000:.1f} ms, max {stats['max_wait_seconds'] * 1000:.1f} ms), "
+          f"avg hold {average_hold * 1000:.1f} ms, {stats['timeouts']} timeouts.")
+
+# Run concurrent retrieval calls against the in-memory SPARQL_EXECUTE stand-in, then drop every session
+if __name__ == "__main__":
+    from concurrent.futures import ThreadPoolExecutor
+
+    from rdflib import Literal, URIRef
+
+    from hana_sparql_writer import SparqlBulkWriter, print_report
+    from local_sparql_standin import LocalSparqlEndpoint
+
+    base = "http://new_test_mission_faqhanahotspots.org/"
+    query = f"SELECT ?s ?p ?o WHERE {{ ?s ?p ?o . FILTER(STRSTARTS(STR(?s), \"{base}Entity_1\")) }} LIMIT 20"
+    headers = "Metadata headers describing Input and/or Output"
+
+    endpoint = LocalSparqlEndpoint(latency=0.05)
+    pool = HanaConnectionPool(endpoint.connect, min_size=1, max_size=4)
+
+    # The ingestion writers borrow their worker connections from the same pool
+    writer = SparqlBulkWriter(pool.connect, max_triples_per_batch=500, max_connections=4)
+    print_report(writer.write((URIRef(f"{base}Entity_{i}"), URIRef(f"{base}label"), Literal(f"Entity {i}"))
+                              for i in range(2000)))
+
+    # Baseline: one global connection shared by every caller, serialized because a session runs one call at a time
+    shared = endpoint.connect()
+    shared_lock = threading.Lock()
+
+    def shared_call(_):
+        with shared_lock:
+            cursor = shared.cursor()
+            try:
+                return cursor.callproc('SPARQL_EXECUTE', (query, headers, '?', None))
+            finally:
+                cursor.close()
+
+    def pooled_call(_):
+        return pool.callproc('SPARQL_EXECUTE', (query, headers, '?', None))
+
+    for name, call in (("One shared connection", shared_call), ("Connection pool (max 4)", pooled_call)):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(call, range(40)))
+        print(f"{name}: 40 concurrent SPARQL calls in {time.perf_counter() - start:.2f}s")
+
+    # The server drops every open session; the pool notices and reconnects instead of failing the calls
+    endpoint.drop_connections()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(pooled_call, range(40)))
+    print("After the server dropped every session: 40 calls succeeded")
+    print_pool_stats(pool)
+    pool.close()
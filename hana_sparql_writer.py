@@ -0,0 +1,330 @@
+# Bulk writer for ingesting RDF triples into SAP HANA Cloud through SPARQL_EXECUTE
+# Instead of joining every triple into one huge INSERT DATA statement, the writer splits the triples
+# into batches bounded by triple count and byte size, spreads the batches over several HANA connections,
+# retries only the batches that fail and reports the achieved triples per second.
+# NTriplesBulkLoader sends the same batches as N-Triples segments through the rqx-load bulk-load protocol
+# (as Scenario 6 does for its TTL file), which skips the SPARQL parser on the database side.
+#please make sure you install the following packages
+#!pip install hdbcli rdflib
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+from typing_extensions import TypedDict
+
+from triple_store import to_ntriples_term
+
+# Request headers used for SPARQL update statements sent to SPARQL_EXECUTE
+SPARQL_UPDATE_HEADERS = "Accept: application/sparql-results+xml Content-Type: application/sparql-query"
+
+# Separator placed between triples inside an INSERT DATA block
+TRIPLE_SEPARATOR = " .\n    "
+
+# Separator placed between triples of an N-Triples bulk-load segment
+NTRIPLES_SEPARATOR = " .\n"
+
+class BatchResult(TypedDict):
+    """Outcome of a single INSERT DATA batch."""
+    batch_id: int
+    operation: str
+    triples: int
+    attempts: int
+    error: Optional[str]
+    statements: List[str]
+
+class BulkWriteReport(TypedDict):
+    """Summary of a bulk write run."""
+    batches: int
+    triples_written: int
+    triples_failed: int
+    retried_batches: int
+    failed_batches: List[BatchResult]
+    elapsed_seconds: float
+    triples_per_second: float
+
+def format_triple(s, p, o) -> str:
+    """Format a (subject, predicate, object) tuple as an N-Triples/SPARQL triple"""
+    # rdflib Literals become quoted, escaped strings; URIs and plain strings are wrapped in angle brackets
+    return f"{to_ntriples_term(s)} {to_ntriples_term(p)} {to_ntriples_term(o)}"
+
+def build_insert_query(statements: List[str], graph_name: Optional[str] = None, operation: str = "INSERT") -> str:
+    """Wrap formatted triples into one SPARQL INSERT DATA (or DELETE DATA) statement, optionally scoped to a named graph"""
+    triples_str = TRIPLE_SEPARATOR.join(statements) + " ."
+    if graph_name:
+        return f"{operation} DATA {{ GRAPH <{graph_name}> {{ \n    {triples_str} \n}} }}"
+    return f"{operation} DATA {{ \n    {triples_str} \n}}"
+
+def build_load_headers(graph_name: Optional[str] = None, filename: str = "triples.nt") -> str:
+    """Build the rqx-load protocol headers; the file extension tells HANA the RDF format"""
+    headers = "rqx-load-protocol: true\r\n"
+    headers += f"rqx-load-filename: {filename}\r\n"
+    if graph_name:
+        # Without a graph name the data is loaded into the internal default graph
+        headers += f"rqx-load-graphname: {graph_name}\r\n"
+    return headers
+
+def build_ntriples_document(statements: List[str]) -> str:
+    """Join formatted triples into an N-Triples document"""
+    return NTRIPLES_SEPARATOR.join(statements) + " .\n"
+
+def chain_batch_hooks(*hooks: Optional[Callable[[BatchResult, List[str]], None]]
+                      ) -> Callable[[BatchResult, List[str]], None]:
+    """Combine on_batch hooks into one that calls each of them in order"""
+    hooks = [hook for hook in hooks if hook is not None]
+
+    def on_batch(result: BatchResult, statements: List[str]):
+        for hook in hooks:
+            hook(result, statements)
+
+    return on_batch
+
+def iter_batches(statements: Iterable[str], max_triples: int, max_bytes: int) -> Iterator[List[str]]:
+    """Group formatted triples into batches bounded by triple count and UTF-8 byte size"""
+    batch = []
+    batch_bytes = 0
+    separator_bytes = len(TRIPLE_SEPARATOR)
+    for statement in statements:
+        statement_bytes = len(statement.encode("utf-8")) + separator_bytes
+        # Close the current batch if adding this triple would exceed either limit
+        if batch and (len(batch) >= max_triples or batch_bytes + statement_bytes > max_bytes):
+            yield batch
+            batch = []
+            batch_bytes = 0
+        batch.append(statement)
+        batch_bytes += statement_bytes
+    if batch:
+        yield batch
+
+class SparqlBulkWriter:
+    """Write triples to SAP HANA Cloud in bounded batches over a set of parallel connections"""
+
+    def __init__(self, connect: Callable[[], object], max_triples_per_batch: int = 5000,
+                 max_bytes_per_batch: int = 2 * 1024 * 1024, max_connections: int = 4,
+                 max_retries: int = 3, retry_backoff: float = 0.5, graph_name: Optional[str] = None,
+                 headers: str = SPARQL_UPDATE_HEADERS):
+        if max_triples_per_batch < 1 or max_bytes_per_batch < 1 or max_connections < 1:
+            raise ValueError("Batch limits and connection count must be positive")
+        self.connect = connect                              # Factory returning a dbapi connection (or pool.connect)
+        self.max_triples_per_batch = max_triples_per_batch  # Upper bound on triples per INSERT DATA
+        self.max_bytes_per_batch = max_bytes_per_batch      # Upper bound on statement size in bytes
+        self.max_connections = max_connections              # Number of parallel HANA connections
+        self.max_retries = max_retries                      # Retries per batch after the first attempt
+        self.retry_backoff = retry_backoff                  # Base delay for exponential backoff in seconds
+        self.graph_name = graph_name                        # Optional named graph to insert into
+        self.headers = headers                              # Request headers passed to SPARQL_EXECUTE
+        # Optional hook called from the worker threads with the result and statements of every finished batch
+        self.on_batch: Optional[Callable[[BatchResult, List[str]], None]] = None
+        # Optional sparql_cache.GraphVersions; every run that changed the graph bumps its version stamp
+        self.graph_versions = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def write(self, triples: Iterable[Tuple[str, str, str]]) -> BulkWriteReport:
+        """Write (subject, predicate, object) tuples and return a report of the run"""
+        return self.write_statements(format_triple(s, p, o) for s, p, o in triples)
+
+    def write_statements(self, statements: Iterable[str]) -> BulkWriteReport:
+        """Write already formatted triples and return a report of the run"""
+        return self._run(iter_batches(statements, self.max_triples_per_batch, self.max_bytes_per_batch))
+
+    def delete_statements(self, statements: Iterable[str]) -> BulkWriteReport:
+        """Remove already formatted triples with DELETE DATA batches and return a report of the run"""
+        return self._run(iter_batches(statements, self.max_triples_per_batch, self.max_bytes_per_batch),
+                         operation="DELETE")
+
+    def retry_failed(self, report: BulkWriteReport) -> BulkWriteReport:
+        """Resend only the batches that failed in an earlier run"""
+        failed = report["failed_batches"]
+        # Every batch of one run uses the same operation
+        operation = failed[0]["operation"] if failed else "INSERT"
+        return self._run((batch["statements"] for batch in failed), operation)
+
+    def _run(self, batches: Iterable[List[str]], operation: str = "INSERT") -> BulkWriteReport:
+        report = BulkWriteReport(batches=0, triples_written=0, triples_failed=0, retried_batches=0,
+                                 failed_batches=[], elapsed_seconds=0.0, triples_per_second=0.0)
+        start = time.perf_counter()
+        # Keep a bounded number of batches in flight so the input can be a lazy generator
+        max_in_flight = self.max_connections * 2
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_connections) as executor:
+                pending = set()
+                for batch_id, batch in enumerate(batches):
+                    pending.add(executor.submit(self._write_batch, batch_id, batch, operation))
+                    if len(pending) >= max_in_flight:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        self._collect(done, report)
+                done, _ = wait(pending)
+                self._collect(done, report)
+        finally:
+            self._close_connections()
+            if self.graph_versions is not None and report["triples_written"]:
+                # Cached query results of the old graph are no longer valid
+                self.graph_versions.bump(self.graph_name)
+
+        report["elapsed_seconds"] = time.perf_counter() - start
+        if report["elapsed_seconds"] > 0:
+            report["triples_per_second"] = report["triples_written"] / report["elapsed_seconds"]
+        return report
+
+    def _collect(self, futures, report: BulkWriteReport):
+        """Fold finished batch results into the run report"""
+        for future in futures:
+            result = future.result()
+            report["batches"] += 1
+            if result["attempts"] > 1:
+                report["retried_batches"] += 1
+            if result["error"] is None:
+                report["triples_written"] += result["triples"]
+            else:
+                report["triples_failed"] += result["triples"]
+                report["failed_batches"].append(result)
+
+    def _write_batch(self, batch_id: int, statements: List[str], operation: str = "INSERT") -> BatchResult:
+        """Send one batch, retrying with a fresh connection and exponential backoff on failure"""
+        request, headers = self._build_request(batch_id, statements, operation)
+        error = None
+        attempts = 0
+        written = False
+        while attempts <= self.max_retries and not written:
+            attempts += 1
+            cursor = None
+            try:
+                cursor = self._connection().cursor()
+                cursor.callproc('SPARQL_EXECUTE', (request, headers, '?', None))
+                written = True
+            except Exception as e:
+                error = str(e)
+                # A failed call may have left the session unusable, so reconnect before retrying
+                self._reset_connection()
+                if attempts <= self.max_retries:
+                    time.sleep(self.retry_backoff * (2 ** (attempts - 1)))
+            finally:
+                if cursor is not None:
+                    try:
+                        cursor.close()
+                    except Exception:
+                        pass
+
+        if written:
+            result = BatchResult(batch_id=batch_id, operation=operation, triples=len(statements),
+                                 attempts=attempts, error=None, statements=[])
+        else:
+            print(f"Error inserting batch {batch_id} after {attempts} attempts: {error}")
+            result = BatchResult(batch_id=batch_id, operation=operation, triples=len(statements),
+                                 attempts=attempts, error=error, statements=statements)
+        # Called once the batch is settled, so a failing hook neither resends a written batch nor counts as a
+        # database error; its exception reaches the caller of the write
+        if self.on_batch is not None:
+            self.on_batch(result, statements)
+        return result
+
+    def _build_request(self, batch_id: int, statements: List[str], operation: str = "INSERT") -> Tuple[str, str]:
+        """Return the SPARQL_EXECUTE request and headers for one batch"""
+        return build_insert_query(statements, self.graph_name, operation), self.headers
+
+    def _connection(self):
+        """Return the connection owned by the current worker thread, opening it on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self.connect()
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _reset_connection(self):
+        """Drop the current worker thread's connection so the next attempt reconnects"""
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is None:
+            return
+        # Pooled connections are discarded by the pool instead of being lent out again
+        invalidate = getattr(conn, "invalidate", None)
+        if invalidate is not None:
+            invalidate()
+        with self._lock:
+            if conn in self._connections:
+                self._connections.remove(conn)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _close_connections(self):
+        """Close every connection opened by the worker threads"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+class NTriplesBulkLoader(SparqlBulkWriter):
+    """Write triples as fixed-size N-Triples segments through the rqx-load bulk-load protocol"""
+
+    def __init__(self, connect: Callable[[], object], segment_size: int = 50000,
+                 max_bytes_per_segment: int = 16 * 1024 * 1024, max_connections: int = 4,
+                 max_retries: int = 3, retry_backoff: float = 0.5, graph_name: Optional[str] = None):
+        super().__init__(connect, max_triples_per_batch=segment_size, max_bytes_per_batch=max_bytes_per_segment,
+                         max_connections=max_connections, max_retries=max_retries,
+                         retry_backoff=retry_backoff, graph_name=graph_name)
+
+    def _build_request(self, batch_id: int, statements: List[str], operation: str = "INSERT") -> Tuple[str, str]:
+        if operation != "INSERT":
+            # The bulk-load protocol only adds data; deletes go through DELETE DATA
+            return super()._build_request(batch_id, statements, operation)
+        return build_ntriples_document(statements), build_load_headers(self.graph_name, f"segment_{batch_id:06d}.nt")
+
+def print_report(report: BulkWriteReport):
+    """Print a short summary of a bulk write run"""
+    print(f"Inserted {report['triples_written']} triples in {report['batches']} batches "
+          f"({report['elapsed_seconds']:.2f}s, {report['triples_per_second']:.0f} triples/s).")
+    if report["retried_batches"]:
+        print(f"{report['retried_batches']} batches needed a retry.")
+    if report["failed_batches"]:
+        print(f"{len(report['failed_batches'])} batches ({report['triples_failed']} triples) failed "
+              f"and can be resent with retry_failed().")
+
+# Run a local check of the writer against the in-memory SPARQL_EXECUTE stand-in
+if __name__ == "__main__":
+    from rdflib import Literal, URIRef
+
+    from local_sparql_standin import LocalSparqlEndpoint
+
+    # Generate a synthetic set of triples similar to the extracted SAP note graphs
+    base = "http://new_test_mission_faqhanahotspots.org/"
+    sample = [(f"{base}Entity_{i}", f"{base}RELATED_TO", f"{base}Entity_{i + 1}") for i in range(20000)]
+
+    # Single statement, single connection: the behaviour of the original scenarios
+    endpoint = LocalSparqlEndpoint(per_kb_latency=0.002)
+    single = SparqlBulkWriter(endpoint.connect, max_triples_per_batch=len(sample),
+                              max_bytes_per_batch=1 << 40, max_connections=1)
+    print_report(single.write(sample))
+
+    # Batched writes over four connections with injected failures
+    endpoint = LocalSparqlEndpoint(per_kb_latency=0.002, fail_rate=0.1, seed=7)
+    batched = SparqlBulkWriter(endpoint.connect, max_triples_per_batch=1000, max_connections=4,
+                               max_retries=5, retry_backoff=0.01)
+    print_report(batched.write(sample))
+    print(f"Stand-in holds {len(endpoint)} triples after {endpoint.calls} calls ({endpoint.failures} failures).")
+
+    # INSERT DATA versus N-Triples bulk load into a named graph, with literals that need escaping
+    graph = f"{base}graph"
+    large = []
+    for i in range(100000):
+        large.append((URIRef(f"{base}Entity_{i}"), URIRef(f"{base}RELATED_TO"), URIRef(f"{base}Entity_{i + 1}")))
+        large.append((URIRef(f"{base}Entity_{i}"), URIRef(f"{base}description"),
+                      Literal(f'Entity "{i}" of note 2000002\nsee <table {i % 10}>')))
+    for name, writer_class, options in [
+        ("INSERT DATA", SparqlBulkWriter, dict(max_triples_per_batch=5000)),
+        ("rqx-load N-Triples", NTriplesBulkLoader, dict(segment_size=50000)),
+    ]:
+        endpoint = LocalSparqlEndpoint(latency=0.05, per_kb_latency=0.0005)
+        writer = writer_class(endpoint.connect, max_connections=4, graph_name=graph, **options)
+        report = writer.write(large)
+        print(f"{name}: {report['triples_written']} triples in {report['batches']} requests, "
+              f"{report['elapsed_seconds']:.2f}s ({report['triples_per_second']:.0f} triples/s), "
+              f"{endpoint.bytes_received / 2**20:.1f} MB sent, stand-in holds {len(endpoint)} triples")
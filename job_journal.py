@@ -0,0 +1,222 @@
+# Durable job journal for long extraction and ingestion runs
+# The journal records the status of every chunk (extracted, committed or failed with its error) and of every
+# insert batch in a local SQLite file. A chunk counts as committed once all of its triples are in batches
+# that SAP HANA Cloud accepted. If the interpreter dies partway through a run, the next run of the same job
+# skips every committed chunk and only processes the chunks that failed or were still in flight, so a
+# restart takes seconds instead of repeating the whole ingestion. A job that finished cleanly starts fresh.
+#please make sure you install the following packages
+#!pip install langchain_core
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from langchain_core.documents import Document
+
+from hana_sparql_writer import BatchResult, format_triple
+
+def chunk_key(chunk) -> str:
+    """Stable key of a chunk (or packed request) from its source, page and text"""
+    metadata = chunk.metadata
+    raw = f"{metadata.get('source', '')}\n{metadata.get('page', '')}\n{chunk.page_content}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+class JobJournal:
+    """Per-chunk extraction and per-batch insert status of one job, stored in a local SQLite file"""
+
+    def __init__(self, job_id: str, path: str = ".kge_cache/journal.sqlite"):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.job_id = job_id  # Identifies the job, e.g. the graph and the corpus being ingested
+        self.path = path      # Location of the journal file
+        self.resumed = False  # True if this run continues an interrupted or failed run
+        self.run = 0          # Number of the current run of this job
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " job TEXT PRIMARY KEY, status TEXT NOT NULL, runs INTEGER NOT NULL, started REAL, updated REAL);"
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " job TEXT NOT NULL, key TEXT NOT NULL, status TEXT NOT NULL, attempts INTEGER NOT NULL,"
+            " triples INTEGER, error TEXT, document TEXT, updated REAL, PRIMARY KEY (job, key)) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS batches ("
+            " job TEXT NOT NULL, run INTEGER NOT NULL, batch INTEGER NOT NULL, operation TEXT NOT NULL,"
+            " status TEXT NOT NULL, attempts INTEGER, triples INTEGER, error TEXT, updated REAL,"
+            " PRIMARY KEY (job, run, operation, batch)) WITHOUT ROWID;"
+        )
+        self._db.commit()
+        self._committed: Set[str] = set()
+        # Triples of queued chunks that are not in an accepted batch yet
+        self._outstanding: Dict[str, Set[str]] = {}
+        self._owners: Dict[str, List[str]] = defaultdict(list)
+
+    def begin(self) -> bool:
+        """Start a run of the job, resuming it if the previous run did not complete"""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT status, runs FROM jobs WHERE job = ?", (self.job_id,)).fetchone()
+            self.resumed = row is not None and row[0] != "complete"
+            if not self.resumed:
+                # A finished (or new) job starts from scratch
+                self._db.execute("DELETE FROM chunks WHERE job = ?", (self.job_id,))
+                self._db.execute("DELETE FROM batches WHERE job = ?", (self.job_id,))
+            self.run = (row[1] if row else 0) + 1
+            self._db.execute("INSERT OR REPLACE INTO jobs (job, status, runs, started, updated) VALUES (?, ?, ?, ?, ?)",
+                             (self.job_id, "running", self.run, now, now))
+            self._db.commit()
+            self._committed = {r[0] for r in self._db.execute(
+                "SELECT key FROM chunks WHERE job = ? AND status = 'committed'", (self.job_id,))}
+            self._outstanding.clear()
+            self._owners.clear()
+        if self.resumed:
+            print(f"Resuming job {self.job_id} (run {self.run}): {len(self._committed)} chunks already committed.")
+        return self.resumed
+
+    def is_committed(self, key: str) -> bool:
+        return key in self._committed
+
+    def _set_chunk(self, key: str, status: str, triples: Optional[int] = None, error: Optional[str] = None,
+                   document: Optional[str] = None):
+        self._db.execute(
+            "INSERT INTO chunks (job, key, status, attempts, triples, error, document, updated)"
+            " VALUES (?, ?, ?, 1, ?, ?, ?, ?)"
+            " ON CONFLICT (job, key) DO UPDATE SET status = excluded.status, attempts = chunks.attempts"
+            " + (excluded.status != 'committed'), triples = COALESCE(excluded.triples, chunks.triples),"
+            " error = excluded.error, document = excluded.document, updated = excluded.updated",
+            (self.job_id, key, status, triples, error, document, time.time()))
+
+    def chunk_failed(self, chunk, error: Exception):
+        """Record a chunk whose extraction failed, keeping its text for a later retry"""
+        document = json.dumps({"page_content": chunk.page_content, "metadata": chunk.metadata}, default=str)
+        with self._lock:
+            self._set_chunk(chunk_key(chunk), "failed", error=str(error), document=document)
+            self._db.commit()
+
+    def chunk_extracted(self, key: str, triples: Iterable[Tuple]):
+        """Record a chunk whose triples were queued; it is committed once all of them are written"""
+        statements = {format_triple(s, p, o) for s, p, o in triples}
+        with self._lock:
+            if statements:
+                self._set_chunk(key, "extracted", triples=len(statements))
+                self._outstanding[key] = statements
+                for statement in statements:
+                    self._owners[statement].append(key)
+            else:
+                # Nothing new to write for this chunk
+                self._set_chunk(key, "committed", triples=0)
+                self._committed.add(key)
+            self._db.commit()
+
+    def batch_done(self, result: BatchResult, statements: List[str]):
+        """Writer hook: record the batch and commit the chunks whose triples are now all written"""
+        now = time.time()
+        with self._lock:
+            if result["batch_id"] >= 0:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO batches (job, run, batch, operation, status, attempts, triples, error,"
+                    " updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (self.job_id, self.run, result["batch_id"], result["operation"],
+                     "failed" if result["error"] else "written", result["attempts"], result["triples"],
+                     result["error"], now))
+            if result["error"] is None and result["operation"] in ("INSERT", "UNCHANGED"):
+                for statement in statements:
+                    for key in self._owners.pop(statement, ()):
+                        outstanding = self._outstanding.get(key)
+                        if outstanding is None:
+                            continue
+                        outstanding.discard(statement)
+                        if not outstanding:
+                            del self._outstanding[key]
+                            self._set_chunk(key, "committed")
+                            self._committed.add(key)
+            self._db.commit()
+
+    def finish(self, complete: bool):
+        """Close the run; an incomplete job is resumed by the next run"""
+        with self._lock:
+            complete = complete and not self._outstanding
+            self._db.execute("UPDATE jobs SET status = ?, updated = ? WHERE job = ?",
+                             ("complete" if complete else "incomplete", time.time(), self.job_id))
+            self._db.commit()
+
+    def failed_chunks(self) -> List[Document]:
+        """Return the chunks whose extraction failed and has not succeeded since"""
+        with self._lock:
+            rows = self._db.execute("SELECT document FROM chunks WHERE job = ? AND status = 'failed'",
+                                    (self.job_id,)).fetchall()
+        return [Document(**json.loads(row[0])) for row in rows if row[0]]
+
+    def stats(self) -> Dict:
+        """Return chunk and batch counts by status"""
+        with self._lock:
+            chunks = dict(self._db.execute("SELECT status, COUNT(*) FROM chunks WHERE job = ? GROUP BY status",
+                                           (self.job_id,)).fetchall())
+            batches = dict(self._db.execute("SELECT status, COUNT(*) FROM batches WHERE job = ? AND run = ?"
+                                            " GROUP BY status", (self.job_id, self.run)).fetchall())
+        return {"run": self.run, "resumed": self.resumed, "chunks": chunks, "batches": batches}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+def print_journal_stats(journal: JobJournal):
+    """Print a short summary of the job journal"""
+    stats = journal.stats()
+    chunks, batches = stats["chunks"], stats["batches"]
+    print(f"Job journal (run {stats['run']}{', resumed' if stats['resumed'] else ''}): "
+          f"{chunks.get('committed', 0)} chunks committed, {chunks.get('extracted', 0)} in flight, "
+          f"{chunks.get('failed', 0)} failed; {batches.get('written', 0)} batches written, "
+          f"{batches.get('failed', 0)} failed.")
+
+# Interrupt an ingestion with failing batches and chunks, then resume it against the in-memory stand-in
+if __name__ == "__main__":
+    import tempfile
+    from types import SimpleNamespace
+
+    from rdflib import Namespace
+
+    from hana_sparql_writer import SparqlBulkWriter
+    from kge_pipeline import StreamingIngestionPipeline, graph_document_to_triples, print_pipeline_report
+    from local_sparql_standin import LocalSparqlEndpoint
+
+    EX = Namespace("http://new_test_mission_faqhanahotspots.org/")
+
+    class FlakyTransformer:
+        """Stand-in for LLMGraphTransformer that sleeps like an LLM call and fails on a few chunks once"""
+        def __init__(self):
+            self.calls = 0
+            self.failed = set()
+
+        def convert_to_graph_documents(self, chunks):
+            self.calls += 1
+            time.sleep(0.05)
+            text = chunks[0].page_content
+            if text.endswith("7") and text not in self.failed:
+                self.failed.add(text)
+                raise RuntimeError("429 Too Many Requests")
+            nodes = [SimpleNamespace(id=f"{text}_Entity_{i}", type="Concept", properties={}) for i in range(20)]
+            relationships = [SimpleNamespace(source=a, target=b, type="RELATED_TO") for a, b in zip(nodes, nodes[1:])]
+            return [SimpleNamespace(nodes=nodes, relationships=relationships)]
+
+    sample_chunks = [Document(page_content=f"Chunk{i}", metadata={"source": "note.pdf", "page": i // 4})
+                     for i in range(80)]
+    transformer = FlakyTransformer()
+    endpoint = LocalSparqlEndpoint(fail_rate=0.2, seed=3)
+
+    with tempfile.TemporaryDirectory() as directory:
+        journal = JobJournal("demo", os.path.join(directory, "journal.sqlite"))
+        for attempt in (1, 2, 3):
+            writer = SparqlBulkWriter(endpoint.connect, max_triples_per_batch=200, max_connections=2, max_retries=0)
+            pipeline = StreamingIngestionPipeline(transformer, writer,
+                                                  lambda document: graph_document_to_triples(document, EX.term),
+                                                  max_workers=4, journal=journal)
+            calls_before = transformer.calls
+            print_pipeline_report(pipeline.run(sample_chunks))
+            print_journal_stats(journal)
+            print(f"Run {attempt}: {transformer.calls - calls_before} LLM calls, stand-in holds {len(endpoint)} triples")
+        journal.close()
@@ -0,0 +1,6 @@
+# Namespace and named graph of the FAQ knowledge graph
+# Scenarios 1 to 3 mint every entity IRI under KG_NAMESPACE and Scenarios 2 and 3 load the triples into
+# KG_GRAPH_NAME. Scenarios 4 and 5 resolve entities under the same namespace and query the same graph, so
+# ingestion and retrieval cannot drift apart when one of them is renamed.
+KG_NAMESPACE = "http://new_test_mission_faqhanahotspots.org/"  # Prefix of every minted entity IRI
+KG_GRAPH_NAME = KG_NAMESPACE + "graph"  # Named graph the ingestion scenarios write to
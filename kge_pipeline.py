@@ -0,0 +1,239 @@
+# Streaming ingestion pipeline for the knowledge graph generation scenarios
+# Each GraphDocument is converted to RDF triples as soon as its LLM extraction finishes and the triples are
+# queued for the HANA bulk writer right away, so extraction, conversion and insertion overlap.
+# Bounded queues provide back-pressure: when SAP HANA Cloud is slow the writer stops pulling triples,
+# the queue fills up and no new chunks are submitted to the LLM until there is room again.
+# With a job journal, chunks committed by an interrupted earlier run are skipped and every chunk is marked
+# committed as soon as all of its triples are in batches that HANA accepted.
+#please make sure you install the following packages
+#!pip install langchain_experimental rdflib hdbcli
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+from rdflib import Literal
+from rdflib.namespace import RDF
+from typing_extensions import TypedDict
+
+from hana_sparql_writer import BatchResult, BulkWriteReport, chain_batch_hooks
+from job_journal import chunk_key
+from triple_store import CompactTripleBuffer
+
+# Marker placed on the triple queue once every chunk has been converted
+_END_OF_STREAM = object()
+
+class PipelineReport(TypedDict):
+    """Summary of a streaming ingestion run."""
+    chunks: int
+    chunks_failed: int
+    chunks_skipped: int
+    graph_documents: int
+    triples_queued: int
+    duplicate_triples: int
+    extraction_seconds: float
+    elapsed_seconds: float
+    write_report: Optional[BulkWriteReport]
+
+def graph_document_to_triples(document, make_uri: Callable[[str], object]) -> Iterator[Tuple]:
+    """Convert the nodes and relationships of one GraphDocument into RDF triples"""
+    for node in document.nodes:
+        node_uri = make_uri(node.id)
+        # Triple indicating the node's type
+        yield (node_uri, RDF.type, make_uri(node.type))
+        # One triple per node property
+        for key, value in node.properties.items():
+            yield (node_uri, make_uri(key), Literal(value))
+    for relationship in document.relationships:
+        # Triple linking the source and target entities through the relationship type
+        yield (make_uri(relationship.source.id), make_uri(relationship.type), make_uri(relationship.target.id))
+
+class StreamingIngestionPipeline:
+    """Overlap LLM extraction, RDF conversion and HANA insertion with bounded queues"""
+
+    def __init__(self, llm_transformer, writer, to_triples: Callable[[object], Iterable[Tuple]],
+                 max_workers: int = 10, max_pending_chunks: int = 20, queue_size: int = 50, journal=None,
+                 on_batch: Optional[Callable[[BatchResult, List[str]], None]] = None):
+        if journal is not None and getattr(writer, "delete_missing", False):
+            # Chunks committed by an earlier run are skipped, so their triples would be deleted as stale
+            raise ValueError("A job journal cannot be used with a writer that deletes missing triples")
+        self.llm_transformer = llm_transformer        # LLMGraphTransformer used for extraction
+        self.writer = writer                          # SparqlBulkWriter used for insertion
+        self.to_triples = to_triples                  # Converts one GraphDocument into triples
+        self.max_workers = max_workers                # Parallel LLM extraction requests
+        self.max_pending_chunks = max(max_pending_chunks, max_workers)  # Chunks submitted but not converted
+        self.queue_size = queue_size                  # Converted documents waiting for the writer
+        self.triples = CompactTripleBuffer()          # Every distinct triple queued by the last run
+        self.failed_chunks: List = []                 # Chunks whose extraction failed in the last run
+        self.journal = journal                        # Optional JobJournal for resumable runs
+        self.on_batch = on_batch                      # Optional writer hook called after the journal's
+
+    def run(self, chunks: Iterable) -> PipelineReport:
+        """Extract, convert and insert all chunks, returning a report of the run"""
+        report = PipelineReport(chunks=0, chunks_failed=0, chunks_skipped=0, graph_documents=0, triples_queued=0,
+                                duplicate_triples=0, extraction_seconds=0.0, elapsed_seconds=0.0,
+                                write_report=None)
+        start = time.perf_counter()
+        triple_queue = queue.Queue(maxsize=self.queue_size)
+        if self.journal is not None:
+            self.journal.begin()
+        if self.journal is not None or self.on_batch is not None:
+            # The writer reports every finished batch: the journal commits the chunks it completes,
+            # then the caller's hook sees the batch
+            journal_hook = self.journal.batch_done if self.journal is not None else None
+            self.writer.on_batch = chain_batch_hooks(journal_hook, self.on_batch)
+        writer_errors = []
+
+        # The writer runs in its own thread and pulls triples from the queue as they arrive
+        def write():
+            try:
+                report["write_report"] = self.writer.write(self._drain(triple_queue))
+            except Exception as e:
+                writer_errors.append(e)
+                # Keep consuming so the producer never blocks on a dead writer
+                while triple_queue.get() is not _END_OF_STREAM:
+                    pass
+
+        writer_thread = threading.Thread(target=write, name="kge-writer", daemon=True)
+        writer_thread.start()
+
+        # Triples already queued, so repeated triples from different chunks are sent only once
+        seen = self.triples = CompactTripleBuffer()
+        self.failed_chunks = []
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                pending = set()
+                for i, chunk in enumerate(chunks):
+                    if self.journal is not None and self.journal.is_committed(chunk_key(chunk)):
+                        # Already ingested by an earlier, interrupted run of this job. The chunk is never
+                        # converted, so callers that record provenance in convert must not pass a journal
+                        report["chunks_skipped"] += 1
+                        continue
+                    report["chunks"] += 1
+                    pending.add(executor.submit(self._extract, i, chunk))
+                    # Wait for a result before submitting more chunks once the window is full
+                    if len(pending) >= self.max_pending_chunks:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        self._convert(done, triple_queue, seen, report)
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    self._convert(done, triple_queue, seen, report)
+            report["extraction_seconds"] = time.perf_counter() - start
+        finally:
+            triple_queue.put(_END_OF_STREAM)
+            writer_thread.join()
+
+        report["elapsed_seconds"] = time.perf_counter() - start
+        if self.journal is not None:
+            write_report = report["write_report"]
+            self.journal.finish(complete=not writer_errors and not report["chunks_failed"]
+                                and write_report is not None and not write_report["failed_batches"])
+        if writer_errors:
+            raise writer_errors[0]
+        return report
+
+    def _extract(self, index: int, chunk) -> Tuple[int, object, List, Optional[Exception]]:
+        """Run LLM extraction for one chunk, returning the error instead of raising it"""
+        try:
+            return index, chunk, self.llm_transformer.convert_to_graph_documents([chunk]), None
+        except Exception as e:
+            return index, chunk, [], e
+
+    def _convert(self, futures, triple_queue: queue.Queue, seen: CompactTripleBuffer, report: PipelineReport):
+        """Convert finished extractions into triples and queue them for the writer"""
+        for future in futures:
+            index, chunk, graph_documents, error = future.result()
+            if error is not None:
+                # Log errors for specific chunks without failing the entire run; the chunk is kept for a retry
+                report["chunks_failed"] += 1
+                self.failed_chunks.append(chunk)
+                if self.journal is not None:
+                    self.journal.chunk_failed(chunk, error)
+                print(f"Error processing chunk {index}: {error}")
+                continue
+            new_triples = []
+            for document in graph_documents:
+                report["graph_documents"] += 1
+                for triple in self.to_triples(document):
+                    if not seen.add(triple):
+                        report["duplicate_triples"] += 1
+                        continue
+                    new_triples.append(triple)
+            if self.journal is not None:
+                # Registered before queueing, so the writer can never finish a batch the journal does not know
+                self.journal.chunk_extracted(chunk_key(chunk), new_triples)
+            if new_triples:
+                # Blocks while the queue is full, which in turn holds back new extractions
+                triple_queue.put(new_triples)
+                report["triples_queued"] += len(new_triples)
+            print(f"Chunk {index} processed into graph document.")
+
+    @staticmethod
+    def _drain(triple_queue: queue.Queue) -> Iterator[Tuple]:
+        """Yield queued triples until the end-of-stream marker arrives"""
+        while True:
+            item = triple_queue.get()
+            if item is _END_OF_STREAM:
+                return
+            yield from item
+
+def print_pipeline_report(report: PipelineReport):
+    """Print a short summary of a streaming ingestion run"""
+    print(f"Processed {report['chunks']} chunks ({report['chunks_failed']} failed) into "
+          f"{report['graph_documents']} graph documents and {report['triples_queued']} triples "
+          f"({report['duplicate_triples']} duplicates skipped).")
+    if report["chunks_skipped"]:
+        print(f"Skipped {report['chunks_skipped']} chunks committed by an earlier run of the job.")
+    print(f"Extraction finished after {report['extraction_seconds']:.2f}s, "
+          f"ingestion finished after {report['elapsed_seconds']:.2f}s.")
+
+# Run a local comparison of sequential and pipelined ingestion with a simulated LLM and database
+if __name__ == "__main__":
+    from types import SimpleNamespace
+
+    from rdflib import Namespace, URIRef
+
+    from hana_sparql_writer import SparqlBulkWriter
+    from local_sparql_standin import LocalSparqlEndpoint
+
+    EX = Namespace("http://new_test_mission_faqhanahotspots.org/")
+
+    class SimulatedTransformer:
+        """Stand-in for LLMGraphTransformer that sleeps like an LLM call and returns a small graph"""
+        def convert_to_graph_documents(self, chunks):
+            time.sleep(0.2)
+            text = chunks[0]
+            nodes = [SimpleNamespace(id=f"{text}_Entity_{i}", type="Concept", properties={})
+                     for i in range(60)]
+            relationships = [SimpleNamespace(source=a, target=b, type="RELATED_TO")
+                             for a, b in zip(nodes, nodes[1:])]
+            return [SimpleNamespace(nodes=nodes, relationships=relationships)]
+
+    def make_uri(value):
+        return URIRef(EX[value.replace(" ", "_").replace("/", "_")])
+
+    def to_triples(document):
+        return graph_document_to_triples(document, make_uri)
+
+    sample_chunks = [f"Chunk{i}" for i in range(100)]
+    transformer = SimulatedTransformer()
+
+    # Sequential: extract everything, then insert everything
+    endpoint = LocalSparqlEndpoint(per_kb_latency=0.001)
+    writer = SparqlBulkWriter(endpoint.connect, max_triples_per_batch=500, max_connections=2)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        documents = [d for docs in executor.map(transformer.convert_to_graph_documents, [[c] for c in sample_chunks])
+                     for d in docs]
+    extraction_only = time.perf_counter() - start
+    writer.write(t for d in documents for t in to_triples(d))
+    sequential = time.perf_counter() - start
+
+    # Pipelined: insert while extraction is still running
+    endpoint = LocalSparqlEndpoint(per_kb_latency=0.001)
+    writer = SparqlBulkWriter(endpoint.connect, max_triples_per_batch=500, max_connections=2)
+    pipeline_report = StreamingIngestionPipeline(transformer, writer, to_triples).run(sample_chunks)
+    print_pipeline_report(pipeline_report)
+    print(f"Extraction alone: {extraction_only:.2f}s, sequential: {sequential:.2f}s, "
+          f"pipelined: {pipeline_report['elapsed_seconds']:.2f}s")
@@ -0,0 +1,347 @@
+# Process-wide factory for LLM SDK clients (AWS Bedrock, Azure OpenAI and SAP GenAI Hub)
+# Building a boto3 session and client repeats credential resolution and endpoint discovery, and a fresh client
+# starts with an empty connection pool, so every call pays a new TCP and TLS handshake. The factory builds each
+# client once per configuration and hands the same instance to every caller. Connection pools are sized to the
+# extraction concurrency, so parallel requests keep their connections alive instead of opening new ones.
+# Counters show how often clients and HTTP connections were reused versus created.
+#please make sure you install the following packages
+#!pip install boto3 langchain-aws langchain_openai httpx
+import asyncio
+import json
+import threading
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+from typing_extensions import TypedDict
+
+# Default HTTP connection pool size; matches the 10 parallel extraction requests used by the scenarios
+DEFAULT_MAX_POOL_CONNECTIONS = 10
+
+class ClientStats(TypedDict):
+    """Reuse counters of one kind of client."""
+    clients_created: int
+    clients_reused: int
+    new_connections: int
+    reused_connections: int
+
+def _config_key(config: Dict) -> Tuple:
+    """Hashable key of a client configuration; objects such as proxy clients are keyed by identity"""
+    items = []
+    for name, value in sorted(config.items()):
+        if value is None or isinstance(value, (str, int, float, bool)):
+            items.append((name, value))
+        elif isinstance(value, (dict, list, tuple)):
+            items.append((name, json.dumps(value, sort_keys=True, default=repr)))
+        else:
+            items.append((name, (type(value).__name__, id(value))))
+    return tuple(items)
+
+class _ConnectionCounter:
+    """Count HTTP requests and newly opened connections through httpcore trace events"""
+
+    def __init__(self):
+        self.requests = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+
+    def trace(self, event_name: str, info: Dict):
+        if event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self.connections += 1
+
+    async def atrace(self, event_name: str, info: Dict):
+        self.trace(event_name, info)
+
+    def request(self, request: httpx.Request, trace: Callable):
+        with self._lock:
+            self.requests += 1
+        request.extensions = {**request.extensions, "trace": trace}
+
+class _CountingTransport(httpx.HTTPTransport):
+    def __init__(self, counter: _ConnectionCounter, **kwargs):
+        super().__init__(**kwargs)
+        self.counter = counter
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self.counter.request(request, self.counter.trace)
+        return super().handle_request(request)
+
+class _AsyncCountingTransport(httpx.AsyncBaseTransport):
+    """Async transport with one connection pool per event loop
+
+    Pooled connections belong to the loop that opened them, and every asyncio.run (one per extraction run)
+    starts a new loop, so a shared client keeps a pool per running loop. A loop's pool is closed while that
+    loop shuts down, because its connections cannot be closed any more once the loop is closed.
+    """
+
+    def __init__(self, counter: _ConnectionCounter, **kwargs):
+        self.counter = counter
+        self._options = kwargs
+        self._transports: Dict[asyncio.AbstractEventLoop, Tuple[httpx.AsyncHTTPTransport, object]] = {}
+        self._lock = threading.Lock()
+
+    async def _close_with_loop(self, loop: asyncio.AbstractEventLoop, transport: httpx.AsyncHTTPTransport):
+        # Kept suspended at the yield; asyncio.run finalizes pending async generators before closing the loop
+        try:
+            yield
+        finally:
+            with self._lock:
+                if self._transports.get(loop, (None,))[0] is transport:
+                    del self._transports[loop]
+            await transport.aclose()
+
+    async def _loop_transport(self) -> httpx.AsyncHTTPTransport:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            entry = self._transports.get(loop)
+            if entry is None:
+                # Loops closed without finalizing their async generators leave pools nothing can close any more
+                for closed in [other for other in self._transports if other.is_closed()]:
+                    del self._transports[closed]
+                transport = httpx.AsyncHTTPTransport(**self._options)
+                entry = self._transports[loop] = (transport, self._close_with_loop(loop, transport))
+                closer = entry[1]
+            else:
+                closer = None
+        if closer is not None:
+            await closer.__anext__()
+        return entry[0]
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.counter.request(request, self.counter.atrace)
+        return await (await self._loop_transport()).handle_async_request(request)
+
+    async def aclose(self):
+        with self._lock:
+            entry = self._transports.pop(asyncio.get_running_loop(), None)
+        if entry is not None:
+            await entry[0].aclose()
+
+    def close(self):
+        """Close the pool of every loop that is still open, on that loop"""
+        with self._lock:
+            entries, self._transports = list(self._transports.items()), {}
+        for loop, (transport, _) in entries:
+            if loop.is_closed():
+                continue
+            if not loop.is_running():
+                loop.run_until_complete(transport.aclose())
+                continue
+            try:
+                running = asyncio.get_running_loop()
+            except RuntimeError:
+                running = None
+            if running is loop:
+                loop.create_task(transport.aclose())
+            else:
+                asyncio.run_coroutine_threadsafe(transport.aclose(), loop).result()
+
+def _urllib3_counts(client) -> Tuple[int, int]:
+    """Return (requests, connections) of a botocore client's urllib3 pools, or zeros if unavailable"""
+    requests = connections = 0
+    try:
+        manager = client._endpoint.http_session._manager
+        for key in list(manager.pools.keys()):
+            pool = manager.pools[key]
+            requests += pool.num_requests
+            connections += pool.num_connections
+    except Exception:
+        pass
+    return requests, connections
+
+class LLMClientFactory:
+    """Cache of LLM SDK clients keyed by configuration, with connection pools sized to the request concurrency"""
+
+    def __init__(self, max_pool_connections: int = DEFAULT_MAX_POOL_CONNECTIONS):
+        self.max_pool_connections = max_pool_connections  # Default HTTP connection pool size per client
+        self._clients: Dict[Tuple, object] = {}
+        self._kinds: Dict[Tuple, str] = {}
+        self._counters: Dict[Tuple, object] = {}  # Connection counters of the httpx and botocore clients
+        self._async_transports: List[_AsyncCountingTransport] = []  # Per-loop pools of the async httpx clients
+        self._created: Counter = Counter()
+        self._reused: Counter = Counter()
+        self._lock = threading.RLock()
+
+    def get(self, kind: str, config: Dict, build: Callable[[], object]):
+        """Return the cached client of this kind and configuration, building it on first use"""
+        key = (kind, _config_key(config))
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self._reused[kind] += 1
+                return client
+            # Built under the lock so concurrent first calls do not create duplicate clients
+            client = build()
+            self._clients[key] = client
+            self._kinds[key] = kind
+            self._created[kind] += 1
+            return client
+
+    def bedrock(self, service_name: str = "bedrock-runtime", region_name: Optional[str] = None,
+                aws_access_key_id: Optional[str] = None, aws_secret_access_key: Optional[str] = None,
+                max_pool_connections: Optional[int] = None):
+        """Return a shared boto3 client; boto3 clients are thread-safe, sessions are not shared across threads"""
+        pool_size = max_pool_connections or self.max_pool_connections
+        config = dict(service_name=service_name, region_name=region_name, aws_access_key_id=aws_access_key_id,
+                      aws_secret_access_key=aws_secret_access_key, max_pool_connections=pool_size)
+
+        def build():
+            import boto3
+            from botocore.config import Config
+
+            session = boto3.Session(aws_access_key_id=aws_access_key_id,
+                                    aws_secret_access_key=aws_secret_access_key, region_name=region_name)
+            client = session.client(service_name, config=Config(max_pool_connections=pool_size))
+            self._counters[("bedrock", _config_key(config))] = client
+            return client
+
+        return self.get("bedrock", config, build)
+
+    def chat_bedrock(self, **kwargs):
+        """Return a shared ChatBedrock; GenAI Hub when a proxy_client is given, otherwise langchain_aws"""
+        def build():
+            if "proxy_client" in kwargs:
+                from gen_ai_hub.proxy.langchain.amazon import ChatBedrock
+                return ChatBedrock(**kwargs)
+            from langchain_aws import ChatBedrock
+            options = dict(kwargs)
+            if "client" not in options:
+                # Give the model a pooled runtime client instead of letting it build its own
+                options["client"] = self.bedrock(
+                    "bedrock-runtime", region_name=options.get("region_name"),
+                    aws_access_key_id=options.pop("aws_access_key_id", None),
+                    aws_secret_access_key=options.pop("aws_secret_access_key", None))
+            return ChatBedrock(**options)
+
+        return self.get("chat_bedrock", kwargs, build)
+
+    def http_client(self, max_connections: Optional[int] = None, timeout: Optional[float] = None) -> httpx.Client:
+        """Return a shared httpx client whose keep-alive pool holds `max_connections` connections"""
+        pool_size = max_connections or self.max_pool_connections
+        config = dict(max_connections=pool_size, timeout=timeout)
+
+        def build():
+            counter = _ConnectionCounter()
+            self._counters[("http", _config_key(config))] = counter
+            limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+            return httpx.Client(transport=_CountingTransport(counter, limits=limits), timeout=timeout)
+
+        return self.get("http", config, build)
+
+    def async_http_client(self, max_connections: Optional[int] = None,
+                          timeout: Optional[float] = None) -> httpx.AsyncClient:
+        """Return a shared httpx async client for the asyncio extraction engine, usable from any event loop"""
+        pool_size = max_connections or self.max_pool_connections
+        config = dict(max_connections=pool_size, timeout=timeout)
+
+        def build():
+            counter = _ConnectionCounter()
+            self._counters[("async_http", _config_key(config))] = counter
+            limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+            transport = _AsyncCountingTransport(counter, limits=limits)
+            self._async_transports.append(transport)
+            return httpx.AsyncClient(transport=transport, timeout=timeout)
+
+        return self.get("async_http", config, build)
+
+    def azure_chat_openai(self, max_connections: Optional[int] = None, **kwargs):
+        """Return a shared AzureChatOpenAI whose HTTP clients are pooled for `max_connections` parallel requests"""
+        def build():
+            from langchain_openai import AzureChatOpenAI
+            timeout = kwargs.get("timeout")
+            return AzureChatOpenAI(http_client=self.http_client(max_connections, timeout),
+                                   http_async_client=self.async_http_client(max_connections, timeout), **kwargs)
+
+        return self.get("azure_openai", dict(kwargs, max_connections=max_connections), build)
+
+    def genai_hub_proxy_client(self, name: str = "gen-ai-hub"):
+        """Return a shared SAP GenAI Hub proxy client"""
+        def build():
+            from gen_ai_hub.proxy.core.proxy_clients import get_proxy_client
+            return get_proxy_client(name)
+
+        return self.get("genai_hub_proxy", dict(name=name), build)
+
+    def stats(self) -> Dict[str, ClientStats]:
+        """Return client and connection reuse counters per kind of client"""
+        with self._lock:
+            kinds = set(self._created) | set(self._reused)
+            stats = {kind: ClientStats(clients_created=self._created[kind], clients_reused=self._reused[kind],
+                                       new_connections=0, reused_connections=0) for kind in kinds}
+            counters = list(self._counters.items())
+        for (kind, _), counter in counters:
+            if isinstance(counter, _ConnectionCounter):
+                requests, connections = counter.requests, counter.connections
+            else:
+                requests, connections = _urllib3_counts(counter)
+            stats[kind]["new_connections"] += connections
+            stats[kind]["reused_connections"] += max(requests - connections, 0)
+        return stats
+
+    def close(self):
+        """Close the pooled HTTP clients, the async pools of every open event loop, and forget every cached client"""
+        with self._lock:
+            clients, self._clients = list(self._clients.items()), {}
+            transports, self._async_transports = self._async_transports, []
+            self._counters.clear()
+        for key, client in clients:
+            if isinstance(client, httpx.Client):
+                client.close()
+        for transport in transports:
+            transport.close()
+
+# Shared by every scenario and helper in the process
+client_factory = LLMClientFactory()
+
+def print_client_stats(factory: LLMClientFactory = client_factory):
+    """Print client and connection reuse counters"""
+    for kind, stats in sorted(factory.stats().items()):
+        print(f"LLM clients ({kind}): {stats['clients_created']} created, {stats['clients_reused']} reused; "
+              f"{stats['new_connections']} new connections, {stats['reused_connections']} reused connections.")
+
+# Compare a new HTTP client per call with the shared pooled client against a local HTTP server
+if __name__ == "__main__":
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # Keep-alive, like the LLM endpoints
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(0.01)  # Stand-in for model latency
+            body = b'{"output": "ok"}'
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/invoke"
+    calls = 200
+
+    def per_call_client(i):
+        # What a new session and client per call amounts to: a fresh connection pool every time
+        with httpx.Client() as client:
+            return client.post(url, json={"prompt": i}).status_code
+
+    factory = LLMClientFactory(max_pool_connections=10)
+
+    def pooled_client(i):
+        return factory.http_client().post(url, json={"prompt": i}).status_code
+
+    for name, call in (("New client per call", per_call_client), ("Shared pooled client", pooled_client)):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            list(executor.map(call, range(calls)))
+        print(f"{name}: {calls} requests with 10 workers in {time.perf_counter() - start:.2f}s")
+    print_client_stats(factory)
+    factory.close()
+    server.shutdown()
@@ -0,0 +1,220 @@
+# Local stand-in for SAP HANA Cloud's SPARQL_EXECUTE stored procedure
+# Lets the ingestion and retrieval helpers be exercised and benchmarked without a HANA Cloud instance.
+# The stand-in keeps an in-memory rdflib Dataset, mimics the dbapi connection/cursor interface
+# and can inject latency and failures so that retry and throttling paths can be observed.
+# SELECT results are returned as XML, or as JSON or TSV when the Accept header asks for a format listed in
+# result_formats; other Accept headers are ignored, as servers without those formats do.
+#please make sure you install the following packages
+#!pip install rdflib
+import random
+import re
+import threading
+import time
+from typing import Optional, Tuple
+
+from rdflib import BNode, Dataset, Graph, Literal
+
+from triple_store import to_ntriples_term
+
+# Plain INSERT DATA / DELETE DATA requests are applied through the fast N-Triples parser
+# instead of the general SPARQL update parser, which is too slow for large benchmark loads
+_DATA_REQUEST = re.compile(
+    r"^\s*(INSERT|DELETE)\s+DATA\s*\{\s*(?:GRAPH\s*<([^>]*)>\s*\{(.*)\}|(.*))\s*\}\s*$",
+    re.DOTALL | re.IGNORECASE,
+)
+
+# Media type requested by the Accept header of a request
+_ACCEPT = re.compile(r"Accept:\s*([^\s,;]+)", re.IGNORECASE)
+_MEDIA_FORMATS = {
+    "application/sparql-results+xml": "xml",
+    "application/sparql-results+json": "json",
+    "text/tab-separated-values": "tsv",
+}
+
+class LocalSparqlEndpoint:
+    """In-memory stand-in for the SPARQL_EXECUTE stored procedure"""
+
+    def __init__(self, latency: float = 0.0, per_kb_latency: float = 0.0, fail_rate: float = 0.0,
+                 max_request_bytes: Optional[int] = None, seed: Optional[int] = None,
+                 result_formats: Tuple[str, ...] = ("xml", "json", "tsv")):
+        self.dataset = Dataset(default_union=True)  # Triples stored by the endpoint
+        self.latency = latency                      # Fixed latency per call in seconds
+        self.per_kb_latency = per_kb_latency        # Additional latency per KB of request payload
+        self.fail_rate = fail_rate                  # Probability that a call fails with an error
+        self.max_request_bytes = max_request_bytes  # Reject requests larger than this (None = no limit)
+        self.calls = 0                              # Number of SPARQL_EXECUTE calls received
+        self.failures = 0                           # Number of injected or real failures
+        self.bytes_received = 0                     # Total request payload received
+        self.generation = 0                         # Incremented when the server drops every open session
+        self.result_formats = result_formats        # SELECT result formats the endpoint can return
+        self.bytes_sent = 0                         # Total response payload returned
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def connect(self, **kwargs) -> "LocalConnection":
+        """Open a connection, accepting the same keyword arguments as dbapi.connect"""
+        return LocalConnection(self)
+
+    def drop_connections(self):
+        """Simulate the server dropping every open session, e.g. after a TLS idle timeout"""
+        with self._lock:
+            self.generation += 1
+
+    def __len__(self) -> int:
+        return len(self.dataset)
+
+    def execute(self, request: str, headers: str) -> Tuple[str, str]:
+        """Run one SPARQL_EXECUTE request and return (response, response metadata)"""
+        payload_bytes = len(request.encode("utf-8"))
+        with self._lock:
+            self.calls += 1
+            self.bytes_received += payload_bytes
+            fail = self._random.random() < self.fail_rate
+
+        # Simulate network and server processing time
+        delay = self.latency + self.per_kb_latency * payload_bytes / 1024
+        if delay:
+            time.sleep(delay)
+
+        if fail or (self.max_request_bytes and payload_bytes > self.max_request_bytes):
+            with self._lock:
+                self.failures += 1
+            raise RuntimeError("SPARQL_EXECUTE failed: injected failure in local stand-in")
+
+        headers = headers or ""
+        try:
+            if "rqx-load-protocol: true" in headers:
+                return self._load(request, headers)
+            with self._lock:
+                if _is_update(request):
+                    self._update(request)
+                    return "", "Content-Type: text/plain"
+                result = self.dataset.query(request)
+            response, content_type = _serialize(result, headers, self.result_formats)
+            with self._lock:
+                self.bytes_sent += len(response.encode("utf-8"))
+            return response, f"Content-Type: {content_type}"
+        except Exception:
+            with self._lock:
+                self.failures += 1
+            raise
+
+    def _update(self, request: str):
+        """Apply a SPARQL update, using the N-Triples parser for plain INSERT/DELETE DATA requests"""
+        match = _DATA_REQUEST.match(request)
+        if match is None:
+            self.dataset.update(request)
+            return
+        operation, graph_name, graph_body, default_body = match.groups()
+        body = graph_body if graph_name else default_body
+        # One statement per line, as expected by the N-Triples parser
+        body = "\n".join(line.strip() for line in body.strip().splitlines() if line.strip())
+        parsed = Graph()
+        parsed.parse(data=body, format="nt")
+        graph = self.dataset.graph(graph_name) if graph_name else self.dataset.default_graph
+        if operation.upper() == "INSERT":
+            graph += parsed
+        else:
+            graph -= parsed
+
+    def _load(self, data: str, headers: str) -> Tuple[str, str]:
+        """Handle a request sent with the rqx-load protocol headers"""
+        graph_name = None
+        data_format = "turtle"
+        for line in headers.split("\r\n"):
+            if line.startswith("rqx-load-graphname:"):
+                graph_name = line.split(":", 1)[1].strip()
+            elif line.startswith("rqx-load-filename:") and line.strip().endswith(".nt"):
+                data_format = "nt"
+        with self._lock:
+            graph = self.dataset.graph(graph_name) if graph_name else self.dataset.default_graph
+            graph.parse(data=data, format=data_format)
+        return "", "Content-Type: text/plain"
+
+class LocalConnection:
+    """Connection object returned by LocalSparqlEndpoint.connect"""
+
+    def __init__(self, endpoint: LocalSparqlEndpoint):
+        self.endpoint = endpoint
+        self.generation = endpoint.generation
+        self.closed = False
+
+    def cursor(self) -> "LocalCursor":
+        if not self.isconnected():
+            raise RuntimeError("Connection is closed")
+        return LocalCursor(self)
+
+    def isconnected(self) -> bool:
+        return not self.closed and self.generation == self.endpoint.generation
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+class LocalCursor:
+    """Cursor object supporting callproc('SPARQL_EXECUTE', ...)"""
+
+    def __init__(self, connection: LocalConnection):
+        self.connection = connection
+
+    def callproc(self, name: str, params: tuple) -> tuple:
+        if name != "SPARQL_EXECUTE":
+            raise ValueError(f"Unknown procedure: {name}")
+        if not self.connection.isconnected():
+            raise RuntimeError("Connection is closed")
+        request, headers = params[0], params[1]
+        response, metadata = self.connection.endpoint.execute(request, headers)
+        # Same positional layout as hdbcli: IN request, IN headers, OUT response, OUT metadata
+        return (request, headers, response, metadata)
+
+    def execute(self, sql: str):
+        """Support only the liveness probe used by connection pools"""
+        if not self.connection.isconnected():
+            raise RuntimeError("Connection is closed")
+        if " ".join(sql.upper().split()) != "SELECT 1 FROM DUMMY":
+            raise ValueError(f"Unsupported SQL in local stand-in: {sql}")
+        self._rows = [(1,)]
+
+    def fetchall(self) -> list:
+        rows, self._rows = getattr(self, "_rows", []), []
+        return rows
+
+    def close(self):
+        pass
+
+def _tsv_term(term) -> str:
+    if term is None:
+        return ""
+    if isinstance(term, BNode):
+        return f"_:{term}"
+    if isinstance(term, Literal):
+        return to_ntriples_term(term)
+    return f"<{term}>"
+
+def _serialize(result, headers: str, result_formats: Tuple[str, ...]) -> Tuple[str, str]:
+    """Serialize a query result in the format requested by the Accept header, if the endpoint supports it"""
+    match = _ACCEPT.search(headers)
+    result_format = _MEDIA_FORMATS.get(match.group(1).lower()) if match else None
+    if result.type != "SELECT" or result_format not in result_formats:
+        result_format = "xml"
+    if result_format == "tsv":
+        lines = ["\t".join(f"?{var}" for var in result.vars)]
+        lines.extend("\t".join(_tsv_term(row[var]) for var in result.vars) for row in result)
+        return "\n".join(lines) + "\n", "text/tab-separated-values"
+    media_type = "application/sparql-results+json" if result_format == "json" else "application/sparql-results+xml"
+    return result.serialize(format=result_format).decode("utf-8"), media_type
+
+def _is_update(request: str) -> bool:
+    """Check whether a SPARQL request is an update (INSERT/DELETE/LOAD/CLEAR) rather than a query"""
+    # Skip PREFIX/BASE declarations before looking at the first keyword
+    for line in request.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#") or line.upper().startswith(("PREFIX", "BASE")):
+            continue
+        return line.split(None, 1)[0].upper() in ("INSERT", "DELETE", "LOAD", "CLEAR", "DROP", "CREATE", "WITH")
+    return False
@@ -0,0 +1,272 @@
+# Page-level change detection and provenance for new revisions of an SAP note
+# Every page is fingerprinted by its normalized text, and every triple is recorded together with the page and
+# chunk it was extracted from. When a new revision of a note is ingested, pages whose fingerprint is already
+# known are skipped, so only new or changed pages are sent to the LLM. Triples that were produced only by pages
+# that disappeared or changed are retracted from the graph afterwards. Pages are matched by content rather than
+# page number, so inserting a page in the middle of a note does not invalidate every page after it.
+#please make sure you install the following packages
+#!pip install rdflib langchain_core numpy
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+
+from typing_extensions import TypedDict
+
+from chunk_dedup import DuplicateRecord
+from delta_ingest import triple_hash
+from hana_sparql_writer import BatchResult, format_triple
+
+# File name of a downloaded SAP note: note number, optional language and revision date (2927209_E_20250327)
+_NOTE_FILE_NAME = re.compile(r"^(\d+)(?:[_-][A-Za-z]{1,2})?(?:[_-]\d{8})?$")
+
+class RevisionReport(TypedDict):
+    """Summary of an incremental revision run."""
+    documents: int
+    pages: int
+    unchanged_pages: int
+    changed_pages: int
+    removed_pages: int
+    triples_recorded: int
+    triples_retracted: int
+    elapsed_seconds: float
+
+def page_fingerprint(text: str) -> str:
+    """Fingerprint of a page's text, ignoring differences in whitespace"""
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+def chunk_fingerprint(text: str) -> str:
+    """Fingerprint of a chunk's text"""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def document_key(metadata: Dict) -> str:
+    """Identify the note a page belongs to, so revisions of the same note are compared with each other"""
+    name = metadata.get("document") or metadata.get("source")
+    if not name:
+        raise ValueError("Page metadata needs a 'document' or 'source' entry to identify its note")
+    stem = os.path.splitext(os.path.basename(str(name)))[0]
+    # The language and revision date differ between downloads of the same note, so only its number is kept
+    match = _NOTE_FILE_NAME.match(stem)
+    return match.group(1) if match else stem
+
+class RevisionTracker:
+    """Per-page fingerprints and chunk-to-triple provenance stored in a local SQLite file"""
+
+    def __init__(self, path: str = ".kge_cache/provenance.sqlite"):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path  # Location of the provenance file
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "document TEXT NOT NULL, fingerprint TEXT NOT NULL, page INTEGER, last_seen REAL NOT NULL,"
+            " PRIMARY KEY (document, fingerprint)) WITHOUT ROWID"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS provenance ("
+            "document TEXT NOT NULL, fingerprint TEXT NOT NULL, chunk TEXT NOT NULL, hash BLOB NOT NULL,"
+            " statement TEXT NOT NULL, PRIMARY KEY (document, fingerprint, chunk, hash)) WITHOUT ROWID"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS provenance_hash ON provenance (hash)")
+        self._db.commit()
+        self._reset()
+
+    def _reset(self):
+        self._seen: Dict[str, Set[str]] = defaultdict(set)      # Document -> fingerprints of this revision
+        self._changed: Dict[str, Dict[str, int]] = defaultdict(dict)  # Document -> new fingerprint -> page
+        self._recorded: List[Tuple] = []                         # Provenance rows of this run
+        self._failed: Set[Tuple[str, str]] = set()               # Pages with a failed chunk
+        self.report = RevisionReport(documents=0, pages=0, unchanged_pages=0, changed_pages=0, removed_pages=0,
+                                     triples_recorded=0, triples_retracted=0, elapsed_seconds=0.0)
+        self._start = time.perf_counter()
+
+    def known_fingerprints(self, document: str) -> Set[str]:
+        with self._lock:
+            return {row[0] for row in
+                    self._db.execute("SELECT fingerprint FROM pages WHERE document = ?", (document,))}
+
+    def changed_pages(self, pages: Iterable) -> Iterator:
+        """Yield only pages that are new or changed since the last recorded revision"""
+        self._reset()
+        known: Dict[str, Set[str]] = {}
+        for page in pages:
+            document = document_key(page.metadata)
+            if document not in known:
+                known[document] = self.known_fingerprints(document)
+                self.report["documents"] += 1
+            fingerprint = page_fingerprint(page.page_content)
+            self.report["pages"] += 1
+            self._seen[document].add(fingerprint)
+            # Chunks inherit the page metadata, which links their triples back to this page
+            page.metadata["page_fingerprint"] = fingerprint
+            if fingerprint in known[document]:
+                self.report["unchanged_pages"] += 1
+                continue
+            self._changed[document][fingerprint] = page.metadata.get("page")
+            self.report["changed_pages"] += 1
+            yield page
+
+    def record(self, chunk, triples: Iterable[Tuple]) -> List[Tuple]:
+        """Remember which chunk produced the triples and return them unchanged"""
+        triples = list(triples)
+        metadata = chunk.metadata
+        document, fingerprint = document_key(metadata), metadata.get("page_fingerprint")
+        if fingerprint is None:
+            return triples
+        chunk_id = chunk_fingerprint(chunk.page_content)
+        rows = []
+        for s, p, o in triples:
+            statement = format_triple(s, p, o)
+            rows.append((document, fingerprint, chunk_id, triple_hash(statement), statement))
+        with self._lock:
+            self._recorded.extend(rows)
+        return triples
+
+    def record_duplicates(self, duplicates: Iterable[DuplicateRecord]):
+        """Copy the provenance of kept chunks to the pages of the duplicates skipped in their favour"""
+        with self._lock:
+            by_chunk: Dict[Tuple[str, str, str], List[Tuple]] = defaultdict(list)
+            for row in self._recorded:
+                by_chunk[row[:3]].append(row)
+            copied = []
+            for record in duplicates:
+                kept = (document_key(record["kept_metadata"]), record["kept_metadata"].get("page_fingerprint"))
+                page = (document_key(record["metadata"]), record["metadata"].get("page_fingerprint"))
+                if page[1] is None or page == kept:
+                    continue
+                # The duplicate's page supports the kept chunk's triples; it is only stored if that chunk succeeded
+                if kept in self._failed:
+                    self._failed.add(page)
+                copied.extend((*page, *row[2:]) for row in by_chunk.get((*kept, record["kept_chunk"]), ()))
+            self._recorded.extend(copied)
+
+    def mark_failed(self, chunks: Iterable):
+        """Keep pages with failed chunks out of the stored revision, so they are extracted again next time"""
+        for chunk in chunks:
+            # Packed requests carry their original chunks
+            for part in getattr(chunk, "parts", None) or [chunk]:
+                self._failed.add((document_key(part.metadata), part.metadata.get("page_fingerprint")))
+
+    def mark_failed_batches(self, batches: Iterable[BatchResult]):
+        """Keep pages whose triples are in failed write batches out of the stored revision"""
+        failed = {triple_hash(statement) for batch in batches for statement in batch["statements"]}
+        if not failed:
+            return
+        with self._lock:
+            # A page is only stored once every triple it produced was written
+            self._failed.update((row[0], row[1]) for row in self._recorded if row[3] in failed)
+
+    def finish(self, writer=None) -> RevisionReport:
+        """Store the new revision and retract triples that only came from removed or changed pages"""
+        retract: Dict[bytes, str] = {}
+        with self._lock:
+            recorded, self._recorded = self._recorded, []
+            now = time.time()
+            for document, seen in self._seen.items():
+                known = {row[0] for row in
+                         self._db.execute("SELECT fingerprint FROM pages WHERE document = ?", (document,))}
+                removed = known - seen
+                self.report["removed_pages"] += len(removed)
+                if not removed:
+                    continue
+                # Candidate triples of removed pages that no remaining page of the note supports
+                supported = {row[3] for row in recorded if row[0] == document}
+                for fingerprint in removed:
+                    for digest, statement in self._db.execute(
+                            "SELECT hash, statement FROM provenance WHERE document = ? AND fingerprint = ?",
+                            (document, fingerprint)):
+                        if digest in supported or digest in retract:
+                            continue
+                        # Triples shared with other pages or other notes stay in the graph
+                        still_used = self._db.execute(
+                            f"SELECT 1 FROM provenance WHERE hash = ? AND NOT (document = ? AND fingerprint IN "
+                            f"({','.join('?' * len(removed))})) LIMIT 1",
+                            (digest, document, *removed)).fetchone()
+                        if still_used is None:
+                            retract[digest] = statement
+                self._db.executemany("DELETE FROM provenance WHERE document = ? AND fingerprint = ?",
+                                     [(document, fingerprint) for fingerprint in removed])
+                self._db.executemany("DELETE FROM pages WHERE document = ? AND fingerprint = ?",
+                                     [(document, fingerprint) for fingerprint in removed])
+
+            self._db.executemany("INSERT OR IGNORE INTO provenance (document, fingerprint, chunk, hash, statement) "
+                                 "VALUES (?, ?, ?, ?, ?)",
+                                 [row for row in recorded if (row[0], row[1]) not in self._failed])
+            self._db.executemany("INSERT OR REPLACE INTO pages (document, fingerprint, page, last_seen) "
+                                 "VALUES (?, ?, ?, ?)",
+                                 [(document, fingerprint, page, now)
+                                  for document, pages in self._changed.items()
+                                  for fingerprint, page in pages.items()
+                                  if (document, fingerprint) not in self._failed])
+            self._db.commit()
+
+        self.report["triples_recorded"] = len(recorded)
+        if retract and writer is not None:
+            delete_report = writer.delete_statements(retract.values())
+            self.report["triples_retracted"] = len(retract) - delete_report["triples_failed"]
+        self.report["elapsed_seconds"] = time.perf_counter() - self._start
+        return self.report
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+def print_revision_report(report: RevisionReport):
+    """Print a short summary of an incremental revision run"""
+    print(f"Revision check: {report['pages']} pages in {report['documents']} documents, "
+          f"{report['unchanged_pages']} unchanged, {report['changed_pages']} new or changed, "
+          f"{report['removed_pages']} removed; {report['triples_retracted']} stale triples retracted.")
+
+# Ingest two revisions of a small note against the in-memory SPARQL_EXECUTE stand-in
+if __name__ == "__main__":
+    import tempfile
+
+    from langchain_core.documents import Document
+    from rdflib import Literal, Namespace
+    from rdflib.namespace import RDF
+
+    from hana_sparql_writer import NTriplesBulkLoader
+    from local_sparql_standin import LocalSparqlEndpoint
+
+    EX = Namespace("http://new_test_mission_faqhanahotspots.org/")
+
+    def pages_of(texts, file_name):
+        return [Document(page_content=text, metadata={"source": file_name, "document": file_name,
+                                                      "page": i, "total_pages": len(texts)})
+                for i, text in enumerate(texts)]
+
+    def extract(page):
+        # Stand-in for LLM extraction: one entity per word, linked to the first word of the page
+        words = page.page_content.split()
+        for word in words:
+            yield EX[word], RDF.type, EX["Concept"]
+            yield EX[words[0]], EX["MENTIONS"], EX[word]
+        yield EX[words[0]], EX["text"], Literal(page.page_content)
+
+    revision_1 = ["HANA memory sizing", "Delta merge tuning", "Savepoint duration"]
+    revision_2 = ["Savepoint duration", "HANA memory sizing", "Delta merge tuning with NSE", "Column store unload"]
+    # Each revision of the note is downloaded with its own date in the file name
+    revisions = [(revision_1, "2927209_E_20250101.pdf"), (revision_2, "2927209_E_20250327.pdf")]
+
+    endpoint = LocalSparqlEndpoint()
+    loader = NTriplesBulkLoader(endpoint.connect, graph_name=EX["graph"])
+    with tempfile.TemporaryDirectory() as directory:
+        tracker = RevisionTracker(os.path.join(directory, "provenance.sqlite"))
+        for number, (texts, file_name) in enumerate(revisions, start=1):
+            extracted = 0
+            triples = []
+            for page in tracker.changed_pages(pages_of(texts, file_name)):
+                extracted += 1
+                triples += tracker.record(page, extract(page))
+            loader.write(triples)
+            report = tracker.finish(loader)
+            print(f"Revision {number}: extracted {extracted} pages")
+            print_revision_report(report)
+            print(f"Stand-in holds {len(endpoint)} triples")
+        tracker.close()
@@ -0,0 +1,177 @@
+# Lazy PDF page loading and multi-document corpus loading with process-pool PDF parsing
+# iter_pdf_pages yields one page Document at a time instead of building every page up front, so the first
+# chunk can reach the LLM before the whole file is parsed and peak memory stays flat as the page count grows.
+# Layout-heavy pages (tables, multi-column text) can be extracted with pdfplumber instead of pypdf.
+# The corpus loader takes a directory or a glob pattern of SAP note PDFs and parses them in a pool of processes, because
+# pypdf text extraction is CPU-bound and threads are limited by the GIL. Pages are yielded in a fixed order
+# (files sorted by path, pages in page order) with per-document metadata, so they can stream straight
+# into the chunker while the remaining files are still being parsed.
+#please make sure you install the following packages
+#!pip install pypdf pdfplumber langchain_core
+import glob
+import multiprocessing
+import os
+import sys
+from collections import deque
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+# Page text extraction modes: "pypdf" (fast), "pdfplumber" (layout aware) or "auto" (pdfplumber only
+# for pages where pypdf output looks like a broken layout)
+LAYOUT_MODES = ("pypdf", "pdfplumber", "auto")
+
+def looks_layout_heavy(text: str) -> bool:
+    """Heuristic for pages whose pypdf text is empty or falls apart into fragments (tables, columns)"""
+    lines = [line for line in text.splitlines() if line.strip()]
+    if len(text.strip()) < 20:
+        return True
+    # Tables extracted by pypdf tend to turn into many one- or two-word lines
+    short_lines = sum(1 for line in lines if len(line.split()) <= 2)
+    return len(lines) >= 10 and short_lines / len(lines) > 0.6
+
+def iter_pdf_pages(file_path: str, layout: str = "pypdf") -> Iterator[Document]:
+    """Yield the pages of one PDF lazily, one Document per page"""
+    # Imported here so worker processes only load the PDF libraries when they parse
+    from pypdf import PdfReader
+
+    if layout not in LAYOUT_MODES:
+        raise ValueError(f"layout must be one of {LAYOUT_MODES}")
+
+    reader = PdfReader(file_path)
+    total_pages = len(reader.pages)
+    plumber = None
+    try:
+        for page_number in range(total_pages):
+            text = None
+            if layout != "pdfplumber":
+                text = reader.pages[page_number].extract_text() or ""
+            if layout == "pdfplumber" or (layout == "auto" and looks_layout_heavy(text)):
+                if plumber is None:
+                    import pdfplumber
+                    plumber = pdfplumber.open(file_path)
+                plumber_page = plumber.pages[page_number]
+                text = plumber_page.extract_text() or text or ""
+                # Release the parsed layout objects of this page right away
+                plumber_page.close()
+            metadata = {
+                "source": file_path,
+                "page": page_number,
+                "total_pages": total_pages,
+                "document": os.path.basename(file_path),
+            }
+            yield Document(page_content=text, metadata=metadata)
+    finally:
+        if plumber is not None:
+            plumber.close()
+
+def resolve_corpus(path_or_glob: str) -> List[str]:
+    """Return the sorted list of PDF files in a directory (recursively) or matching a glob pattern"""
+    if os.path.isdir(path_or_glob):
+        pattern = os.path.join(path_or_glob, "**", "*.pdf")
+        paths = glob.glob(pattern, recursive=True)
+        paths += glob.glob(os.path.join(path_or_glob, "**", "*.PDF"), recursive=True)
+    elif os.path.isfile(path_or_glob):
+        paths = [path_or_glob]
+    else:
+        paths = glob.glob(path_or_glob, recursive=True)
+    return sorted(set(paths))
+
+def parse_pdf(path: str, layout: str = "pypdf") -> Tuple[str, List[Tuple[str, Dict]], Optional[str]]:
+    """Extract the text of every page of one PDF (runs in a worker process)"""
+    try:
+        pages = [(page.page_content, page.metadata) for page in iter_pdf_pages(path, layout)]
+        return path, pages, None
+    except Exception as e:
+        # Return the error instead of raising so one broken file does not stop the corpus
+        return path, [], str(e)
+
+def start_pdf_workers(max_workers: Optional[int] = None):
+    """Start the PDF parsing processes up front and return them as a multiprocessing pool
+
+    The scenario scripts run their pipeline at import time, so the workers are forked instead of letting them
+    re-import the calling script. Fork is only safe on Linux (Colab); on macOS and Windows workers are spawned
+    and would run the whole scenario again, so corpus mode is refused there. Call this before any thread,
+    connection or database file is opened, so the forked workers never inherit a lock held by another thread
+    or a live connection. Close and join the pool once the corpus has been processed.
+    """
+    if not sys.platform.startswith("linux"):
+        raise RuntimeError(f"PDF worker processes can only be forked on Linux, not on {sys.platform}. Set "
+                           f"CORPUS_PATH = None, or call iter_corpus_pages without workers from a script whose "
+                           f"pipeline is guarded by if __name__ == '__main__'")
+    max_workers = max_workers or os.cpu_count() or 1
+    context = multiprocessing.get_context("fork")
+    # Pool starts every worker in its constructor, not on first use
+    return context.Pool(processes=max_workers)
+
+def iter_corpus_pages(paths: List[str], max_workers: Optional[int] = None,
+                      prefetch: Optional[int] = None, layout: str = "pypdf", workers=None) -> Iterator[Document]:
+    """Parse PDFs in a process pool and yield their pages in file and page order
+
+    `workers` is a pool from start_pdf_workers. Without it a pool is spawned for this call, which re-imports
+    the calling script in every worker unless its pipeline is guarded by `if __name__ == "__main__"`.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    # Parse a few files ahead of the consumer, but never the whole corpus at once
+    prefetch = prefetch or max_workers * 2
+
+    own_workers = workers is None
+    if own_workers:
+        # Threads and connections of the caller may already be live, so the workers start from a fresh interpreter
+        workers = multiprocessing.get_context("spawn").Pool(processes=max_workers)
+
+    try:
+        remaining = iter(enumerate(paths))
+        pending = deque()
+
+        def submit_next():
+            for document_index, path in remaining:
+                pending.append((document_index, workers.apply_async(parse_pdf, (path, layout))))
+                return
+
+        for _ in range(prefetch):
+            submit_next()
+
+        while pending:
+            # Results are consumed in submission order, which keeps the page stream deterministic
+            document_index, result = pending.popleft()
+            submit_next()
+            path, pages, error = result.get()
+            if error:
+                print(f"Error loading document {path}: {error}")
+                continue
+            for text, metadata in pages:
+                metadata["document_index"] = document_index
+                yield Document(page_content=text, metadata=metadata)
+    finally:
+        if own_workers:
+            workers.terminate()
+            workers.join()
+
+def load_corpus(path_or_glob: str, max_workers: Optional[int] = None, layout: str = "pypdf",
+                workers=None) -> Iterator[Document]:
+    """Stream the pages of every PDF in a directory or glob pattern"""
+    paths = resolve_corpus(path_or_glob)
+    print(f"Found {len(paths)} PDF documents in {path_or_glob}.")
+    return iter_corpus_pages(paths, max_workers=max_workers, layout=layout, workers=workers)
+
+def load_pdf_lazily(file_path: str, layout: str = "pypdf") -> Iterator[Document]:
+    """Stream the pages of one PDF, logging loading errors instead of raising them"""
+    try:
+        yield from iter_pdf_pages(file_path, layout)
+    except Exception as e:
+        # Log any errors that occur during document loading for debugging
+        print(f"Error loading documents: {e}")
+
+# Measure parsing throughput for one process and for a process pool on a local corpus
+if __name__ == "__main__":
+    import time
+
+    corpus = sys.argv[1] if len(sys.argv) > 1 else "."
+    corpus_paths = resolve_corpus(corpus)
+    for workers in sorted({1, os.cpu_count() or 1}):
+        start = time.perf_counter()
+        page_count = sum(1 for _ in iter_corpus_pages(corpus_paths, max_workers=workers))
+        elapsed = time.perf_counter() - start
+        print(f"{workers} process(es): {len(corpus_paths)} files, {page_count} pages in {elapsed:.2f}s "
+              f"({page_count / elapsed if elapsed else 0:.1f} pages/s)")
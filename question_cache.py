@@ -0,0 +1,332 @@
+# Persistent cache of question-to-SPARQL translations for the retrieval scenarios
+# Generating the SPARQL query is an LLM round trip that dominates the latency of a question, and users ask the
+# same questions all day with different case, punctuation and wording ("What are Hdbkpic?", "what is hdbkpic").
+# Questions are normalized to a set of content words (lowercase, no punctuation or stopwords, plural "s"
+# stripped) and a stored query is reused when the token-set similarity to a cached question reaches the
+# threshold. Long words may differ by a typo, numbers must match exactly. Entries can be pinned (never evicted
+# or overwritten) or evicted by hand, and lookups are counted as exact hits, fuzzy hits or misses.
+#please make sure you install the following packages
+#!pip install langchain_core
+import difflib
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+# Words that do not change which triples a question is about
+STOPWORDS = frozenset("""
+a about all an and any are as at be been can could describe detail details did do does explain for from give
+i in information is it its know list me more my of on or please provide show some tell that the their there
+these this those to us was we were what which with would you
+""".split())
+
+_WORD = re.compile(r"[^\W_]+(?:[_\-.][^\W_]+)*")
+
+def question_tokens(question: str) -> FrozenSet[str]:
+    """Normalize a question to its set of content words"""
+    tokens = set()
+    for word in _WORD.findall(question.lower()):
+        if word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss") and not word.isdigit():
+            word = word[:-1]
+        tokens.add(word)
+    return frozenset(tokens)
+
+def question_key(tokens: FrozenSet[str]) -> str:
+    return " ".join(sorted(tokens))
+
+def question_scope(template: str, model_id: str) -> str:
+    """Scope of cached translations; a changed prompt template or model starts a new scope"""
+    return hashlib.sha256(f"{model_id}\n{template}".encode("utf-8")).hexdigest()[:16]
+
+def _fuzzy_token(token: str) -> bool:
+    # Only long alphabetic words may differ by a typo; ids and note numbers must match exactly
+    return len(token) >= 5 and token.isalpha()
+
+def token_set_similarity(a: FrozenSet[str], b: FrozenSet[str], token_cutoff: float = 0.85) -> float:
+    """Jaccard similarity of two token sets where long words may match with a small spelling difference"""
+    if not a or not b:
+        return 0.0
+    matched = len(a & b)
+    rest_b = [token for token in b - a if _fuzzy_token(token)]
+    for token in a - b:
+        if not _fuzzy_token(token) or not rest_b:
+            continue
+        close = difflib.get_close_matches(token, rest_b, n=1, cutoff=token_cutoff)
+        if close:
+            matched += 1
+            rest_b.remove(close[0])
+    return matched / (len(a) + len(b) - matched)
+
+_CREATE_SCOPES = ("CREATE TABLE IF NOT EXISTS scopes ("
+                  "scope TEXT NOT NULL PRIMARY KEY, name TEXT NOT NULL, registered REAL NOT NULL) WITHOUT ROWID")
+
+def known_scopes(path: str = ".kge_cache/questions.sqlite") -> List[Dict]:
+    """Return every scope of a cache file with its name (if registered) and entry counts, newest first"""
+    if not os.path.exists(path):
+        return []
+    db = sqlite3.connect(path)
+    try:
+        db.execute(_CREATE_SCOPES)
+        rows = db.execute(
+            "SELECT q.scope, s.name, COUNT(*), SUM(q.pinned), MAX(q.last_used) FROM questions q"
+            " LEFT JOIN scopes s ON s.scope = q.scope GROUP BY q.scope, s.name ORDER BY MAX(q.last_used) DESC"
+        ).fetchall()
+    finally:
+        db.close()
+    return [dict(scope=scope, name=name, entries=entries, pinned=pinned, last_used=last_used)
+            for scope, name, entries, pinned, last_used in rows]
+
+def resolve_scope(scope_or_name: str, path: str = ".kge_cache/questions.sqlite") -> str:
+    """Return the latest scope registered under a name (e.g. "scenario4"), or the argument itself"""
+    if not os.path.exists(path):
+        return scope_or_name
+    db = sqlite3.connect(path)
+    try:
+        db.execute(_CREATE_SCOPES)
+        row = db.execute("SELECT scope FROM scopes WHERE name = ? ORDER BY registered DESC LIMIT 1",
+                         (scope_or_name,)).fetchone()
+    finally:
+        db.close()
+    return row[0] if row else scope_or_name
+
+class QuestionCache:
+    """Question-to-SPARQL translations in a local SQLite file with exact and fuzzy lookup"""
+
+    def __init__(self, path: str = ".kge_cache/questions.sqlite", scope: str = "default",
+                 threshold: float = 0.8, max_entries: int = 5000, name: Optional[str] = None):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path                # Location of the cache file
+        self.scope = scope              # Prompt template and model the translations belong to
+        self.name = name                # Readable name of the scope for the admin commands, e.g. "scenario4"
+        self.threshold = threshold      # Minimum token-set similarity for a fuzzy hit
+        self.max_entries = max_entries  # Upper bound on unpinned entries per scope
+        self.exact_hits = 0             # Lookups whose normalized question was cached
+        self.fuzzy_hits = 0             # Lookups answered from a similar question
+        self.misses = 0                 # Lookups that needed the query-generation LLM call
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS questions ("
+            "scope TEXT NOT NULL, key TEXT NOT NULL, question TEXT NOT NULL, query TEXT NOT NULL,"
+            " pinned INTEGER NOT NULL DEFAULT 0, hits INTEGER NOT NULL DEFAULT 0, created REAL NOT NULL,"
+            " last_used REAL NOT NULL, PRIMARY KEY (scope, key)) WITHOUT ROWID"
+        )
+        self._db.execute(_CREATE_SCOPES)
+        if name is not None:
+            # The latest scope registered under a name is the one the admin commands resolve it to
+            self._db.execute("INSERT INTO scopes (scope, name, registered) VALUES (?, ?, ?) ON CONFLICT (scope)"
+                             " DO UPDATE SET name = excluded.name, registered = excluded.registered",
+                             (scope, name, time.time()))
+        self._db.commit()
+        # In-memory index of the scope: key -> (query, pinned) and token -> keys
+        self._queries: Dict[str, Tuple[str, bool]] = {}
+        self._index: Dict[str, Set[str]] = defaultdict(set)
+        for key, query, pinned in self._db.execute(
+                "SELECT key, query, pinned FROM questions WHERE scope = ?", (scope,)):
+            self._add_to_index(key, query, bool(pinned))
+
+    def _add_to_index(self, key: str, query: str, pinned: bool):
+        self._queries[key] = (query, pinned)
+        for token in key.split():
+            self._index[token].add(key)
+
+    def _remove_from_index(self, key: str):
+        self._queries.pop(key, None)
+        for token in key.split():
+            keys = self._index.get(token)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._index[token]
+
+    def match(self, question: str) -> Optional[Tuple[str, str, float]]:
+        """Return (cached key, query, similarity) of the best cached question, without counting the lookup"""
+        tokens = question_tokens(question)
+        if not tokens:
+            return None
+        key = question_key(tokens)
+        with self._lock:
+            if key in self._queries:
+                return key, self._queries[key][0], 1.0
+            candidates: Set[str] = set()
+            for token in tokens:
+                candidates |= self._index.get(token, set())
+                if _fuzzy_token(token):
+                    vocabulary = [word for word in self._index if _fuzzy_token(word)]
+                    for close in difflib.get_close_matches(token, vocabulary, n=3, cutoff=0.85):
+                        candidates |= self._index[close]
+            best = None
+            for candidate in candidates:
+                similarity = token_set_similarity(tokens, frozenset(candidate.split()))
+                pinned = self._queries[candidate][1]
+                # Pinned entries win ties
+                rank = (similarity, pinned)
+                if similarity >= self.threshold and (best is None or rank > best[0]):
+                    best = (rank, candidate)
+            if best is None:
+                return None
+            return best[1], self._queries[best[1]][0], best[0][0]
+
+    def lookup(self, question: str) -> Optional[str]:
+        """Return the cached SPARQL query for a question or a similar one, or None on a miss"""
+        found = self.match(question)
+        with self._lock:
+            if found is None:
+                self.misses += 1
+                return None
+            key, query, similarity = found
+            if key == question_key(question_tokens(question)):
+                self.exact_hits += 1
+            else:
+                self.fuzzy_hits += 1
+            self._db.execute("UPDATE questions SET hits = hits + 1, last_used = ? WHERE scope = ? AND key = ?",
+                             (time.time(), self.scope, key))
+            self._db.commit()
+        return query
+
+    def _put(self, question: str, query: str, pinned: bool):
+        tokens = question_tokens(question)
+        if not tokens:
+            return
+        key = question_key(tokens)
+        now = time.time()
+        with self._lock:
+            if not pinned and self._queries.get(key, ("", False))[1]:
+                return  # Generated queries never replace a pinned one
+            self._db.execute(
+                "INSERT INTO questions (scope, key, question, query, pinned, hits, created, last_used)"
+                " VALUES (?, ?, ?, ?, ?, 0, ?, ?) ON CONFLICT (scope, key) DO UPDATE SET question = excluded.question,"
+                " query = excluded.query, pinned = excluded.pinned, last_used = excluded.last_used",
+                (self.scope, key, question, query, int(pinned), now, now))
+            self._remove_from_index(key)
+            self._add_to_index(key, query, pinned)
+            self._evict_overflow()
+            self._db.commit()
+
+    def _evict_overflow(self):
+        """Remove the least recently used unpinned entries beyond max_entries"""
+        count = self._db.execute("SELECT COUNT(*) FROM questions WHERE scope = ? AND pinned = 0",
+                                 (self.scope,)).fetchone()[0]
+        if count <= self.max_entries:
+            return
+        stale = [row[0] for row in self._db.execute(
+            "SELECT key FROM questions WHERE scope = ? AND pinned = 0 ORDER BY last_used LIMIT ?",
+            (self.scope, count - self.max_entries))]
+        self._db.executemany("DELETE FROM questions WHERE scope = ? AND key = ?",
+                             [(self.scope, key) for key in stale])
+        for key in stale:
+            self._remove_from_index(key)
+
+    def store(self, question: str, query: str):
+        """Remember the query generated for a question"""
+        self._put(question, query, pinned=False)
+
+    def pin(self, question: str, query: str):
+        """Store a hand-checked query for a question; pinned entries are never evicted or overwritten"""
+        self._put(question, query, pinned=True)
+
+    def evict(self, question: str) -> bool:
+        """Forget the entry of a question (e.g. after its query turned out to be wrong)"""
+        key = question_key(question_tokens(question))
+        with self._lock:
+            deleted = self._db.execute("DELETE FROM questions WHERE scope = ? AND key = ?",
+                                       (self.scope, key)).rowcount
+            self._db.commit()
+            self._remove_from_index(key)
+        return bool(deleted)
+
+    def entries(self) -> List[Dict]:
+        """Return every entry of the scope, most used first"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT question, query, pinned, hits, last_used FROM questions WHERE scope = ?"
+                " ORDER BY pinned DESC, hits DESC", (self.scope,)).fetchall()
+        return [dict(question=question, query=query, pinned=bool(pinned), hits=hits, last_used=last_used)
+                for question, query, pinned, hits, last_used in rows]
+
+    def hit_rate(self) -> float:
+        lookups = self.exact_hits + self.fuzzy_hits + self.misses
+        return (self.exact_hits + self.fuzzy_hits) / lookups if lookups else 0.0
+
+    def __len__(self) -> int:
+        return len(self._queries)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+def print_question_cache_stats(cache: QuestionCache):
+    """Print hit counters of the translation cache"""
+    pinned = sum(1 for _, is_pinned in cache._queries.values() if is_pinned)
+    print(f"Question cache: {cache.exact_hits} exact hits, {cache.fuzzy_hits} fuzzy hits, {cache.misses} misses "
+          f"({cache.hit_rate():.0%} hit rate); {len(cache)} entries, {pinned} pinned.")
+
+# Admin commands, or a demo with a simulated query-generation LLM when called without arguments.
+# <scope> is a scope hash or the name a scenario registers it under ("scenario4", "scenario5"):
+#   python question_cache.py list
+#   python question_cache.py list <scope>
+#   python question_cache.py pin <scope> "<question>" "<SPARQL query>"
+#   python question_cache.py evict <scope> "<question>"
+if __name__ == "__main__":
+    if sys.argv[1:] == ["list"]:
+        for known in known_scopes():
+            print(f"{known['scope']}  {known['name'] or '-':12s} {known['entries']:6d} entries, "
+                  f"{known['pinned']} pinned")
+        sys.exit(0)
+    if len(sys.argv) > 2:
+        command, scope = sys.argv[1], resolve_scope(sys.argv[2])
+        admin_cache = QuestionCache(scope=scope)
+        if command == "list":
+            for entry in admin_cache.entries():
+                print(f"{'*' if entry['pinned'] else ' '} {entry['hits']:5d}  {entry['question']}")
+        elif command == "pin" and len(sys.argv) == 5:
+            admin_cache.pin(sys.argv[3], sys.argv[4])
+            print(f"Pinned: {sys.argv[3]}")
+        elif command == "evict" and len(sys.argv) == 4:
+            print("Evicted." if admin_cache.evict(sys.argv[3]) else "No such question.")
+        else:
+            print(__doc__ or "Usage: question_cache.py list|pin|evict <scope> ...")
+        admin_cache.close()
+        sys.exit(0)
+
+    import random
+    import tempfile
+
+    def generate_query(question: str) -> str:
+        # Stand-in for the structured LLM call in write_query
+        time.sleep(1.5)
+        term = "_".join(sorted(question_tokens(question)))
+        return f'SELECT ?s ?p ?o WHERE {{ ?s ?p ?o . FILTER(REGEX(str(?s), "{term}", "i")) }}'
+
+    asked = ["What are Hdbkpic?", "what is hdbkpic", "What is HDBKPIC", "Tell me about hdbkpics",
+             "What are SAP HANA Hotspots", "what are sap hana hotspots?", "SAP HANA hotspot",
+             "What is a savepoint?", "Explain savepoints", "What is SAP note 2927209?", "SAP note 2927201",
+             "What are the hotspots of SAP HANA", "what is hdbkpci"]
+    random.seed(1)
+    questions = [random.choice(asked) for _ in range(60)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = QuestionCache(os.path.join(directory, "questions.sqlite"), scope="demo")
+        cache.pin("What are SAP HANA Hotspots", 'SELECT ?s ?p ?o WHERE { ?s ?p ?o . '
+                  'FILTER(REGEX(str(?s), "SAP_HANA_Hotspots", "i") || REGEX(str(?o), "SAP_HANA_Hotspots", "i")) }')
+        start = time.perf_counter()
+        for question in questions:
+            query = cache.lookup(question)
+            if query is None:
+                cache.store(question, generate_query(question))
+        elapsed = time.perf_counter() - start
+        print(f"{len(questions)} questions in {elapsed:.1f}s with the cache, "
+              f"{len(questions) * 1.5:.1f}s without (1.5s per query-generation call)")
+        print_question_cache_stats(cache)
+        for entry in cache.entries():
+            print(f"{'*' if entry['pinned'] else ' '} {entry['hits']:3d}  {entry['question']}")
+        cache.close()
@@ -0,0 +1,158 @@
+# Relevance ranking and token-budget packing of SPARQL results before summarization
+# summarize_info used to paste the raw SPARQL_EXECUTE XML into the prompt. A broad REGEX filter can match
+# thousands of bindings, and the XML markup alone costs several times the tokens of the facts it carries.
+# The reducer parses the bindings, shortens every URI to its readable local name, drops duplicates and scores
+# each triple by its word overlap with the question (subject matches count most) and by the importance of its
+# predicate. The best triples are then written as compact "subject | predicate | object" lines until the token
+# budget is used up, so the summarization prompt stays the same size however many rows the query returned.
+#please make sure you install the following packages
+#!pip install tiktoken
+import heapq
+import re
+from itertools import chain
+from typing import Callable, Dict, List, Optional, Tuple
+
+from typing_extensions import TypedDict
+
+from chunk_packing import make_token_counter
+from question_cache import question_tokens
+from sparql_results import iter_result_rows
+
+# Relative importance of predicates for answering a question; unknown predicates weigh 1.0
+DEFAULT_PREDICATE_WEIGHTS = {
+    "description": 2.0, "definition": 2.0, "comment": 1.5, "text": 1.5, "label": 1.5, "name": 1.5,
+    "is_a": 1.3, "has_part": 1.2, "part_of": 1.2, "uses": 1.2, "causes": 1.2, "solves": 1.2,
+    "type": 0.4, "related_to": 0.8, "mentions": 0.6, "sameas": 0.2,
+}
+
+class PackingResult(TypedDict):
+    """Compact result text and the numbers of the reduction."""
+    text: str
+    rows: int
+    unique_rows: int
+    packed_rows: int
+    tokens: int
+    raw_tokens: int
+
+def local_name(value: str) -> str:
+    """Readable form of a URI: the part after the last '/' or '#', with underscores as spaces"""
+    if value.startswith(("http://", "https://", "urn:")):
+        value = re.split(r"[/#]", value.rstrip("/#"))[-1] or value
+    return value.replace("_", " ").strip()
+
+def parse_bindings(xml_response: str) -> Tuple[List[str], List[Dict[str, str]]]:
+    """Return the variable names and the rows of a SPARQL XML result document"""
+    variables: List[str] = []
+    rows = list(iter_result_rows(xml_response, variables=variables))
+    return variables, rows
+
+def _words(text: str) -> frozenset:
+    return question_tokens(text.replace("_", " "))
+
+class ResultReducer:
+    """Rank SPARQL result rows by relevance to the question and pack the best into a token budget"""
+
+    def __init__(self, token_budget: int = 3000, predicate_weights: Optional[Dict[str, float]] = None,
+                 token_counter: Optional[Callable[[str], int]] = None):
+        self.token_budget = token_budget                  # Upper bound on tokens of the packed result
+        self.predicate_weights = {key.lower(): weight for key, weight in
+                                  (predicate_weights or DEFAULT_PREDICATE_WEIGHTS).items()}
+        self.token_counter = token_counter or make_token_counter()
+
+    def predicate_weight(self, predicate: str) -> float:
+        return self.predicate_weights.get(local_name(predicate).lower().replace(" ", "_"), 1.0)
+
+    def score(self, question_words: frozenset, row: Dict[str, str], columns: List[str]) -> float:
+        """Word overlap with the question (subject, object, then anything else) times predicate importance"""
+        score = 0.0
+        for position, column in enumerate(columns):
+            overlap = len(question_words & _words(local_name(row.get(column, ""))))
+            # Earlier columns (the subject) say more about what a row is about
+            score += overlap * (2.0 if position == 0 else 1.0)
+        predicate = row.get("p")
+        weight = self.predicate_weight(predicate) if predicate else 1.0
+        # Rows without any overlap keep a small predicate-based score so they can fill leftover budget
+        return (score + 0.1) * weight
+
+    def reduce(self, question: str, xml_response: str) -> PackingResult:
+        """Parse, rank and pack a SPARQL XML response"""
+        # Rows are streamed from the XML; only the distinct lines and their scores are kept
+        variables: List[str] = []
+        rows = iter_result_rows(xml_response, variables=variables)
+        first = next(rows, None)  # The result head has been read once the first row (or the end) is reached
+        raw_tokens = self.token_counter(xml_response)
+        # Subject, predicate, object first; any other projected variables after them
+        columns = [name for name in ("s", "p", "o") if name in variables] + \
+                  [name for name in variables if name not in ("s", "p", "o")]
+        question_words = _words(question)
+
+        seen = set()
+        scored = []
+        row_count = 0
+        for index, row in enumerate(chain([first], rows) if first is not None else ()):
+            row_count += 1
+            line = " | ".join(local_name(row.get(column, "")) for column in columns)
+            if line in seen:
+                continue
+            seen.add(line)
+            scored.append((self.score(question_words, row, columns), index, line))
+
+        # Take rows in score order until the budget is spent; the ranking is lazy so huge results stay cheap
+        header = " | ".join(columns)
+        used = self.token_counter(header)
+        packed: List[Tuple[int, str]] = []
+        heap = [(-score, index, line) for score, index, line in scored]
+        heapq.heapify(heap)
+        while heap:
+            _, index, line = heapq.heappop(heap)
+            tokens = self.token_counter(line) + 1
+            if used + tokens > self.token_budget:
+                if tokens > self.token_budget // 4:
+                    continue  # One oversized literal should not end the packing
+                break
+            used += tokens
+            packed.append((index, line))
+        # Keep the original result order among the packed rows, which keeps related triples together
+        packed.sort()
+        text = "\n".join([header] + [line for _, line in packed])
+        return PackingResult(text=text, rows=row_count, unique_rows=len(scored), packed_rows=len(packed),
+                             tokens=used, raw_tokens=raw_tokens)
+
+def print_packing_result(result: PackingResult):
+    """Print the size reduction of a packed result"""
+    print(f"Result packing: {result['rows']} rows ({result['unique_rows']} unique), {result['packed_rows']} packed "
+          f"into {result['tokens']} tokens instead of {result['raw_tokens']} tokens of the raw response.")
+
+# Reduce large and small results of a broad REGEX query against the in-memory SPARQL_EXECUTE stand-in
+if __name__ == "__main__":
+    import random
+    import time
+
+    from rdflib import Literal, URIRef
+    from rdflib.namespace import RDF
+
+    from local_sparql_standin import LocalSparqlEndpoint
+
+    base = "http://new_test_mission_faqhanahotspots.org/"
+    random.seed(7)
+    topics = ["Hdbkpic", "Savepoint", "Delta_Merge", "Column_Store", "Memory_Allocator", "Statistics_Server"]
+    endpoint = LocalSparqlEndpoint()
+    graph = endpoint.dataset.default_graph
+    for i in range(4000):
+        topic = random.choice(topics)
+        entity = URIRef(f"{base}{topic}_Item_{i}")
+        graph.add((entity, RDF.type, URIRef(f"{base}Concept")))
+        graph.add((entity, URIRef(f"{base}RELATED_TO"), URIRef(f"{base}{random.choice(topics)}")))
+    graph.add((URIRef(f"{base}Hdbkpic"), URIRef(f"{base}description"),
+               Literal("HDBKPIC collects key performance indicators of SAP HANA services")))
+
+    reducer = ResultReducer(token_budget=1500)
+    question = "What are Hdbkpic?"
+    for limit in (200, 2000, 12000):
+        query = f"SELECT ?s ?p ?o WHERE {{ ?s ?p ?o . FILTER(STRSTARTS(STR(?s), \"{base}\")) }} LIMIT {limit}"
+        xml_response = endpoint.execute(query, "")[0]
+        start = time.perf_counter()
+        result = reducer.reduce(question, xml_response)
+        print(f"LIMIT {limit}: reduced in {time.perf_counter() - start:.2f}s")
+        print_packing_result(result)
+    print([line for line in result["text"].splitlines() if "description" in line])
@@ -0,0 +1,371 @@
+# In-memory cache of SPARQL_EXECUTE query results for the retrieval scenarios
+# Queries are keyed on a normalized form of their text: whitespace and keyword case are ignored, variables are
+# renamed in order of first use and the FILTERs of every group pattern are sorted, so a common question that
+# produces the same query with different formatting or variable names is answered from memory. Every key also
+# carries a graph version stamp kept in a small SQLite file; ingestion runs bump the stamp, which drops every
+# cached result of the old graph. Entries are evicted least recently used first and expire after a TTL.
+#please make sure you install the following packages
+#!pip install hdbcli rdflib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sparql_results import detect_format
+
+# One SPARQL token: IRI, string literal, comment, variable, word (keyword, prefixed name or number) or symbol
+_TOKEN = re.compile(
+    r'(?P<iri><[^<>"{}|^`\\\s]*>)'
+    r'|(?P<string>"""(?:[^"\\]|\\.|"(?!""))*"""|\'\'\'(?:[^\'\\]|\\.|\'(?!\'\'))*\'\'\''
+    r'|"(?:[^"\\\n]|\\.)*"|\'(?:[^\'\\\n]|\\.)*\')'
+    r'|(?P<comment>#[^\n]*)'
+    r'|(?P<var>[?$]\w+)'
+    r'|(?P<word>[\w:][\w\-.:%]*(?<!\.))'
+    r'|(?P<space>\s+)'
+    r'|(?P<symbol>&&|\|\||!=|<=|>=|\^\^|.)',
+    re.DOTALL,
+)
+
+# Variable names in SPARQL XML results
+_RESULT_NAME = re.compile(r'(<(?:variable|binding) name=")([^"]+)(")')
+
+# Keywords that start an update request, which is never cached
+_UPDATE_KEYWORDS = ("INSERT", "DELETE", "LOAD", "CLEAR", "DROP", "CREATE", "WITH", "ADD", "MOVE", "COPY")
+
+_BRACKETS = {"(": ")", "{": "}", "[": "]"}
+
+def _tokenize(query: str) -> List[Tuple[str, str]]:
+    tokens = []
+    for match in _TOKEN.finditer(query):
+        kind = match.lastgroup
+        if kind in ("space", "comment"):
+            continue
+        text = match.group()
+        if kind == "word" and ":" not in text:
+            # Keywords and function names are case-insensitive; prefixed names are not
+            text = text.upper()
+        elif kind == "var":
+            # ?x and $x are the same variable
+            text = text[1:]
+        tokens.append((kind, text))
+    return tokens
+
+def sparql_token_spans(query: str) -> List[Tuple[str, str, int, int]]:
+    """Return (kind, original text, start, end) of every token of a query, without spaces and comments"""
+    return [(match.lastgroup, match.group(), match.start(), match.end()) for match in _TOKEN.finditer(query)
+            if match.lastgroup not in ("space", "comment")]
+
+def _balanced(tokens: List[Tuple[str, str]], start: int) -> int:
+    """Return the index after the bracketed expression that starts at or after `start`"""
+    i = start
+    while i < len(tokens) and tokens[i][1] not in _BRACKETS:
+        i += 1
+    depth = []
+    while i < len(tokens):
+        text = tokens[i][1]
+        if tokens[i][0] == "symbol" and text in _BRACKETS:
+            depth.append(_BRACKETS[text])
+        elif tokens[i][0] == "symbol" and depth and text == depth[-1]:
+            depth.pop()
+            if not depth:
+                return i + 1
+        i += 1
+    return i
+
+def _group(tokens: List[Tuple[str, str]], i: int) -> Tuple[Dict, int]:
+    """Parse a token run into a group with its patterns and FILTERs separated, up to the closing brace"""
+    group = {"items": [], "filters": []}
+    while i < len(tokens):
+        kind, text = tokens[i]
+        if kind == "symbol" and text == "}":
+            return group, i + 1
+        if kind == "symbol" and text == "{":
+            inner, i = _group(tokens, i + 1)
+            group["items"].append(inner)
+            continue
+        if kind == "word" and text == "FILTER":
+            end = _balanced(tokens, i + 1)
+            group["filters"].append(tokens[i:end])
+            i = end
+            continue
+        group["items"].append(tokens[i])
+        i += 1
+    return group, i
+
+def _rename(group: Dict, names: Dict[str, str]):
+    """Assign canonical names to variables in order of first appearance, patterns before FILTERs"""
+    for item in group["items"]:
+        if isinstance(item, dict):
+            _rename(item, names)
+        elif item[0] == "var" and item[1] not in names:
+            names[item[1]] = f"v{len(names)}"
+    for tokens in group["filters"]:
+        for kind, text in tokens:
+            if kind == "var" and text not in names:
+                names[text] = f"v{len(names)}"
+
+def _emit(group: Dict, names: Dict[str, str], out: List[str]):
+    def text_of(token):
+        return f"?{names[token[1]]}" if token[0] == "var" else token[1]
+
+    for item in group["items"]:
+        if isinstance(item, dict):
+            out.append("{")
+            _emit(item, names, out)
+            out.append("}")
+        else:
+            out.append(text_of(item))
+    # A FILTER applies to its whole group, so its position within the group does not matter
+    out.extend(sorted(" ".join(text_of(token) for token in tokens) for tokens in group["filters"]))
+
+@lru_cache(maxsize=4096)
+def normalize_sparql(query: str) -> Tuple[str, Dict[str, str]]:
+    """Return the normalized query text and the mapping from its variable names to the canonical ones"""
+    tokens = _tokenize(query)
+    root, _ = _group(tokens, 0)
+    names: Dict[str, str] = {}
+    _rename(root, names)
+    out: List[str] = []
+    _emit(root, names, out)
+    return " ".join(out), names
+
+def is_update(query: str) -> bool:
+    """Check whether a SPARQL request is an update rather than a query"""
+    for kind, text in _tokenize(query):
+        if kind == "word" and text not in ("PREFIX", "BASE") and ":" not in text:
+            return text in _UPDATE_KEYWORDS
+    return False
+
+def rename_result_variables(response: str, mapping: Dict[str, str], result_format: Optional[str] = None) -> str:
+    """Rename the variables of a SPARQL XML, JSON or TSV result document"""
+    if not mapping or all(old == new for old, new in mapping.items()):
+        return response
+    result_format = result_format or detect_format(response)
+    if result_format == "json":
+        # Variable names are the head's vars and the keys of every binding
+        document = json.loads(response)
+        head = document.get("head", {})
+        if "vars" in head:
+            head["vars"] = [mapping.get(name, name) for name in head["vars"]]
+        for binding in document.get("results", {}).get("bindings", []):
+            for old in [name for name in binding if mapping.get(name, name) != name]:
+                binding[mapping[old]] = binding.pop(old)
+        return json.dumps(document, ensure_ascii=False)
+    if result_format == "tsv":
+        # Only the header line names the variables
+        header, newline, rows = response.partition("\n")
+        names = [name.strip() for name in header.rstrip("\r").split("\t")] if header.strip() else []
+        renamed = "\t".join(name[0] + mapping.get(name[1:], name[1:]) if name[:1] in "?$" and name
+                             else mapping.get(name, name) for name in names)
+        return renamed + ("\r" if header.endswith("\r") else "") + newline + rows
+    return _RESULT_NAME.sub(lambda m: m.group(1) + mapping.get(m.group(2), m.group(2)) + m.group(3), response)
+
+class GraphVersions:
+    """Per-graph version stamps in a local SQLite file, shared by ingestion and retrieval processes"""
+
+    def __init__(self, path: str = ".kge_cache/graph_versions.sqlite"):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path       # Location of the version file
+        self.generation = 0    # Incremented on every bump made through this object
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS versions ("
+                         "graph TEXT PRIMARY KEY, version INTEGER NOT NULL, updated REAL NOT NULL)")
+        self._db.commit()
+
+    def bump(self, graph: Optional[str] = None):
+        """Record that a graph (or the default graph) changed"""
+        with self._lock:
+            self._db.execute("INSERT INTO versions (graph, version, updated) VALUES (?, 1, ?) "
+                             "ON CONFLICT (graph) DO UPDATE SET version = version + 1, updated = excluded.updated",
+                             (graph or "default", time.time()))
+            self._db.commit()
+            self.generation += 1
+
+    def stamp(self, graph: Optional[str] = None) -> int:
+        """Version of one graph, or of all graphs together when no graph is given"""
+        with self._lock:
+            if graph is None:
+                row = self._db.execute("SELECT COALESCE(SUM(version), 0) FROM versions").fetchone()
+            else:
+                row = self._db.execute("SELECT COALESCE(MAX(version), 0) FROM versions WHERE graph = ?",
+                                       (graph,)).fetchone()
+        return row[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+class SparqlResultCache:
+    """LRU and TTL bounded cache of SPARQL_EXECUTE results keyed on the normalized query and the graph version"""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 300.0, graph: Optional[str] = None,
+                 versions: Optional[GraphVersions] = None, version_check_interval: float = 1.0):
+        self.max_entries = max_entries                        # Upper bound on cached results
+        self.ttl = ttl                                        # Seconds a result stays valid
+        self.graph = graph                                    # Graph whose version is tracked (None = all)
+        self.versions = versions or GraphVersions()           # Version stamps bumped by ingestion
+        self.version_check_interval = version_check_interval  # Seconds between reads of the version file
+        self.hits = 0           # Lookups answered from memory
+        self.misses = 0         # Lookups that needed a database round trip
+        self.evictions = 0      # Entries removed to stay under max_entries
+        self.expirations = 0    # Entries dropped after their TTL
+        self.invalidations = 0  # Entries dropped because the graph changed
+        # Key -> (stored at, response, variable names of the stored query, responses renamed for other names)
+        self._entries: "OrderedDict[Tuple, Tuple[float, tuple, Dict[str, str], Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stamp = self.versions.stamp(graph)
+        self._generation = self.versions.generation
+        self._checked = time.monotonic()
+
+    def _current_stamp(self) -> int:
+        """Re-read the version stamp after a local bump or once per check interval"""
+        now = time.monotonic()
+        if self._generation != self.versions.generation or now - self._checked >= self.version_check_interval:
+            self._generation = self.versions.generation
+            self._checked = now
+            stamp = self.versions.stamp(self.graph)
+            if stamp != self._stamp:
+                with self._lock:
+                    self.invalidations += len(self._entries)
+                    self._entries.clear()
+                    self._stamp = stamp
+        return self._stamp
+
+    def get(self, query: str, headers: str = "") -> Optional[tuple]:
+        """Return the cached SPARQL_EXECUTE response for a query, with the caller's variable names, or None"""
+        stamp = self._current_stamp()
+        normalized, names = normalize_sparql(query)
+        key = (normalized, headers, stamp)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            stored_at, resp, stored_names, renamed = entry
+            if now - stored_at > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            if names == stored_names or not isinstance(resp[2], str):
+                return resp
+            variant = tuple(sorted(names.items()))
+            response = renamed.get(variant)
+        if response is None:
+            # Map the canonical names back to the variable names used by this query, once per naming
+            canonical = {value: name for name, value in names.items()}
+            mapping = {old: canonical.get(new, old) for old, new in stored_names.items()}
+            metadata = resp[3] if len(resp) > 3 and isinstance(resp[3], str) else None
+            response = rename_result_variables(resp[2], mapping, detect_format(resp[2], metadata))
+            with self._lock:
+                renamed[variant] = response
+        return (query, resp[1], response, *resp[3:])
+
+    def put(self, query: str, resp: tuple, headers: str = ""):
+        """Store a SPARQL_EXECUTE response"""
+        stamp = self._current_stamp()
+        normalized, names = normalize_sparql(query)
+        with self._lock:
+            self._entries[(normalized, headers, stamp)] = (time.monotonic(), tuple(resp), names, {})
+            self._entries.move_to_end((normalized, headers, stamp))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def callproc(self, callproc: Callable[[str, tuple], tuple], name: str, params: tuple) -> tuple:
+        """Answer a SPARQL_EXECUTE call from the cache, or make it through `callproc` and cache the response"""
+        query, headers = params[0], params[1] or ""
+        if name != "SPARQL_EXECUTE" or is_update(query):
+            return callproc(name, params)
+        resp = self.get(query, headers)
+        if resp is None:
+            resp = callproc(name, params)
+            if resp:
+                self.put(query, resp, headers)
+        return resp
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+def print_sparql_cache_stats(cache: SparqlResultCache):
+    """Print hit, miss and eviction counters of the result cache"""
+    lookups = cache.hits + cache.misses
+    rate = cache.hits / lookups if lookups else 0.0
+    print(f"SPARQL result cache: {cache.hits} hits, {cache.misses} misses ({rate:.0%} hit rate), "
+          f"{len(cache)} entries, {cache.evictions} evicted, {cache.expirations} expired, "
+          f"{cache.invalidations} invalidated by ingestion.")
+
+# Answer repeated retrieval queries from the cache against the in-memory SPARQL_EXECUTE stand-in
+if __name__ == "__main__":
+    import tempfile
+
+    from rdflib import Literal, URIRef
+
+    from hana_pool import HanaConnectionPool
+    from hana_sparql_writer import SparqlBulkWriter
+    from local_sparql_standin import LocalSparqlEndpoint
+    from sparql_results import iter_result_rows, result_headers
+
+    base = "http://new_test_mission_faqhanahotspots.org/"
+    headers = "Metadata headers describing Input and/or Output"
+    endpoint = LocalSparqlEndpoint(latency=0.02)
+    pool = HanaConnectionPool(endpoint.connect, min_size=1, max_size=2)
+
+    with tempfile.TemporaryDirectory() as directory:
+        versions = GraphVersions(os.path.join(directory, "graph_versions.sqlite"))
+        writer = SparqlBulkWriter(pool.connect, max_triples_per_batch=1000, max_connections=2)
+        writer.graph_versions = versions
+        writer.write((URIRef(f"{base}Entity_{i}"), URIRef(f"{base}RELATED_TO"), URIRef(f"{base}Topic_{i % 50}"))
+                     for i in range(5000))
+
+        # The same question phrased by the LLM with different formatting, variable names and FILTER order
+        variants = [
+            f'SELECT ?s ?p ?o WHERE {{ ?s ?p ?o . FILTER(REGEX(str(?o), "Topic_7$", "i")) '
+            f'FILTER(STRSTARTS(STR(?s), "{base}")) }}',
+            f'select ?subject ?p ?object\nwhere {{\n  ?subject ?p ?object .\n'
+            f'  filter(strstarts(str(?subject), "{base}"))\n  filter(regex(str(?object), "Topic_7$", "i"))\n}}',
+        ]
+        cache = SparqlResultCache(max_entries=256, ttl=300.0, versions=versions)
+        timings = {"miss": [], "hit": []}
+        for i in range(200):
+            query = variants[i % 2]
+            start = time.perf_counter()
+            before = cache.hits
+            resp = cache.callproc(pool.callproc, 'SPARQL_EXECUTE', (query, headers, '?', None))
+            timings["hit" if cache.hits > before else "miss"].append(time.perf_counter() - start)
+        for kind, values in timings.items():
+            print(f"{kind}: {len(values)} calls, average {sum(values) / len(values) * 1e6:.0f} us")
+        print("Variables of the last answer:", _RESULT_NAME.findall(resp[2])[:3])
+
+        # JSON and TSV answers are renamed as well, so a hit uses the variable names of the asking query
+        for result_format in ("json", "tsv"):
+            format_cache = SparqlResultCache(versions=versions)
+            for query, expected in zip(variants, (["s", "p", "o"], ["subject", "p", "object"])):
+                resp = format_cache.callproc(pool.callproc, 'SPARQL_EXECUTE',
+                                             (query, result_headers(result_format), '?', None))
+                names: List[str] = []
+                rows = list(iter_result_rows(resp[2], variables=names))
+                assert names == expected and set(rows[0]) == set(expected), (result_format, names)
+            print(f"{result_format}: {format_cache.hits} hit answered with variables {names}")
+
+        # An ingestion run bumps the graph version, so the next lookup goes back to the database
+        writer.write([(URIRef(f"{base}Entity_new"), URIRef(f"{base}RELATED_TO"), URIRef(f"{base}Topic_7"))])
+        cache.callproc(pool.callproc, 'SPARQL_EXECUTE', (variants[0], headers, '?', None))
+        print_sparql_cache_stats(cache)
+        versions.close()
+    pool.close()
@@ -0,0 +1,387 @@
+# Parsers and format negotiation for SPARQL_EXECUTE result documents
+# SPARQL_EXECUTE returns the whole result set as one XML string. Building an ElementTree of it keeps an element
+# object for every result, binding and value alive at once, which for a few hundred thousand rows takes
+# hundreds of megabytes before the first row is used. The parser here feeds the document to expat in slices
+# with a parser target that builds the rows directly, without any element objects, and yields one row of
+# bindings at a time, so memory stays at the size of one slice plus the rows the caller keeps. Values are
+# returned as plain strings or as rdflib terms (URIRef, Literal with datatype or language tag, BNode), either
+# row by row or filled directly into one list per variable. Scenario 7, the result reducer and the
+# delta-ingestion manifest scan share it.
+# XML is also the most verbose result format. ResultFormatNegotiator asks SPARQL_EXECUTE for
+# application/sparql-results+json or text/tab-separated-values instead, remembers what the server actually
+# returns and falls back to XML when a format is rejected (406 or a similar error) or ignored. Other errors
+# are raised right away. iter_result_rows recognizes the format of a response, so callers read JSON (one
+# json.loads call) and TSV (one split per line) results unchanged.
+#please make sure you install the following packages
+#!pip install rdflib
+import json
+import re
+import threading
+import xml.etree.ElementTree as ET
+from typing import Callable, Dict, Iterator, List, Optional, Set, Union
+
+from rdflib import BNode, Literal, URIRef
+
+# Namespace of SPARQL XML result documents
+SPARQL_RESULTS_NS = "{http://www.w3.org/2005/sparql-results#}"
+_XML_LANG = "{http://www.w3.org/XML/1998/namespace}lang"
+
+_VARIABLE = f"{SPARQL_RESULTS_NS}variable"
+_BINDING = f"{SPARQL_RESULTS_NS}binding"
+_RESULT = f"{SPARQL_RESULTS_NS}result"
+_LITERAL = f"{SPARQL_RESULTS_NS}literal"
+_BNODE = f"{SPARQL_RESULTS_NS}bnode"
+
+# Characters (or bytes) fed to the parser at a time
+_CHUNK_SIZE = 1 << 16
+
+# Media types of the result formats SPARQL_EXECUTE can be asked for
+RESULT_MEDIA_TYPES = {
+    "json": "application/sparql-results+json",
+    "tsv": "text/tab-separated-values",
+    "xml": "application/sparql-results+xml",
+}
+
+# A TSV literal: quoted string with an optional language tag or datatype
+_TSV_LITERAL = re.compile(r'"((?:[^"\\]|\\.)*)"(?:@([A-Za-z0-9-]+)|\^\^<([^>]*)>)?$')
+_TSV_ESCAPE = re.compile(r"\\(u[0-9A-Fa-f]{4}|U[0-9A-Fa-f]{8}|.)")
+_TSV_ESCAPES = {"t": "\t", "n": "\n", "r": "\r", "b": "\b", "f": "\f", '"': '"', "'": "'", "\\": "\\"}
+_XSD = "http://www.w3.org/2001/XMLSchema#"
+
+# Error messages of servers that do not support the requested result format (406 Not Acceptable and similar)
+_FORMAT_REJECTION = re.compile(r"not acceptable|unsupported (?:media|content|result|output) (?:type|format)|"
+                               r"(?:accept|content-type) header", re.IGNORECASE)
+
+def _slices(source) -> Iterator[Union[str, bytes]]:
+    if isinstance(source, (str, bytes)):
+        for start in range(0, len(source), _CHUNK_SIZE):
+            yield source[start:start + _CHUNK_SIZE]
+        return
+    # File-like objects, e.g. an HTTP response body
+    while True:
+        data = source.read(_CHUNK_SIZE)
+        if not data:
+            return
+        yield data
+
+def result_value(tag: str, text: str, attrib: Dict[str, str], terms: bool = False):
+    """Value of a uri, literal or bnode element, as text ("_:" prefixed for bnodes) or as an rdflib term"""
+    if not terms:
+        return f"_:{text}" if tag == _BNODE else text
+    if tag == _LITERAL:
+        return Literal(text, lang=attrib.get(_XML_LANG), datatype=attrib.get("datatype"))
+    if tag == _BNODE:
+        return BNode(text)
+    return URIRef(text)
+
+class _ResultTarget:
+    """Parser target that builds result rows directly, without creating element objects"""
+
+    def __init__(self, terms: bool, variables: Optional[List[str]]):
+        self.terms = terms
+        self.variables = variables
+        self.rows: List[Dict] = []  # Finished rows not yet handed out
+        self._row: Dict = {}
+        self._name: Optional[str] = None  # Variable of the open <binding>
+        self._attrib: Dict[str, str] = {}
+        self._text: List[str] = []
+
+    def start(self, tag: str, attrib: Dict[str, str]):
+        if tag == _BINDING:
+            self._name = attrib.get("name")
+        elif tag == _VARIABLE:
+            if self.variables is not None:
+                self.variables.append(attrib.get("name"))
+        elif self._name is not None:
+            # The value element inside a binding
+            self._attrib = attrib
+            self._text = []
+
+    def data(self, text: str):
+        if self._name is not None:
+            self._text.append(text)
+
+    def end(self, tag: str):
+        if tag == _RESULT:
+            self.rows.append(self._row)
+            self._row = {}
+        elif tag == _BINDING:
+            self._name = None
+        elif self._name is not None:
+            self._row[self._name] = result_value(tag, "".join(self._text), self._attrib, self.terms)
+
+    def close(self):
+        return None
+
+def iter_xml_rows(source, terms: bool = False, variables: Optional[List[str]] = None) -> Iterator[Dict]:
+    """Yield the bindings of a SPARQL XML result document one row at a time"""
+    target = _ResultTarget(terms, variables)
+    parser = ET.XMLParser(target=target)
+    for data in _slices(source):
+        parser.feed(data)
+        if target.rows:
+            rows, target.rows = target.rows, []
+            yield from rows
+    parser.close()
+    yield from target.rows
+
+def _json_value(value: Dict[str, str], terms: bool):
+    text = value.get("value", "")
+    kind = value.get("type")
+    if not terms:
+        return f"_:{text}" if kind == "bnode" else text
+    if kind in ("literal", "typed-literal"):
+        return Literal(text, lang=value.get("xml:lang"), datatype=value.get("datatype"))
+    if kind == "bnode":
+        return BNode(text)
+    return URIRef(text)
+
+def iter_json_rows(source, terms: bool = False, variables: Optional[List[str]] = None) -> Iterator[Dict]:
+    """Yield the bindings of a SPARQL JSON result document one row at a time"""
+    document = json.loads(source if isinstance(source, (str, bytes)) else source.read())
+    if variables is not None:
+        variables.extend(document.get("head", {}).get("vars", []))
+    for binding in document.get("results", {}).get("bindings", []):
+        yield {name: _json_value(value, terms) for name, value in binding.items()}
+
+def _unescape(text: str) -> str:
+    if "\\" not in text:
+        return text
+    def replace(match):
+        escape = match.group(1)
+        if escape[0] in "uU" and len(escape) > 1:
+            return chr(int(escape[1:], 16))
+        return _TSV_ESCAPES.get(escape, escape)
+    return _TSV_ESCAPE.sub(replace, text)
+
+def tsv_value(text: str, terms: bool = False):
+    """Value of one TSV result field (an N-Triples style term); None for an unbound field"""
+    if not text:
+        return None
+    first = text[0]
+    if first == "<":
+        return URIRef(text[1:-1]) if terms else text[1:-1]
+    if first == "_":
+        return BNode(text[2:]) if terms else text
+    if first == '"':
+        match = _TSV_LITERAL.match(text)
+        if match is None:
+            raise ValueError(f"Malformed literal in TSV results: {text[:80]}")
+        value = _unescape(match.group(1))
+        return Literal(value, lang=match.group(2), datatype=match.group(3)) if terms else value
+    # Turtle shorthand for numbers and booleans
+    if not terms:
+        return text
+    if text in ("true", "false"):
+        return Literal(text, datatype=f"{_XSD}boolean")
+    if "e" in text or "E" in text:
+        return Literal(text, datatype=f"{_XSD}double")
+    return Literal(text, datatype=f"{_XSD}decimal" if "." in text else f"{_XSD}integer")
+
+def iter_tsv_rows(source, terms: bool = False, variables: Optional[List[str]] = None) -> Iterator[Dict]:
+    """Yield the bindings of a SPARQL TSV result document one row at a time"""
+    if isinstance(source, bytes):
+        source = source.decode("utf-8")
+    lines = iter(source.splitlines() if isinstance(source, str) else source)
+    header = next(lines, "")
+    names = [name.strip().lstrip("?$") for name in header.rstrip("\r\n").split("\t")] if header.strip() else []
+    if variables is not None:
+        variables.extend(names)
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if not line:
+            continue
+        yield {name: tsv_value(field, terms) for name, field in zip(names, line.split("\t")) if field}
+
+def detect_format(response, metadata: Optional[str] = None) -> str:
+    """Result format of a SPARQL_EXECUTE response, from its Content-Type or its first character"""
+    if metadata:
+        for result_format, media_type in RESULT_MEDIA_TYPES.items():
+            if media_type in metadata:
+                return result_format
+    head = response[:256]
+    if isinstance(head, bytes):
+        head = head.decode("utf-8", "ignore")
+    head = head.lstrip("\ufeff \t\r\n")
+    if head.startswith("{"):
+        return "json"
+    if head.startswith("<") or not head:
+        return "xml"
+    return "tsv"
+
+_PARSERS = {"xml": iter_xml_rows, "json": iter_json_rows, "tsv": iter_tsv_rows}
+
+def iter_result_rows(source, terms: bool = False, variables: Optional[List[str]] = None,
+                     result_format: Optional[str] = None) -> Iterator[Dict]:
+    """Yield the bindings of a SPARQL result document (XML, JSON or TSV) one row at a time
+
+    `source` is the result string, bytes or a file-like object; the format is recognized from strings and
+    bytes, and file-like objects are read as XML unless `result_format` is given. Unbound variables are
+    missing from a row. If a list is passed as `variables`, the variable names of the result head are
+    appended to it.
+    """
+    if result_format is None:
+        result_format = detect_format(source) if isinstance(source, (str, bytes)) else "xml"
+    return _PARSERS[result_format](source, terms, variables)
+
+def is_format_rejection(error: Exception) -> bool:
+    """Check whether an error means the server rejected the requested result format, not the query"""
+    for candidate in (error, getattr(error, "response", None)):
+        if getattr(candidate, "status_code", None) in (406, 415):
+            return True
+    return _FORMAT_REJECTION.search(str(error)) is not None
+
+def result_headers(result_format: str = "xml") -> str:
+    """SPARQL_EXECUTE request headers asking for results in the given format"""
+    return f"Accept: {RESULT_MEDIA_TYPES[result_format]} Content-Type: application/sparql-query"
+
+class ResultFormatNegotiator:
+    """Ask SPARQL_EXECUTE for compact result formats and fall back to XML when the server does not support them"""
+
+    def __init__(self, preferred=("json", "tsv", "xml")):
+        self.preferred = [name for name in preferred if name != "xml"] + ["xml"]  # XML is always the last resort
+        self.result_format: Optional[str] = None  # Format the server was seen to return
+        self.unsupported: Set[str] = set()        # Formats the server rejected or ignored
+        self.fallbacks = 0                        # Requests repeated or answered in another format
+        self._lock = threading.Lock()
+
+    def callproc(self, callproc: Callable[[str, tuple], tuple], name: str, params: tuple) -> tuple:
+        """Make a SPARQL_EXECUTE call through `callproc` with the best supported result format"""
+        request, _, *rest = params
+        with self._lock:
+            settled = self.result_format
+            candidates = [settled] if settled else [f for f in self.preferred if f not in self.unsupported]
+        rejected = []
+        for position, result_format in enumerate(candidates):
+            try:
+                resp = callproc(name, (request, result_headers(result_format), *rest))
+            except Exception as e:
+                if settled or position == len(candidates) - 1 or not is_format_rejection(e):
+                    # A confirmed format, the last format or an error about the query or the connection:
+                    # trying other formats would not help, and the format may well be supported
+                    raise
+                rejected.append(result_format)
+                continue
+            with self._lock:
+                # A later format worked, so the earlier ones were rejected for their format
+                self.unsupported.update(rejected)
+                self.fallbacks += len(rejected)
+                if resp and len(resp) > 2 and resp[2]:
+                    actual = detect_format(resp[2], resp[3] if len(resp) > 3 else None)
+                    if actual == result_format:
+                        self.result_format = actual
+                    else:
+                        # The Accept header was ignored; the response is still usable and the next
+                        # request tries the next format
+                        self.unsupported.add(result_format)
+                        self.fallbacks += 1
+            return resp
+
+def read_columns(source, terms: bool = False, result_format: Optional[str] = None) -> Dict[str, List]:
+    """Read a SPARQL result document into one list per variable; None marks unbound values"""
+    variables: List[str] = []
+    columns: Dict[str, List] = {}
+    count = 0
+    for row in iter_result_rows(source, terms, variables, result_format):
+        if not columns:
+            columns = {name: [] for name in variables}
+        for name in row.keys() - columns.keys():
+            # A binding for a variable missing from the head
+            columns[name] = [None] * count
+        for name, column in columns.items():
+            column.append(row.get(name))
+        count += 1
+    return columns or {name: [] for name in variables}
+
+# Compare building a full ElementTree with the streaming parser on large result documents
+if __name__ == "__main__":
+    import time
+    import tracemalloc
+
+    def result_document(rows: int) -> str:
+        """SPARQL XML result document with URI, typed literal, language-tagged literal and bnode values"""
+        parts = ['<?xml version="1.0"?><sparql xmlns="http://www.w3.org/2005/sparql-results#">'
+                 '<head><variable name="s"/><variable name="p"/><variable name="o"/></head><results>']
+        base = "http://new_test_mission_faqhanahotspots.org/"
+        for i in range(rows):
+            if i % 3 == 0:
+                value = f'<literal datatype="http://www.w3.org/2001/XMLSchema#integer">{i}</literal>'
+            elif i % 3 == 1:
+                value = f'<literal xml:lang="en">Savepoint {i}</literal>'
+            else:
+                value = f"<bnode>b{i}</bnode>"
+            parts.append(f'<result><binding name="s"><uri>{base}Concept_{i}</uri></binding>'
+                         f'<binding name="p"><uri>{base}RELATED_TO</uri></binding>'
+                         f'<binding name="o">{value}</binding></result>')
+        parts.append("</results></sparql>")
+        return "".join(parts)
+
+    def element_tree_rows(xml_response: str) -> int:
+        """The former approach: parse the whole tree, then walk it"""
+        root = ET.fromstring(xml_response)
+        count = 0
+        for result in root.findall(f".//{_RESULT}"):
+            row = {binding.attrib["name"]: binding[0].text for binding in result}
+            count += bool(row)
+        return count
+
+    def streamed_rows(xml_response: str) -> int:
+        return sum(1 for _ in iter_result_rows(xml_response))
+
+    for rows in (100000, 300000):
+        document = result_document(rows)
+        print(f"{rows} rows, {len(document) / 1e6:.0f} MB of XML")
+        for label, parse in (("ElementTree", element_tree_rows), ("streaming", streamed_rows)):
+            tracemalloc.start()
+            start = time.perf_counter()
+            count = parse(document)
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"  {label}: {count} rows in {seconds:.2f}s, peak memory {peak / 1e6:.1f} MB")
+
+    columns = read_columns(result_document(3), terms=True)
+    print({name: [value.n3() for value in column] for name, column in columns.items() if name == "o"})
+
+    # Payload size and parse time of the same result set in the three formats of the stand-in
+    from rdflib.namespace import RDFS
+
+    from local_sparql_standin import LocalSparqlEndpoint
+
+    base = "http://new_test_mission_faqhanahotspots.org/"
+    endpoint = LocalSparqlEndpoint()
+    graph = endpoint.dataset.default_graph
+    for i in range(50000):
+        graph.add((URIRef(f"{base}Concept_{i}"), URIRef(f"{base}RELATED_TO"), URIRef(f"{base}Topic_{i % 97}")))
+        graph.add((URIRef(f"{base}Concept_{i}"), RDFS.label, Literal(f"Concept {i}", lang="en")))
+    query = "SELECT ?s ?p ?o WHERE { ?s ?p ?o }"
+    print(f"\n{len(graph)} rows from the stand-in")
+    for result_format in ("xml", "json", "tsv"):
+        response, metadata = endpoint.execute(query, result_headers(result_format))
+        start = time.perf_counter()
+        count = sum(1 for _ in iter_result_rows(response, terms=True))
+        print(f"  {result_format}: {len(response.encode('utf-8')) / 1e6:.1f} MB, {count} rows parsed "
+              f"in {time.perf_counter() - start:.2f}s")
+
+    # Negotiation settles on the best format each server supports
+    for formats in (("xml", "json", "tsv"), ("xml", "tsv"), ("xml",)):
+        server = LocalSparqlEndpoint(result_formats=formats)
+        server.dataset.default_graph.add((URIRef(f"{base}Hdbkpic"), RDFS.label, Literal("HDBKPIC")))
+        negotiator = ResultFormatNegotiator()
+        for _ in range(3):
+            resp = negotiator.callproc(server.connect().cursor().callproc, 'SPARQL_EXECUTE',
+                                       (query, 'Metadata headers describing Input and/or Output', '?', None))
+        print(f"Server with {', '.join(formats)}: negotiated {negotiator.result_format} "
+              f"({negotiator.fallbacks} fallback(s)), rows {list(iter_result_rows(resp[2]))}")
+
+    # Errors about the query or the connection are raised at once and do not mark a format unsupported
+    server = LocalSparqlEndpoint()
+    negotiator = ResultFormatNegotiator()
+    for request in ("SELECT ?s WHERE { ?s ?p }", query):
+        calls = server.calls
+        try:
+            negotiator.callproc(server.connect().cursor().callproc, 'SPARQL_EXECUTE', (request, '', '?', None))
+            outcome = f"negotiated {negotiator.result_format}"
+        except Exception as e:
+            outcome = f"raised {type(e).__name__}"
+        print(f"{request[:26]}: {outcome} after {server.calls - calls} call(s), unsupported {negotiator.unsupported}")
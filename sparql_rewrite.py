@@ -0,0 +1,362 @@
+# Rewriting of generated SPARQL queries into cheaper, index-friendly forms before they are executed
+# The query-generation prompt makes the LLM write FILTER(REGEX(str(?s), "...", "i") || ...) without a LIMIT.
+# A regular expression has to be compiled and run against every candidate string, while a literal prefix can
+# be answered from the sorted dictionary of the column store and a substring test is a plain scan. The
+# rewriter parses the query with rdflib's SPARQL algebra, then
+#   - turns REGEX filters with literal patterns into STRSTARTS / STRENDS / CONTAINS (LCASE for the "i" flag),
+#   - removes FILTERs that repeat an earlier FILTER of the same group,
+#   - pushes a STRSTARTS filter on the knowledge graph namespace into single-pattern queries,
+#   - scopes queries without FROM or GRAPH to the named graph the ingestion scenarios write to,
+#   - adds a default LIMIT to SELECT queries that have none.
+# rdflib's algebra serializer drops REGEX flags, so the edits are applied to the original query text and the
+# result is parsed again; a rewrite that does not parse or changes the projected variables is discarded.
+#please make sure you install the following packages
+#!pip install rdflib
+from typing import List, Optional, Tuple
+
+from rdflib.plugins.sparql.algebra import translateQuery
+from rdflib.plugins.sparql.parser import parseQuery
+from rdflib.term import Variable
+from typing_extensions import TypedDict
+
+from sparql_cache import sparql_token_spans
+
+# Rough relative cost of evaluating a filter function once, used to estimate the savings of a rewrite
+FUNCTION_COSTS = {"REGEX": 5.0, "CONTAINS": 1.0, "LCASE": 0.5, "STRSTARTS": 0.2, "STRENDS": 0.2}
+
+# Characters with a special meaning in a regular expression
+_REGEX_SPECIAL = set("^$*+?()[]{}|.")
+
+# Escape sequences of short SPARQL string literals
+_STRING_ESCAPES = {"t": "\t", "n": "\n", "r": "\r", "b": "\b", "f": "\f", '"': '"', "'": "'", "\\": "\\"}
+
+# Algebra nodes that only modify the solutions of the pattern below them
+_MODIFIERS = ("Slice", "Distinct", "Reduced", "Project", "OrderBy", "ToMultiSet")
+
+class RewriteReport(TypedDict):
+    """Rewritten query, the changes made and the estimated filter cost before and after."""
+    original: str
+    query: str
+    parsed: bool
+    changes: List[str]
+    cost_before: float
+    cost_after: float
+    estimated_savings: float
+
+Token = Tuple[str, str, int, int]
+
+def decode_string(text: str) -> Optional[str]:
+    """Value of a short SPARQL string literal token, or None for long or malformed literals"""
+    if len(text) < 2 or text[:3] in ('"""', "'''") or text[0] != text[-1]:
+        return None
+    value = []
+    chars = iter(text[1:-1])
+    for char in chars:
+        if char == "\\":
+            escaped = _STRING_ESCAPES.get(next(chars, ""))
+            if escaped is None:
+                return None
+            char = escaped
+        value.append(char)
+    return "".join(value)
+
+def encode_string(value: str) -> str:
+    """SPARQL string literal of a value"""
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+
+def literal_pattern(pattern: str) -> Optional[Tuple[str, str]]:
+    """Return (function, literal) when a regular expression only matches a literal prefix, suffix or substring"""
+    starts = pattern.startswith("^")
+    body = pattern[1:] if starts else pattern
+    ends = body.endswith("$") and not body.endswith("\\$")
+    body = body[:-1] if ends else body
+    if starts and ends:
+        return None
+    literal = []
+    i = 0
+    while i < len(body):
+        char = body[i]
+        if char == "\\":
+            # Only an escaped dot is read as a literal; other escapes are left to the regex engine
+            if body[i + 1:i + 2] == ".":
+                literal.append(".")
+                i += 2
+                continue
+            return None
+        if char in _REGEX_SPECIAL:
+            return None
+        literal.append(char)
+        i += 1
+    if not literal:
+        return None
+    return ("STRSTARTS" if starts else "STRENDS" if ends else "CONTAINS"), "".join(literal)
+
+def _closing(tokens: List[Token], i: int) -> int:
+    """Index of the bracket closing the one at tokens[i]"""
+    depth = 0
+    for j in range(i, len(tokens)):
+        if tokens[j][0] == "symbol" and tokens[j][1] in "({[":
+            depth += 1
+        elif tokens[j][0] == "symbol" and tokens[j][1] in ")}]":
+            depth -= 1
+            if depth == 0:
+                return j
+    return len(tokens) - 1
+
+def _arguments(tokens: List[Token], open_index: int, close_index: int) -> List[List[Token]]:
+    """Split the arguments of a function call at its top-level commas"""
+    arguments: List[List[Token]] = [[]]
+    depth = 0
+    for token in tokens[open_index + 1:close_index]:
+        if token[0] == "symbol" and token[1] in "({[":
+            depth += 1
+        elif token[0] == "symbol" and token[1] in ")}]":
+            depth -= 1
+        if depth == 0 and token[0] == "symbol" and token[1] == ",":
+            arguments.append([])
+        else:
+            arguments[-1].append(token)
+    return arguments
+
+def filter_cost(query: str) -> float:
+    """Estimated relative cost of the filter functions of a query, per evaluated row"""
+    return sum(FUNCTION_COSTS.get(text.upper(), 0.0)
+               for kind, text, _, _ in sparql_token_spans(query) if kind == "word")
+
+def _algebra(query: str):
+    return translateQuery(parseQuery(query)).algebra
+
+class SparqlRewriter:
+    """Rewrite generated SPARQL queries into cheaper forms that return the same triples"""
+
+    def __init__(self, namespace: Optional[str] = None, default_limit: Optional[int] = 1000,
+                 graph: Optional[str] = None):
+        self.namespace = namespace          # Namespace every retrieved subject must start with (None = any)
+        self.default_limit = default_limit  # LIMIT added to SELECT queries without one (None = no limit)
+        self.graph = graph                  # Named graph queried when the query names none (None = default graph)
+
+    def _regex_edits(self, query: str, tokens: List[Token], skip: List[Tuple[int, int]],
+                     changes: List[str]) -> List[Tuple[int, int, str]]:
+        """Replacements of REGEX calls whose pattern is a literal"""
+        edits = []
+        for i, (kind, text, start, _) in enumerate(tokens):
+            if kind != "word" or text.upper() != "REGEX" or i + 1 >= len(tokens) or tokens[i + 1][1] != "(":
+                continue
+            if any(low <= start < high for low, high in skip):
+                continue
+            close = _closing(tokens, i + 1)
+            arguments = _arguments(tokens, i + 1, close)
+            if len(arguments) not in (2, 3) or any(len(argument) != 1 for argument in arguments[1:]):
+                continue
+            if not arguments[0] or arguments[1][0][0] != "string":
+                continue
+            pattern = decode_string(arguments[1][0][1])
+            flags = decode_string(arguments[2][0][1]) if len(arguments) == 3 and arguments[2][0][0] == "string" \
+                else ("" if len(arguments) == 2 else None)
+            if pattern is None or flags is None or set(flags) - {"i"}:
+                continue
+            literal = literal_pattern(pattern)
+            if literal is None:
+                continue
+            function, value = literal
+            subject = query[arguments[0][0][2]:arguments[0][-1][3]]
+            if "i" in flags:
+                replacement = f"{function}(LCASE({subject}), {encode_string(value.lower())})"
+            else:
+                replacement = f"{function}({subject}, {encode_string(value)})"
+            edits.append((start, tokens[close][3], replacement))
+            changes.append(f"REGEX({subject}, {encode_string(pattern)}{', i' if flags else ''}) -> {function}")
+        return edits
+
+    def _duplicate_filters(self, tokens: List[Token], changes: List[str]) -> List[Tuple[int, int]]:
+        """Spans of FILTERs that repeat an earlier FILTER of the same group pattern"""
+        spans = []
+        groups = [0]
+        next_group = 1
+        seen = set()
+        i = 0
+        while i < len(tokens):
+            kind, text, start, _ = tokens[i]
+            if kind == "symbol" and text == "{":
+                groups.append(next_group)
+                next_group += 1
+            elif kind == "symbol" and text == "}" and len(groups) > 1:
+                groups.pop()
+            elif kind == "word" and text.upper() == "FILTER" and i + 1 < len(tokens):
+                # FILTER (expr), FILTER fn(args) or FILTER EXISTS { ... }
+                j = i + 1
+                while j < len(tokens) and tokens[j][1] not in "({":
+                    j += 1
+                if j >= len(tokens):
+                    break
+                end = _closing(tokens, j)
+                key = (groups[-1], " ".join(token[1].upper() if token[0] == "word" else token[1]
+                                             for token in tokens[i + 1:end + 1]))
+                if key in seen:
+                    spans.append((start, tokens[end][3]))
+                    changes.append("removed duplicate FILTER")
+                seen.add(key)
+                i = end + 1
+                continue
+            i += 1
+        return spans
+
+    def _namespace_filter(self, query: str, algebra) -> Optional[str]:
+        """Query with a STRSTARTS filter on the namespace, for queries over a single basic graph pattern"""
+        if not self.namespace or encode_string(self.namespace)[:-1] in query:
+            return None
+        node = algebra.p
+        while getattr(node, "name", None) in _MODIFIERS + ("Filter",):
+            node = node.p
+        if getattr(node, "name", None) != "BGP" or not node.triples:
+            return None
+        subject = node.triples[0][0]
+        if not isinstance(subject, Variable):
+            return None
+        tokens = sparql_token_spans(query)
+        brace = next((token for token in tokens if token[0] == "symbol" and token[1] == "{"), None)
+        if brace is None:
+            return None
+        pushed = f" FILTER(STRSTARTS(STR(?{subject}), {encode_string(self.namespace)}))"
+        return query[:brace[3]] + pushed + query[brace[3]:]
+
+    def _dataset_clause(self, query: str) -> Optional[str]:
+        """Query with a FROM clause for the graph, for queries that do not name a dataset or graph themselves"""
+        if not self.graph:
+            return None
+        tokens = sparql_token_spans(query)
+        if any(kind == "word" and text.upper() in ("FROM", "GRAPH") for kind, text, _, _ in tokens):
+            return None
+        braces = [i for i, token in enumerate(tokens) if token[0] == "symbol" and token[1] == "{"]
+        if not braces:
+            return None
+        brace = braces[0]
+        if brace > 0 and tokens[brace - 1][0] == "word" and tokens[brace - 1][1].upper() == "CONSTRUCT":
+            # Skip the template of CONSTRUCT { ... } WHERE { ... }
+            template_end = _closing(tokens, brace)
+            brace = next((i for i in braces if i > template_end), None)
+            if brace is None:
+                return None
+        if brace > 0 and tokens[brace - 1][0] == "word" and tokens[brace - 1][1].upper() == "WHERE":
+            brace -= 1
+        position = tokens[brace][2]
+        return f"{query[:position]}FROM <{self.graph}> {query[position:]}"
+
+    def rewrite(self, query: str) -> RewriteReport:
+        """Return the rewritten query and what was changed"""
+        cost = filter_cost(query)
+        report = RewriteReport(original=query, query=query, parsed=False, changes=[], cost_before=cost,
+                               cost_after=cost, estimated_savings=0.0)
+        try:
+            algebra = _algebra(query)
+        except Exception:
+            # Updates and queries rdflib cannot parse are sent unchanged
+            return report
+        report["parsed"] = True
+
+        changes: List[str] = []
+        tokens = sparql_token_spans(query)
+        deleted = self._duplicate_filters(tokens, changes)
+        edits = [(start, end, "") for start, end in deleted] + self._regex_edits(query, tokens, deleted, changes)
+        rewritten = query
+        for start, end, replacement in sorted(edits, reverse=True):
+            rewritten = rewritten[:start] + replacement + rewritten[end:]
+
+        with_namespace = self._namespace_filter(rewritten, algebra)
+        if with_namespace is not None:
+            rewritten = with_namespace
+            changes.append(f"pushed namespace filter STRSTARTS {self.namespace}")
+
+        with_dataset = self._dataset_clause(rewritten)
+        if with_dataset is not None:
+            rewritten = with_dataset
+            changes.append(f"queried graph <{self.graph}>")
+
+        if self.default_limit and algebra.name == "SelectQuery" and algebra.p.name != "Slice":
+            rewritten = f"{rewritten.rstrip()}\nLIMIT {self.default_limit}"
+            changes.append(f"added LIMIT {self.default_limit}")
+
+        if not changes:
+            return report
+        try:
+            # The rewrite must still parse and project the same variables
+            if _algebra(rewritten).get("PV") != algebra.get("PV"):
+                raise ValueError("projected variables changed")
+        except Exception as e:
+            report["changes"] = [f"rewrite discarded: {e}"]
+            return report
+        report["query"] = rewritten
+        report["changes"] = changes
+        report["cost_after"] = filter_cost(rewritten)
+        if cost:
+            report["estimated_savings"] = max(0.0, 1 - report["cost_after"] / cost)
+        return report
+
+def print_rewrite_report(report: RewriteReport):
+    """Print the changes of a rewrite and its estimated savings"""
+    if not report["changes"]:
+        return
+    print(f"SPARQL rewrite: {'; '.join(report['changes'])}")
+    print(f"Estimated filter cost per row {report['cost_before']:.1f} -> {report['cost_after']:.1f} "
+          f"({report['estimated_savings']:.0%} less)")
+
+# Run a typical generated REGEX query and its rewrite against the in-memory SPARQL_EXECUTE stand-in
+if __name__ == "__main__":
+    import time
+
+    from rdflib import URIRef
+    from rdflib.namespace import RDF
+
+    from local_sparql_standin import LocalSparqlEndpoint
+
+    base = "http://new_test_mission_faqhanahotspots.org/"
+    endpoint = LocalSparqlEndpoint()
+    graph = endpoint.dataset.default_graph
+    for i in range(30000):
+        graph.add((URIRef(f"{base}Concept_{i}"), URIRef(f"{base}RELATED_TO"), URIRef(f"{base}Topic_{i % 97}")))
+    for i in range(3000):
+        graph.add((URIRef(f"{base}SAP_HANA_Hotspots_{i}"), RDF.type, URIRef(f"{base}Hotspot")))
+        graph.add((URIRef(f"http://other.org/SAP_HANA_Hotspots_{i}"), RDF.type, URIRef(f"{base}Hotspot")))
+
+    generated = '''SELECT ?s ?p ?o
+WHERE {
+    ?s ?p ?o .
+    FILTER(
+        REGEX(str(?s), "SAP_HANA_Hotspots", "i") ||
+        REGEX(str(?o), "SAP_HANA_Hotspots", "i")
+    )
+    FILTER(REGEX(str(?s), "SAP_HANA_Hotspots", "i") || REGEX(str(?o), "SAP_HANA_Hotspots", "i"))
+}'''
+    # Filter rewrites only: the same rows come back
+    same_rows = SparqlRewriter(namespace=None, default_limit=None).rewrite(generated)
+    # Everything: only subjects in the namespace, at most 1000 rows
+    report = SparqlRewriter(namespace=base, default_limit=1000).rewrite(generated)
+    print(report["query"])
+    print_rewrite_report(report)
+
+    results = {}
+    for label, query in (("generated", generated), ("filters rewritten", same_rows["query"]),
+                         ("fully rewritten", report["query"])):
+        start = time.perf_counter()
+        results[label] = endpoint.execute(query, "")[0]
+        rows = results[label].count("<result>")
+        print(f"{label}: {rows} rows in {time.perf_counter() - start:.2f}s")
+    assert sorted(results["generated"].split("<result>")) == sorted(results["filters rewritten"].split("<result>"))
+
+    # "." matches any character, so a dotted pattern stays a REGEX; an escaped dot is a literal dot
+    rewriter = SparqlRewriter(namespace=None, default_limit=None)
+    for pattern, expected in (("SAP.HANA.Hotspots_7$", "REGEX"), ("Hotspots_7\\\\.$", "STRENDS")):
+        query = f'SELECT ?s WHERE {{ ?s a ?type . FILTER(REGEX(str(?s), "{pattern}", "i")) }}'
+        dotted = rewriter.rewrite(query)
+        assert expected in dotted["query"], dotted["query"]
+        rows = endpoint.execute(query, "")[0]
+        assert rows == endpoint.execute(dotted["query"], "")[0]
+        print(f"{pattern}: {rows.count('<result>')} rows, {dotted['changes'] or 'left unchanged'}")
+
+    # Queries without FROM or GRAPH only see the graph the ingestion scenarios wrote to
+    endpoint.dataset.graph(URIRef(f"{base}graph")).add((URIRef(f"{base}Savepoint"), RDF.type, URIRef(f"{base}Topic")))
+    scoped = SparqlRewriter(namespace=None, default_limit=None, graph=f"{base}graph")
+    for query in ("SELECT ?s WHERE { ?s a ?type }", "CONSTRUCT { ?s a ?type } WHERE { ?s a ?type }"):
+        report = scoped.rewrite(query)
+        rows = endpoint.execute(report["query"], "")[0]
+        print(f"{report['query']}: {rows.count('Savepoint')} of {len(endpoint)} triples")
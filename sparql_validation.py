@@ -0,0 +1,140 @@
+# Local validation of generated SPARQL queries and a bounded LLM repair loop
+# A malformed query from write_query used to travel to SAP HANA Cloud, fail there with "Error executing stored
+# procedure", and the resulting None was still summarized by the LLM. The checks here run in-process with
+# rdflib's SPARQL parser: syntax errors (with line and column), prefixed names whose prefix is not declared,
+# and variables that are projected but never bound by the query pattern. An invalid query is sent back to the
+# LLM together with the error messages a limited number of times; a question that still has no valid query is
+# answered as failed without a database call or a summarization request.
+#please make sure you install the following packages
+#!pip install rdflib
+from typing import Callable, Dict, List, Optional
+
+from rdflib.plugins.sparql.algebra import translateQuery
+from rdflib.plugins.sparql.parser import parseQuery
+from rdflib.plugins.sparql.parserutils import CompValue
+from rdflib.term import Variable
+from typing_extensions import TypedDict
+
+from sparql_cache import sparql_token_spans
+
+class RepairResult(TypedDict):
+    """Final query of the repair loop, whether it is valid and the remaining errors."""
+    query: str
+    valid: bool
+    errors: List[str]
+    attempts: int
+
+def undeclared_prefixes(query: str, known_prefixes: Optional[Dict[str, str]] = None) -> List[str]:
+    """Prefixes used in prefixed names without a PREFIX declaration"""
+    tokens = sparql_token_spans(query)
+    declared = set(known_prefixes or ())
+    used = []
+    for i, (kind, text, _, _) in enumerate(tokens):
+        if kind != "word" or ":" not in text:
+            continue
+        prefix = text.split(":", 1)[0]
+        if i > 0 and tokens[i - 1][0] == "word" and tokens[i - 1][1].upper() == "PREFIX":
+            declared.add(prefix)
+        elif prefix not in declared and prefix not in used:
+            used.append(prefix)
+    return used
+
+def _bound_variables(node, bound: set):
+    """Collect the variables a graph pattern can bind"""
+    if isinstance(node, CompValue):
+        if node.name == "BGP":
+            for triple in node.triples:
+                bound.update(term for term in triple if isinstance(term, Variable))
+        elif node.name == "Extend":
+            bound.add(node.var)
+        elif node.name == "values":
+            for row in node.res:
+                bound.update(row)
+        elif node.name == "Graph" and isinstance(node.term, Variable):
+            bound.add(node.term)
+        for value in node.values():
+            _bound_variables(value, bound)
+    elif isinstance(node, (list, tuple)):
+        for value in node:
+            _bound_variables(value, bound)
+
+def validate_sparql(query: Optional[str], known_prefixes: Optional[Dict[str, str]] = None) -> List[str]:
+    """Return the problems found in a query; an empty list means it can be sent to the database"""
+    if not query or not query.strip():
+        return ["The query is empty."]
+    # Undeclared prefixes are reported first, since rdflib would also resolve its own default prefixes
+    errors = [f"Prefix '{prefix}:' is used but not declared with PREFIX."
+              for prefix in undeclared_prefixes(query, known_prefixes)]
+    try:
+        parsed = parseQuery(query)
+    except Exception as e:
+        return errors + [f"Syntax error: {e}"]
+    try:
+        algebra = translateQuery(parsed, initNs=known_prefixes or {}).algebra
+    except Exception as e:
+        return errors or [f"Invalid query: {e}"]
+    if algebra.name == "SelectQuery":
+        bound: set = set()
+        _bound_variables(algebra.p, bound)
+        unbound = [f"?{var}" for var in algebra.get("PV") or [] if var not in bound]
+        if unbound:
+            errors.append(f"Projected variables {', '.join(unbound)} are never bound in the WHERE clause.")
+    return errors
+
+def repair_sparql(query: Optional[str], repair: Callable[[str, List[str]], str], max_attempts: int = 2,
+                  known_prefixes: Optional[Dict[str, str]] = None) -> RepairResult:
+    """Validate a query and ask `repair(query, errors)` for a corrected one until it is valid or attempts run out"""
+    errors = validate_sparql(query, known_prefixes)
+    attempts = 0
+    while errors and attempts < max_attempts:
+        attempts += 1
+        query = repair(query or "", errors)
+        errors = validate_sparql(query, known_prefixes)
+    return RepairResult(query=query or "", valid=not errors, errors=errors, attempts=attempts)
+
+def print_repair_result(result: RepairResult):
+    """Print the outcome of validation and repair"""
+    if result["valid"] and not result["attempts"]:
+        return
+    if result["valid"]:
+        print(f"SPARQL query repaired after {result['attempts']} attempt(s).")
+    else:
+        print(f"No valid SPARQL query after {result['attempts']} repair attempt(s): {' '.join(result['errors'])}")
+
+# Compare rejecting malformed queries locally with sending them to a simulated remote SPARQL_EXECUTE
+if __name__ == "__main__":
+    import time
+
+    from local_sparql_standin import LocalSparqlEndpoint
+
+    endpoint = LocalSparqlEndpoint(latency=0.25)  # Round trip to the database
+    broken = [
+        'SELECT ?s ?p ?o WHERE { ?s ?p ?o . FILTER(REGEX(str(?s), "Hdbkpic", "i") }',
+        'SELECT ?s ?o WHERE { ?s ex:RELATED_TO ?o . }',
+        'SELECT ?s ?label WHERE { ?s ?p ?o . }',
+    ]
+
+    start = time.perf_counter()
+    for query in broken:
+        try:
+            endpoint.connect().cursor().callproc('SPARQL_EXECUTE', (query, '', '?', None))
+        except Exception as e:
+            print("Database:", str(e).splitlines()[0][:90])
+    print(f"Sent to the database: {time.perf_counter() - start:.2f}s\n")
+
+    start = time.perf_counter()
+    for query in broken:
+        print("Local:", validate_sparql(query))
+    print(f"Validated locally: {time.perf_counter() - start:.3f}s\n")
+
+    # A stand-in for the LLM repair call: fixes one problem per attempt
+    def simulated_repair(query: str, errors: List[str]) -> str:
+        if errors[0].startswith("Syntax error"):
+            return query.replace('"i") }', '"i")) }')
+        if errors[0].startswith("Prefix"):
+            return "PREFIX ex: <http://new_test_mission_faqhanahotspots.org/>\n" + query
+        return query.replace("?label", "?o")
+
+    for query in broken:
+        result = repair_sparql(query, simulated_repair, max_attempts=2)
+        print_repair_result(result)
@@ -0,0 +1,118 @@
+# Adaptive concurrency and throttling handling of the async extraction engine against a fake LLM service
+import asyncio
+from types import SimpleNamespace
+
+from async_extraction import AdaptiveConcurrencyLimiter, AsyncExtractionEngine, TokenBucket, is_throttling_error
+
+class ThrottlingError(Exception):
+    """429 response of the fake service, carrying the status code like the OpenAI client errors"""
+    status_code = 429
+
+class FakeTransformer:
+    """Fake LLMGraphTransformer with a fixed latency that answers 429 above a concurrency quota"""
+
+    def __init__(self, latency=0.01, max_concurrent=6, hang=(), fail=()):
+        self.latency = latency
+        self.max_concurrent = max_concurrent
+        self.hang = set(hang)  # Chunk texts whose call never returns
+        self.fail = set(fail)  # Chunk texts whose call fails with a non-throttling error
+        self.in_flight = 0
+        self.peak = 0
+        self.calls = 0
+        self.throttled = 0
+
+    async def aconvert_to_graph_documents(self, chunks):
+        self.calls += 1
+        text = chunks[0].page_content
+        if text in self.fail:
+            raise ValueError("invalid response")
+        if self.in_flight >= self.max_concurrent:
+            self.throttled += 1
+            await asyncio.sleep(0.001)
+            raise ThrottlingError("Too Many Requests")
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(3600 if text in self.hang else self.latency)
+            return [SimpleNamespace(nodes=[], relationships=[], source=chunks[0])]
+        finally:
+            self.in_flight -= 1
+
+def make_chunks(count):
+    return [SimpleNamespace(page_content=f"chunk {i}", metadata={}) for i in range(count)]
+
+def make_engine(transformer, **options):
+    settings = dict(requests_per_minute=1_000_000, tokens_per_minute=1_000_000_000, initial_concurrency=2,
+                    max_concurrency=32, request_timeout=5.0, max_retries=8, retry_backoff=0.001)
+    settings.update(options)
+    return AsyncExtractionEngine(transformer, **settings)
+
+def test_limiter_grows_in_slow_start_and_halves_on_throttling():
+    async def scenario():
+        limiter = AdaptiveConcurrencyLimiter(initial=4, maximum=64, cooldown=60.0)
+        for _ in range(4):
+            await limiter.acquire()
+            await limiter.release()
+        assert limiter.limit == 8.0
+        await limiter.acquire()
+        await limiter.release(throttled=True)
+        assert limiter.limit == 4.0 and not limiter.slow_start
+        # A burst of 429s within the cooldown only halves the limit once
+        await limiter.acquire()
+        await limiter.release(throttled=True)
+        assert limiter.limit == 4.0
+        # Additive increase afterwards: about one slot per limit's worth of successes
+        for _ in range(4):
+            await limiter.acquire()
+            await limiter.release()
+        assert 4.9 < limiter.limit < 5.0
+    asyncio.run(scenario())
+
+def test_limiter_never_drops_below_minimum():
+    async def scenario():
+        limiter = AdaptiveConcurrencyLimiter(initial=2, minimum=1, cooldown=0.0)
+        for _ in range(5):
+            await limiter.acquire()
+            await limiter.release(throttled=True)
+        assert limiter.limit == 1.0
+    asyncio.run(scenario())
+
+def test_throttling_errors_are_recognized():
+    assert is_throttling_error(ThrottlingError())
+    assert is_throttling_error(SimpleNamespace(response=SimpleNamespace(status_code=429)))
+    bedrock = Exception("An error occurred")
+    bedrock.response = {"Error": {"Code": "ThrottlingException"}}
+    assert is_throttling_error(bedrock)
+    assert not is_throttling_error(ValueError("invalid response"))
+    assert not is_throttling_error(ValueError("SAP note 2429999: too many requests hit the rate limit"))
+
+def test_engine_backs_off_on_429_and_extracts_every_chunk():
+    transformer = FakeTransformer(latency=0.05, max_concurrent=6)
+    documents, report = make_engine(transformer, retry_backoff=0.02).extract(make_chunks(60))
+    assert [document.source.page_content for document in documents] == [f"chunk {i}" for i in range(60)]
+    assert report["chunks_failed"] == 0
+    assert report["throttled"] == transformer.throttled > 0
+    assert report["retries"] >= report["throttled"]
+    # The limit was cut back towards the service quota instead of growing to the maximum
+    assert report["final_concurrency"] < 32
+    assert transformer.peak <= 6
+
+def test_token_bucket_admits_no_more_than_the_burst_at_once():
+    async def scenario():
+        bucket = TokenBucket(rate_per_minute=600, capacity=5)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for _ in range(7):
+            await bucket.acquire()
+        return loop.time() - start
+    # Five requests pass at once, the next two wait for refills of 0.1s each
+    assert asyncio.run(scenario()) >= 0.15
+
+def test_hung_requests_time_out_and_other_errors_are_not_retried():
+    transformer = FakeTransformer(hang={"chunk 1"}, fail={"chunk 2"})
+    documents, report = make_engine(transformer, request_timeout=0.05, max_retries=1).extract(make_chunks(4))
+    assert [document.source.page_content for document in documents] == ["chunk 0", "chunk 3"]
+    assert report["timeouts"] == 2
+    assert report["chunks_failed"] == 2
+    # chunk 2 was tried once; chunk 1 once plus one retry
+    assert transformer.calls == 5
@@ -0,0 +1,31 @@
+# Resolving questions to indexed entities
+import pytest
+from rdflib import URIRef
+from rdflib.namespace import RDF
+
+from entity_index import EntityIndex
+
+BASE = "http://new_test_mission_faqhanahotspots.org/"
+GRAPH = f"{BASE}graph"
+
+@pytest.fixture
+def index(tmp_path):
+    index = EntityIndex(str(tmp_path / "entity_index.sqlite"))
+    names = ["Sap", "Hana", "Sap_Hana_Hotspots", "Savepoint_Duration", "SAP_HANA_Hotspots"]
+    index.add_triples(GRAPH, [(URIRef(f"{BASE}{name}"), RDF.type, URIRef(f"{BASE}Topic")) for name in names])
+    yield index
+    index.close()
+
+def test_specific_entity_wins_over_hub_entities(index):
+    assert index.resolve("What are SAP HANA Hotspots?", GRAPH, min_question_coverage=0.6) == [
+        f"{BASE}SAP_HANA_Hotspots", f"{BASE}Sap_Hana_Hotspots"]
+
+def test_hub_entity_alone_does_not_answer_the_question(index):
+    question = "How do I size the memory of an SAP HANA system?"
+    assert index.resolve(question, GRAPH) == [f"{BASE}Sap", f"{BASE}Hana"]
+    assert index.resolve(question, GRAPH, min_question_coverage=0.6) == []
+
+def test_entities_covering_the_question_are_resolved(index):
+    question = "How can I reduce the savepoint duration of SAP HANA?"
+    assert index.resolve(question, GRAPH, min_question_coverage=0.6) == [
+        f"{BASE}Savepoint_Duration", f"{BASE}Sap", f"{BASE}Hana"]
@@ -0,0 +1,104 @@
+# Batching, retries and failed-batch reporting of the bulk writers against the local SPARQL_EXECUTE stand-in
+import pytest
+from rdflib import Literal, URIRef
+
+from hana_sparql_writer import NTriplesBulkLoader, SparqlBulkWriter, format_triple, iter_batches
+from local_sparql_standin import LocalSparqlEndpoint
+
+BASE = "http://new_test_mission_faqhanahotspots.org/"
+GRAPH = f"{BASE}graph"
+
+class FlakyEndpoint(LocalSparqlEndpoint):
+    """Stand-in whose first calls fail, as after a dropped session"""
+
+    def __init__(self, failures: int, **kwargs):
+        super().__init__(**kwargs)
+        self.failures_left = failures
+
+    def execute(self, request, headers):
+        with self._lock:
+            fail = self.failures_left > 0
+            self.failures_left -= fail
+        if fail:
+            raise RuntimeError("SPARQL_EXECUTE failed: connection reset")
+        return super().execute(request, headers)
+
+def sample_triples(count):
+    return [(URIRef(f"{BASE}Entity_{i}"), URIRef(f"{BASE}RELATED_TO"), URIRef(f"{BASE}Entity_{i + 1}"))
+            for i in range(count)]
+
+def test_batches_are_bounded_by_triples_and_bytes():
+    statements = [format_triple(*triple) for triple in sample_triples(25)]
+    assert [len(batch) for batch in iter_batches(statements, 10, 1 << 20)] == [10, 10, 5]
+    size = len(statements[0].encode("utf-8"))
+    assert all(len(batch) <= 2 for batch in iter_batches(statements, 100, 2 * size + 20))
+    assert sum(iter_batches(statements, 10, 1 << 20), []) == statements
+
+@pytest.mark.parametrize("writer_class", [SparqlBulkWriter, NTriplesBulkLoader])
+def test_writes_every_triple_into_the_named_graph(writer_class):
+    endpoint = LocalSparqlEndpoint()
+    triples = sample_triples(250) + [(URIRef(f"{BASE}Entity_0"), URIRef(f"{BASE}description"),
+                                      Literal('Note "2000002"\nsee <table>'))]
+    options = dict(max_triples_per_batch=100) if writer_class is SparqlBulkWriter else dict(segment_size=100)
+    report = writer_class(endpoint.connect, max_connections=3, graph_name=GRAPH, **options).write(triples)
+    assert report["batches"] == 3
+    assert report["triples_written"] == len(triples)
+    assert report["triples_failed"] == 0 and report["failed_batches"] == []
+    assert len(endpoint.dataset.graph(URIRef(GRAPH))) == len(triples)
+
+def test_failed_calls_are_retried():
+    endpoint = FlakyEndpoint(failures=2)
+    writer = SparqlBulkWriter(endpoint.connect, max_triples_per_batch=100, max_connections=1, max_retries=3,
+                              retry_backoff=0.0)
+    report = writer.write(sample_triples(300))
+    assert report["triples_written"] == 300
+    assert report["retried_batches"] == 1
+    assert report["failed_batches"] == []
+    assert len(endpoint) == 300
+
+def test_failed_batches_are_reported_and_resent():
+    endpoint = FlakyEndpoint(failures=3)
+    writer = SparqlBulkWriter(endpoint.connect, max_triples_per_batch=100, max_connections=1, max_retries=2,
+                              retry_backoff=0.0)
+    report = writer.write(sample_triples(300))
+    assert report["batches"] == 3
+    assert report["triples_written"] == 200 and report["triples_failed"] == 100
+    [failed] = report["failed_batches"]
+    assert failed["attempts"] == 3
+    assert "connection reset" in failed["error"]
+    assert len(failed["statements"]) == 100
+    assert len(endpoint) == 200
+
+    retried = writer.retry_failed(report)
+    assert retried["triples_written"] == 100 and retried["failed_batches"] == []
+    assert len(endpoint) == 300
+
+def test_delete_statements_removes_triples():
+    endpoint = LocalSparqlEndpoint()
+    writer = SparqlBulkWriter(endpoint.connect, max_triples_per_batch=50, graph_name=GRAPH)
+    statements = [format_triple(*triple) for triple in sample_triples(120)]
+    writer.write_statements(statements)
+    report = writer.delete_statements(statements[:70])
+    assert report["triples_written"] == 70
+    assert len(endpoint.dataset.graph(URIRef(GRAPH))) == 50
+
+def test_batch_hook_sees_every_settled_batch_once():
+    endpoint = FlakyEndpoint(failures=1)
+    writer = SparqlBulkWriter(endpoint.connect, max_triples_per_batch=10, max_connections=2, max_retries=1,
+                              retry_backoff=0.0)
+    seen = []
+    writer.on_batch = lambda result, statements: seen.append((result["batch_id"], result["error"], len(statements)))
+    writer.write(sample_triples(35))
+    assert sorted(seen) == [(0, None, 10), (1, None, 10), (2, None, 10), (3, None, 5)]
+
+def test_batch_hook_errors_reach_the_caller_without_resending():
+    endpoint = LocalSparqlEndpoint()
+    writer = SparqlBulkWriter(endpoint.connect, max_triples_per_batch=10, max_connections=1, retry_backoff=0.0)
+
+    def failing_hook(result, statements):
+        raise ValueError("hook failed")
+
+    writer.on_batch = failing_hook
+    with pytest.raises(ValueError, match="hook failed"):
+        writer.write(sample_triples(5))
+    assert endpoint.calls == 1
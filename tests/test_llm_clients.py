@@ -0,0 +1,51 @@
+# Per-event-loop connection pools of the shared async httpx client against a local HTTP server
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from llm_clients import LLMClientFactory
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, so connections stay pooled after the requests
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/"
+    server.shutdown()
+
+def fetch(factory, url, calls=3):
+    async def run():
+        client = factory.async_http_client()
+        return [response.status_code for response in await asyncio.gather(*[client.get(url) for _ in range(calls)])]
+    return run()
+
+def test_pool_is_closed_when_its_loop_finishes(url):
+    factory = LLMClientFactory()
+    assert asyncio.run(fetch(factory, url)) == [200] * 3
+    assert asyncio.run(fetch(factory, url)) == [200] * 3
+    assert factory._async_transports[0]._transports == {}
+
+def test_close_closes_the_pool_of_an_open_loop(url):
+    factory = LLMClientFactory()
+    loop = asyncio.new_event_loop()
+    try:
+        assert loop.run_until_complete(fetch(factory, url)) == [200] * 3
+        transport, _ = factory._async_transports[0]._transports[loop]
+        assert transport._pool.connections
+        factory.close()
+        assert transport._pool.connections == []
+    finally:
+        loop.close()
@@ -0,0 +1,93 @@
+# Provenance of the revision tracker through the streaming pipeline, against the local SPARQL_EXECUTE stand-in
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.documents import Document
+from rdflib import Namespace, URIRef
+
+from chunk_dedup import ChunkDeduplicator
+from hana_sparql_writer import SparqlBulkWriter
+from kge_pipeline import StreamingIngestionPipeline
+from local_sparql_standin import LocalSparqlEndpoint
+from note_revisions import RevisionTracker
+from uri_factory import UriFactory
+
+EX = Namespace("http://new_test_mission_faqhanahotspots.org/")
+GRAPH = EX["graph"]
+
+class WordTransformer:
+    """Stand-in for LLM extraction: one Concept node per word of the chunk"""
+
+    def convert_to_graph_documents(self, chunks):
+        nodes = [SimpleNamespace(id=word.strip(".:"), type="Concept", properties={})
+                 for word in chunks[0].page_content.split()]
+        return [SimpleNamespace(nodes=nodes, relationships=[], source=chunks[0])]
+
+def pages_of(texts, file_name="2927209_E_20250101.pdf"):
+    return [Document(page_content=text, metadata={"source": file_name, "page": i}) for i, text in enumerate(texts)]
+
+@pytest.fixture
+def store(tmp_path):
+    endpoint = LocalSparqlEndpoint()
+    writer = SparqlBulkWriter(endpoint.connect, graph_name=GRAPH, retry_backoff=0.0)
+    return SimpleNamespace(endpoint=endpoint, writer=writer, path=str(tmp_path / "provenance.sqlite"))
+
+def ingest(store, tracker, chunks):
+    """One scenario run up to storing the revision: extract, record provenance while converting and write"""
+    factory = UriFactory(EX)
+    pipeline = StreamingIngestionPipeline(WordTransformer(), store.writer,
+                                          lambda document: tracker.record(document.source,
+                                                                          factory.convert([document])),
+                                          max_workers=1)
+    report = pipeline.run(chunks)
+    tracker.mark_failed(pipeline.failed_chunks)
+    tracker.mark_failed_batches(report["write_report"]["failed_batches"])
+    return tracker
+
+def graph_size(store):
+    return len(store.endpoint.dataset.graph(URIRef(GRAPH)))
+
+def test_resumed_run_records_provenance_of_every_page(store):
+    revision_1 = ["Savepoint duration", "Delta merge", "Memory sizing"]
+    # Run 1 dies after writing two of three pages, before the revision is stored
+    tracker = RevisionTracker(store.path)
+    pages = tracker.changed_pages(pages_of(revision_1))
+    ingest(store, tracker, [next(pages), next(pages)])
+    tracker.close()
+    assert graph_size(store) == 4
+
+    # Run 2 resumes in a new process; without a stored revision every page is extracted and recorded again
+    tracker = RevisionTracker(store.path)
+    ingest(store, tracker, tracker.changed_pages(pages_of(revision_1)))
+    report = tracker.finish(store.writer)
+    assert report["changed_pages"] == 3 and report["triples_recorded"] == 6
+
+    # Revision 2 drops the two pages that run 1 had already written
+    ingest(store, tracker, tracker.changed_pages(pages_of(["Memory sizing"], "2927209_E_20250327.pdf")))
+    report = tracker.finish(store.writer)
+    assert report["removed_pages"] == 2
+    assert report["triples_retracted"] == 4
+    assert graph_size(store) == 2
+    tracker.close()
+
+def test_duplicate_chunks_keep_the_provenance_of_their_page(store):
+    disclaimer = "Common disclaimer: this note is provided as is without warranty of any kind worldwide"
+    tracker = RevisionTracker(store.path)
+    dedup = ChunkDeduplicator(threshold=0.9, shingle_size=3)
+    chunks = dedup.filter(tracker.changed_pages(pages_of([disclaimer, "Savepoint duration", disclaimer + "."])))
+    ingest(store, tracker, chunks)
+    assert dedup.report["exact_duplicates"] == 1
+    tracker.record_duplicates(dedup.duplicates)
+    tracker.finish(store.writer)
+    assert graph_size(store) == 15
+
+    # Revision 2 drops page 0; page 2 still contains the disclaimer and is unchanged
+    dedup = ChunkDeduplicator(threshold=0.9, shingle_size=3)
+    revision_2 = pages_of(["Savepoint duration", disclaimer + "."], "2927209_E_20250327.pdf")
+    ingest(store, tracker, dedup.filter(tracker.changed_pages(revision_2)))
+    tracker.record_duplicates(dedup.duplicates)
+    report = tracker.finish(store.writer)
+    assert report["unchanged_pages"] == 2 and report["removed_pages"] == 1
+    assert report["triples_retracted"] == 0
+    assert graph_size(store) == 15
+    tracker.close()
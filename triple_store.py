@@ -0,0 +1,171 @@
+# Dictionary-encoded, compact in-memory triple buffer
+# Replaces the rdflib Graph accumulator and the rdf_triples/triples list copies of the extraction scenarios.
+# Every URI and literal is interned once and gets an integer id, triples are kept as three integer id columns
+# (array-backed, viewable as NumPy arrays) and duplicates are rejected through a set of packed id keys.
+# Triples can be serialized straight into N-Triples batches for ingestion.
+#please make sure you install the following packages
+#!pip install rdflib numpy
+from array import array
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+from rdflib import Literal, URIRef
+
+# Bits reserved per id in the packed deduplication key
+_ID_BITS = 32
+
+# Escapes required inside an N-Triples string literal (ECHAR); other control characters use \u escapes
+NTRIPLES_LITERAL_ESCAPES = str.maketrans({
+    **{chr(c): f"\\u{c:04X}" for c in range(0x20)},
+    "\\": "\\\\", '"': '\\"', "\n": "\\n", "\r": "\\r", "\t": "\\t", "\b": "\\b", "\f": "\\f",
+})
+
+def to_ntriples_term(term) -> str:
+    """Return the N-Triples form of an rdflib term (plain strings are treated as URIs)"""
+    if isinstance(term, Literal):
+        # Always a single-line quoted string, never a Turtle long string
+        text = f'"{str(term).translate(NTRIPLES_LITERAL_ESCAPES)}"'
+        if term.language:
+            return f"{text}@{term.language}"
+        if term.datatype:
+            return f"{text}^^<{term.datatype}>"
+        return text
+    try:
+        return URIRef(term).n3()
+    except Exception:
+        # rdflib refuses to serialize URIs with illegal characters; keep the raw form
+        return f"<{term}>"
+
+class CompactTripleBuffer:
+    """Append-only set of triples stored as interned term ids"""
+
+    def __init__(self):
+        self.terms: List = []                # Term objects by id (URIRef or Literal)
+        self._term_ids: Dict = {}            # Term -> id
+        self._ntriples: List[str] = []       # N-Triples form of each term, computed once
+        self.subjects = array("l")           # Subject id column
+        self.predicates = array("l")         # Predicate id column
+        self.objects = array("l")            # Object id column
+        self._keys = set()                   # Packed (s, p, o) ids of stored triples
+
+    def intern(self, term) -> int:
+        """Return the id of a term, assigning a new id on first use"""
+        # Literals and URIs with the same text must stay distinct
+        key = (term.__class__ is Literal, term)
+        term_id = self._term_ids.get(key)
+        if term_id is None:
+            term_id = len(self.terms)
+            self._term_ids[key] = term_id
+            self.terms.append(term)
+            self._ntriples.append(to_ntriples_term(term))
+        return term_id
+
+    def add(self, triple: Tuple) -> bool:
+        """Add a (subject, predicate, object) triple; return False if it was already present"""
+        s, p, o = self.intern(triple[0]), self.intern(triple[1]), self.intern(triple[2])
+        key = (((s << _ID_BITS) | p) << _ID_BITS) | o
+        if key in self._keys:
+            return False
+        self._keys.add(key)
+        self.subjects.append(s)
+        self.predicates.append(p)
+        self.objects.append(o)
+        return True
+
+    def __contains__(self, triple: Tuple) -> bool:
+        ids = []
+        for term in triple:
+            term_id = self._term_ids.get((term.__class__ is Literal, term))
+            if term_id is None:
+                return False
+            ids.append(term_id)
+        return (((ids[0] << _ID_BITS) | ids[1]) << _ID_BITS) | ids[2] in self._keys
+
+    def __len__(self) -> int:
+        return len(self.subjects)
+
+    def __iter__(self) -> Iterator[Tuple]:
+        """Iterate over the triples as rdflib term tuples, in insertion order"""
+        terms = self.terms
+        for s, p, o in zip(self.subjects, self.predicates, self.objects):
+            yield terms[s], terms[p], terms[o]
+
+    def iter_strings(self) -> Iterator[Tuple[str, str, str]]:
+        """Iterate over the triples as (subject, predicate, object) strings"""
+        for s, p, o in self:
+            yield str(s), str(p), str(o)
+
+    def columns(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return zero-copy NumPy views of the subject, predicate and object id columns"""
+        return tuple(np.frombuffer(column, dtype=np.dtype(column.typecode)) if len(column)
+                     else np.empty(0, dtype=np.dtype(column.typecode))
+                     for column in (self.subjects, self.predicates, self.objects))
+
+    def iter_ntriples(self, start: int = 0) -> Iterator[str]:
+        """Yield N-Triples statements, starting at the given triple position"""
+        nt = self._ntriples
+        subjects, predicates, objects = self.subjects, self.predicates, self.objects
+        for i in range(start, len(subjects)):
+            yield f"{nt[subjects[i]]} {nt[predicates[i]]} {nt[objects[i]]} ."
+
+    def iter_ntriples_batches(self, batch_size: int = 5000) -> Iterator[List[str]]:
+        """Yield N-Triples statements in lists of at most batch_size lines"""
+        batch = []
+        for line in self.iter_ntriples():
+            batch.append(line)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def __repr__(self) -> str:
+        return f"<CompactTripleBuffer: {len(self)} triples, {len(self.terms)} terms>"
+
+# Compare memory and construction time with the rdflib Graph plus list copies used by the scenarios
+if __name__ == "__main__":
+    import time
+    import tracemalloc
+
+    from rdflib import Graph, Namespace
+    from rdflib.namespace import RDF
+
+    EX = Namespace("http://new_test_mission_faqhanahotspots.org/")
+    entities = [EX[f"Entity_{i}"] for i in range(20000)]
+    relations = [EX[f"RELATION_{i}"] for i in range(50)]
+
+    def sample():
+        for i in range(200000):
+            if i % 4 == 0:
+                yield entities[i % 20000], RDF.type, EX[f"Type_{i % 30}"]
+            elif i % 4 == 1:
+                yield entities[i % 20000], EX["description"], Literal(f"Description of entity {i % 20000}")
+            else:
+                yield entities[i % 20000], relations[i % 50], entities[(i * 7) % 20000]
+
+    def measure(build):
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = build()
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return result, elapsed, peak
+
+    def build_graph():
+        g = Graph()
+        for triple in sample():
+            g.add(triple)
+        rdf_triples = [(str(s), str(p), str(o)) for s, p, o in g]
+        return [f"<{s}> <{p}> <{o}>" for s, p, o in rdf_triples]
+
+    def build_buffer():
+        buffer = CompactTripleBuffer()
+        for triple in sample():
+            buffer.add(triple)
+        return buffer
+
+    graph_lines, graph_time, graph_peak = measure(build_graph)
+    buffer, buffer_time, buffer_peak = measure(build_buffer)
+    print(f"rdflib Graph + lists: {len(graph_lines)} triples, {graph_time:.2f}s, peak {graph_peak / 2**20:.1f} MB")
+    print(f"CompactTripleBuffer:  {len(buffer)} triples, {buffer_time:.2f}s, peak {buffer_peak / 2**20:.1f} MB")